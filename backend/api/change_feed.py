@@ -0,0 +1,154 @@
+# change_feed.py - Flux des modifications pour la synchronisation incrémentale
+"""
+Journal des modifications (change_log) alimenté par des triggers PostgreSQL.
+
+Chaque INSERT / UPDATE / DELETE sur les tables métier ajoute une ligne avec un
+numéro de séquence croissant (seq) et l'identifiant de la transaction qui l'a
+écrite (xact_id). Les clients (dashboard) mémorisent la dernière position vue
+et ne récupèrent ensuite que les lignes modifiées depuis, plus les IDs
+supprimés (tombstones).
+
+Position = plus grand xact_id inférieur au xmin du snapshot courant: toutes les
+transactions en dessous sont terminées. Un MAX(seq) ne suffit pas: les
+transactions ne sont pas validées dans l'ordre des seq, et une ligne de seq
+plus petit validée après la lecture du client serait perdue.
+
+Les triggers capturent toutes les écritures, y compris celles faites hors API.
+"""
+
+import os
+from typing import Dict, Any, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import models, schemas
+
+# Rétention du journal et nombre max de lignes renvoyées avant de demander un rechargement complet
+RETENTION_DAYS = int(os.environ.get("CHANGE_LOG_RETENTION_DAYS", "7"))
+MAX_CHANGES = int(os.environ.get("CHANGE_FEED_MAX_ROWS", "5000"))
+
+# Nom de route → (modèle, schéma, table SQL, clé primaire)
+FEED_TABLES = {
+    "events": (models.Event, schemas.Event, "event", "event_id"),
+    "persons": (models.Person, schemas.Person, "person", "person_id"),
+    "units": (models.OrganizationalUnit, schemas.OrganizationalUnit, "organizational_unit", "unit_id"),
+    "measures": (models.CorrectiveMeasure, schemas.CorrectiveMeasure, "corrective_measure", "measure_id"),
+    "risks": (models.Risk, schemas.Risk, "risk", "risk_id"),
+}
+
+CHANGE_LOG_DDL = """
+CREATE TABLE IF NOT EXISTS change_log (
+    seq BIGSERIAL PRIMARY KEY,
+    table_name VARCHAR(50) NOT NULL,
+    row_id INTEGER NOT NULL,
+    op CHAR(1) NOT NULL,
+    changed_at TIMESTAMP NOT NULL DEFAULT now()
+);
+ALTER TABLE change_log ADD COLUMN IF NOT EXISTS xact_id BIGINT NOT NULL DEFAULT pg_current_xact_id()::text::bigint;
+DROP INDEX IF EXISTS idx_change_log_table_seq;
+CREATE INDEX IF NOT EXISTS idx_change_log_xact ON change_log (xact_id);
+CREATE INDEX IF NOT EXISTS idx_change_log_table_xact ON change_log (table_name, xact_id);
+
+CREATE OR REPLACE FUNCTION log_row_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO change_log (table_name, row_id, op)
+        VALUES (TG_TABLE_NAME, (to_jsonb(OLD) ->> TG_ARGV[0])::integer, 'D');
+        RETURN OLD;
+    END IF;
+    INSERT INTO change_log (table_name, row_id, op)
+    VALUES (TG_TABLE_NAME, (to_jsonb(NEW) ->> TG_ARGV[0])::integer, 'U');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+TRIGGER_DDL = """
+DROP TRIGGER IF EXISTS trg_{table}_change_log ON {table};
+CREATE TRIGGER trg_{table}_change_log
+    AFTER INSERT OR UPDATE OR DELETE ON {table}
+    FOR EACH ROW EXECUTE FUNCTION log_row_change('{pk}');
+"""
+
+# Purge: une ligne repère (op 'P') garde le plus grand xact_id supprimé, pour
+# savoir si un client a pu manquer des entrées purgées
+PURGE_SQL = """
+WITH purged AS (
+    DELETE FROM change_log WHERE changed_at < now() - make_interval(days => :days) RETURNING xact_id
+)
+INSERT INTO change_log (table_name, row_id, op, xact_id)
+SELECT '*', 0, 'P', MAX(xact_id) FROM purged HAVING count(*) > 0
+"""
+
+# Position validée: toutes les transactions d'xact_id inférieur au xmin sont terminées
+WATERMARK_SQL = """
+SELECT COALESCE(MAX(xact_id), 0) FROM change_log
+WHERE xact_id < pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+"""
+
+
+def install_change_log(engine):
+    """Crée la table change_log, les triggers (idempotent) et purge les entrées expirées."""
+    with engine.begin() as conn:
+        conn.execute(text(CHANGE_LOG_DDL))
+        for _, _, table, pk in FEED_TABLES.values():
+            conn.execute(text(TRIGGER_DDL.format(table=table, pk=pk)))
+        conn.execute(text(PURGE_SQL), {"days": RETENTION_DAYS})
+
+
+def last_sequence(db: Session) -> int:
+    """Position validée du journal (0 si vide): aucune entrée en dessous ne peut encore apparaître."""
+    return db.execute(text(WATERMARK_SQL)).scalar()
+
+
+def current_sequence(db: Session) -> Optional[int]:
+    """Comme last_sequence, mais None si le journal n'existe pas (caches invalidés par le journal)."""
+    try:
+        with db.begin_nested():
+            return last_sequence(db)
+    except Exception:
+        return None
+
+
+def read_changes(db: Session, table: str, since: int) -> Dict[str, Any]:
+    """
+    Lignes modifiées et IDs supprimés d'une table depuis `since`.
+
+    Returns:
+        dict avec 'last_seq', 'upserts' (lignes actuelles), 'deletes' (IDs) et
+        'reset' (True si le client doit tout recharger: journal purgé ou trop de changements)
+    """
+    model, schema, table_name, pk = FEED_TABLES[table]
+    last_seq = last_sequence(db)
+    feed = {"table": table, "since": since, "last_seq": last_seq, "reset": False, "upserts": [], "deletes": []}
+
+    # Entrées postérieures à `since` déjà purgées: impossible de garantir la complétude
+    purged_upto = db.execute(text("SELECT MAX(xact_id) FROM change_log WHERE table_name = '*'")).scalar()
+    if since > 0 and purged_upto is not None and since < purged_upto:
+        feed["reset"] = True
+        return feed
+
+    # Dernière opération par ligne modifiée depuis `since`
+    rows = db.execute(text("""
+        SELECT DISTINCT ON (row_id) row_id, op
+        FROM change_log
+        WHERE table_name = :table AND xact_id > :since AND xact_id <= :last_seq
+        ORDER BY row_id, seq DESC
+    """), {"table": table_name, "since": since, "last_seq": last_seq}).fetchall()
+
+    if len(rows) > MAX_CHANGES:
+        feed["reset"] = True
+        return feed
+
+    upsert_ids = [row_id for row_id, op in rows if op == 'U']
+    deleted_ids = {row_id for row_id, op in rows if op == 'D'}
+
+    if upsert_ids:
+        current = db.query(model).filter(getattr(model, pk).in_(upsert_ids)).all()
+        feed["upserts"] = [schema.model_validate(obj).model_dump(mode="json") for obj in current]
+        # Ligne modifiée puis supprimée entre-temps
+        deleted_ids |= set(upsert_ids) - {getattr(obj, pk) for obj in current}
+
+    feed["deletes"] = sorted(deleted_ids)
+    return feed
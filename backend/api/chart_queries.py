@@ -0,0 +1,259 @@
+# chart_queries.py - Requêtes d'agrégation du créateur de graphiques
+"""
+Le créateur de graphiques envoie une spécification (dimensions, mesures,
+filtres, tri, top-N) au lieu de charger toute la table: elle est compilée en
+SQL paramétré sur un catalogue de colonnes connu, et seul le résultat agrégé
+est renvoyé.
+
+Sécurité: les expressions de colonnes et les agrégations viennent exclusivement
+du catalogue CHART_SOURCES / AGGREGATIONS (jamais du client); les alias de
+mesures choisis par le client doivent être des identifiants simples
+(ALIAS_PATTERN); les valeurs des filtres sont passées en paramètres liés.
+
+Les métadonnées des colonnes (type, nombre de valeurs distinctes) sont mises en
+cache et recalculées quand le journal des modifications avance.
+"""
+
+import os
+import re
+import time
+import threading
+from typing import Dict, Any, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from change_feed import current_sequence
+
+# Lignes max renvoyées (graphiques sans agrégation) et durée du cache sans journal
+MAX_ROWS = int(os.environ.get("CHART_MAX_ROWS", "50000"))
+METADATA_CACHE_SECONDS = int(os.environ.get("CHART_METADATA_CACHE_SECONDS", "300"))
+
+# Alias de mesure autorisé: identifiant SQL simple (63 caractères max, limite de PostgreSQL)
+ALIAS_PATTERN = re.compile(r"^[A-Za-z_]\w{0,62}$", re.ASCII)
+
+
+def _weekday(expr: str) -> str:
+    # Nom anglais du jour (comme pandas .dt.day_name()), indépendant de lc_time
+    return f"(ARRAY['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday'])[extract(isodow FROM {expr}::timestamp)::int]"
+
+
+# Source → FROM (avec jointures) et colonnes exposées: nom → (expression SQL, nature)
+# Nature: numeric, date, category (texte court) ou text (texte libre)
+CHART_SOURCES = {
+    "events": {
+        "from": """event e
+            LEFT JOIN organizational_unit u ON u.unit_id = e.organizational_unit_id
+            LEFT JOIN person p ON p.person_id = e.declared_by_id""",
+        "columns": {
+            "event_id": ("e.event_id", "numeric"),
+            "declared_by_id": ("e.declared_by_id", "numeric"),
+            "description": ("e.description", "text"),
+            "start_datetime": ("e.start_datetime::timestamp", "date"),
+            "end_datetime": ("e.end_datetime::timestamp", "date"),
+            "organizational_unit_id": ("e.organizational_unit_id", "numeric"),
+            "type": ("e.type", "category"),
+            "classification": ("e.classification", "category"),
+            "unit_name": ("u.name", "category"),
+            "declared_by_name": ("trim(concat(p.name, ' ', p.family_name))", "category"),
+            "start_weekday": (_weekday("e.start_datetime"), "category"),
+            "end_weekday": (_weekday("e.end_datetime"), "category"),
+        },
+    },
+    "persons": {
+        "from": "person p",
+        "columns": {
+            "person_id": ("p.person_id", "numeric"),
+            "matricule": ("p.matricule", "category"),
+            "name": ("p.name", "category"),
+            "family_name": ("p.family_name", "category"),
+            "role": ("p.role", "category"),
+        },
+    },
+    "units": {
+        "from": "organizational_unit u",
+        "columns": {
+            "unit_id": ("u.unit_id", "numeric"),
+            "identifier": ("u.identifier", "category"),
+            "name": ("u.name", "category"),
+            "location": ("u.location", "category"),
+        },
+    },
+    "measures": {
+        "from": """corrective_measure m
+            LEFT JOIN organizational_unit u ON u.unit_id = m.organizational_unit_id
+            LEFT JOIN person p ON p.person_id = m.owner_id""",
+        "columns": {
+            "measure_id": ("m.measure_id", "numeric"),
+            "name": ("m.name", "category"),
+            "description": ("m.description", "text"),
+            "owner_id": ("m.owner_id", "numeric"),
+            "implementation_date": ("m.implementation_date::timestamp", "date"),
+            "cost": ("m.cost", "numeric"),
+            "organizational_unit_id": ("m.organizational_unit_id", "numeric"),
+            "unit_name": ("u.name", "category"),
+            "owner_name": ("trim(concat(p.name, ' ', p.family_name))", "category"),
+        },
+    },
+    "risks": {
+        "from": "risk r",
+        "columns": {
+            "risk_id": ("r.risk_id", "numeric"),
+            "name": ("r.name", "category"),
+            "gravity": ("r.gravity", "category"),
+            "probability": ("r.probability", "category"),
+        },
+    },
+}
+
+AGGREGATIONS = {
+    "sum": "sum({})",
+    "avg": "avg({})",
+    "count": "count(*)",
+    "min": "min({})",
+    "max": "max({})",
+}
+
+FILTER_OPERATORS = {
+    "eq": "{} = :{}",
+    "ne": "{} <> :{}",
+    "gte": "{} >= :{}",
+    "lte": "{} <= :{}",
+    "in": "{} = ANY(:{})",
+}
+
+# Source → (date, séquence du journal, métadonnées)
+_metadata_cache: Dict[str, Tuple[float, Any, Dict[str, Any]]] = {}
+_metadata_lock = threading.Lock()
+
+
+def _column(source: str, name: str) -> Tuple[str, str]:
+    """Expression SQL et nature d'une colonne du catalogue (ValueError si inconnue)."""
+    columns = CHART_SOURCES[source]["columns"]
+    if name not in columns:
+        raise ValueError(f"Colonne inconnue pour {source}: {name}")
+    return columns[name]
+
+
+def read_columns(db: Session, source: str) -> Dict[str, Any]:
+    """
+    Colonnes d'une source avec leur nature et leur nombre de valeurs distinctes.
+
+    Returns:
+        dict avec 'source', 'row_count' et 'columns' ([{name, kind, distinct}])
+    """
+    seq = current_sequence(db)
+    with _metadata_lock:
+        entry = _metadata_cache.get(source)
+        if entry is not None:
+            created_at, cached_seq, metadata = entry
+            fresh = cached_seq == seq if seq is not None else time.time() - created_at < METADATA_CACHE_SECONDS
+            if fresh:
+                return metadata
+
+    config = CHART_SOURCES[source]
+    # Un seul parcours de la table pour toutes les cardinalités
+    names = list(config["columns"])
+    # (pas de comptage pour le texte libre: coûteux et jamais utilisé comme catégorie)
+    counts = ", ".join(f"count(DISTINCT {expr})" if kind != "text" else "NULL"
+                       for expr, kind in config["columns"].values())
+    row = db.execute(text(f"SELECT count(*), {counts} FROM {config['from']}")).fetchone()
+
+    metadata = {
+        "source": source,
+        "row_count": row[0],
+        "columns": [
+            {"name": name, "kind": config["columns"][name][1], "distinct": distinct}
+            for name, distinct in zip(names, row[1:])
+        ],
+    }
+    with _metadata_lock:
+        _metadata_cache[source] = (time.time(), seq, metadata)
+    return metadata
+
+
+def compile_query(spec: Dict[str, Any]) -> Tuple[str, Dict[str, Any], List[str]]:
+    """
+    Compile une spécification en SQL paramétré.
+
+    Spécification:
+        source: table du catalogue
+        dimensions: colonnes de regroupement (ou colonnes brutes sans mesure)
+        measures: [{column, aggregation, alias}] (vide = lignes brutes)
+        filters: [{column, op, value}]; not_null: colonnes exclues si NULL
+        order_by: nom d'une dimension ou d'un alias de mesure; descending
+        limit: top-N (borné à MAX_ROWS); sample: lignes tirées au hasard
+
+    Returns:
+        (requête SQL, paramètres, noms des colonnes du résultat)
+    """
+    source = spec["source"]
+    if source not in CHART_SOURCES:
+        raise ValueError(f"Source inconnue: {source}")
+
+    select, group_by, names = [], [], []
+    for name in spec.get("dimensions", []):
+        expr, _ = _column(source, name)
+        select.append(f'{expr} AS "{name}"')
+        group_by.append(expr)
+        names.append(name)
+
+    measures = spec.get("measures", [])
+    for measure in measures:
+        aggregation = measure["aggregation"]
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Agrégation inconnue: {aggregation}")
+        expr = _column(source, measure["column"])[0] if measure.get("column") else "*"
+        if aggregation != "count" and expr == "*":
+            raise ValueError(f"L'agrégation {aggregation} nécessite une colonne")
+        alias = measure.get("alias") or measure.get("column") or "count"
+        if not ALIAS_PATTERN.fullmatch(alias):
+            raise ValueError(f"Alias de mesure invalide: {alias!r}")
+        if alias in names:
+            raise ValueError(f"Nom de colonne en double: {alias}")
+        select.append(f'{AGGREGATIONS[aggregation].format(expr)} AS "{alias}"')
+        names.append(alias)
+    if not select:
+        raise ValueError("La requête doit contenir au moins une dimension ou une mesure")
+
+    conditions, params = [], {}
+    for name in spec.get("not_null", []):
+        conditions.append(f"{_column(source, name)[0]} IS NOT NULL")
+    for i, condition in enumerate(spec.get("filters", [])):
+        if condition["op"] not in FILTER_OPERATORS:
+            raise ValueError(f"Opérateur inconnu: {condition['op']}")
+        expr = _column(source, condition["column"])[0]
+        conditions.append(FILTER_OPERATORS[condition["op"]].format(expr, f"f{i}"))
+        params[f"f{i}"] = condition["value"]
+
+    sql = f"SELECT {', '.join(select)} FROM {CHART_SOURCES[source]['from']}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if measures and group_by:
+        sql += " GROUP BY " + ", ".join(group_by)
+
+    order_by = spec.get("order_by")
+    if spec.get("sample"):
+        sql += " ORDER BY random()"
+    elif order_by:
+        if order_by not in names:
+            raise ValueError(f"Tri sur une colonne absente du résultat: {order_by}")
+        sql += f' ORDER BY "{order_by}" {"DESC" if spec.get("descending") else "ASC"} NULLS LAST'
+
+    # Une ligne de plus pour savoir si le résultat a été tronqué
+    limit = max(1, min(spec.get("limit") or MAX_ROWS, MAX_ROWS))
+    sql += " LIMIT :limit"
+    params["limit"] = limit + 1
+    return sql, params, names
+
+
+def run_query(db: Session, spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Exécute une spécification et renvoie le résultat agrégé."""
+    sql, params, names = compile_query(spec)
+    rows = db.execute(text(sql), params).fetchall()
+    limit = params["limit"] - 1
+    return {
+        "columns": names,
+        "rows": [list(row) for row in rows[:limit]],
+        "truncated": len(rows) > limit,
+    }
@@ -1,8 +1,11 @@
 # database.py - Configuration pour l'API
 import os
-from sqlalchemy import create_engine
+import time
+import threading
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 # Récupération des variables d'environnement
 dbname = os.environ.get("POSTGRES_DB", "madb")
@@ -11,13 +14,118 @@ password = os.environ.get("POSTGRES_PASSWORD", "monpassword")
 host = os.environ.get("POSTGRES_HOST", "db")
 port = os.environ.get("POSTGRES_PORT", "5432")
 
+# Réplica en lecture (optionnel): lectures du dashboard, GET de l'API et SQL du chatbot
+replica_host = os.environ.get("POSTGRES_REPLICA_HOST", "")
+replica_port = os.environ.get("POSTGRES_REPLICA_PORT", "5432")
+# Au-delà de ce retard (secondes), les lectures repassent sur le primaire
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("POSTGRES_REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_CHECK_SECONDS = float(os.environ.get("POSTGRES_REPLICA_CHECK_SECONDS", "1"))
+# Réplica inaccessible: nouvel essai après ce délai
+REPLICA_RETRY_SECONDS = 30
+
+# Pool de connexions: un pool par processus (api, chatbot, chat_api, streamlit...)
+POOL_SIZE = int(os.environ.get("POSTGRES_POOL_SIZE", "5"))  # 0 = pas de pool côté client (NullPool)
+MAX_OVERFLOW = int(os.environ.get("POSTGRES_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.environ.get("POSTGRES_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.environ.get("POSTGRES_POOL_RECYCLE", "1800"))  # -1 = jamais
+POOL_PRE_PING = os.environ.get("POSTGRES_POOL_PRE_PING", "true").lower() == "true"
+APPLICATION_NAME = os.environ.get("POSTGRES_APPLICATION_NAME", "")
+# "transaction" derrière PgBouncer en mode transaction: aucun état de session entre
+# deux transactions (pas de PREPARE SQL, voir prepared_statements.py du chatbot)
+POOLER = os.environ.get("POSTGRES_POOLER", "").lower()
+TRANSACTION_POOLING = POOLER == "transaction"
+
 # Construction de l'URL PostgreSQL
 SQLALCHEMY_DATABASE_URL = f"postgresql://{user}:{password}@{host}:{port}/{dbname}"
+REPLICA_DATABASE_URL = f"postgresql://{user}:{password}@{replica_host}:{replica_port}/{dbname}" if replica_host else None
+
+
+def engine_options() -> dict:
+    """Options create_engine du pool, depuis les variables d'environnement."""
+    options = {"connect_args": {"application_name": APPLICATION_NAME}} if APPLICATION_NAME else {}
+    if POOL_SIZE <= 0:
+        # Chaque session ouvre/ferme sa connexion (le pooler mutualise côté serveur)
+        return {**options, "poolclass": NullPool}
+    return {**options, "pool_size": POOL_SIZE, "max_overflow": MAX_OVERFLOW, "pool_timeout": POOL_TIMEOUT,
+            "pool_recycle": POOL_RECYCLE, "pool_pre_ping": POOL_PRE_PING}
 
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     # connect_args={"check_same_thread": False}  # Nécessaire pour SQLite a enlever pour PostgreSQL
+    **engine_options()
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+replica_engine = create_engine(REPLICA_DATABASE_URL, **engine_options()) if REPLICA_DATABASE_URL else None
+
+REPLICA_STATUS_SQL = """
+SELECT pg_is_in_recovery(),
+       pg_last_wal_replay_lsn()::text,
+       CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END
+"""
+
+
+def parse_lsn(lsn: str) -> int:
+    """'16/B374D848' → position WAL comparable."""
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class ReplicaMonitor:
+    """
+    Choisit l'engine des lectures: le réplica s'il répond, est en retard de moins de
+    REPLICA_MAX_LAG_SECONDS et a rejoué l'écriture `min_lsn` du client; sinon le primaire.
+    """
+
+    def __init__(self, primary, replica):
+        self.primary = primary
+        self.replica = replica
+        self._status = None
+        self._checked_at = 0.0
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+
+    def status(self, force: bool = False):
+        """{'lag': secondes, 'replay_lsn': int} relu au plus toutes les REPLICA_CHECK_SECONDS (None = indisponible)."""
+        now = time.time()
+        if now < self._down_until:
+            return None
+        if not force and now - self._checked_at < REPLICA_CHECK_SECONDS:
+            return self._status
+        with self._lock:
+            try:
+                with self.replica.connect() as conn:
+                    in_recovery, replay_lsn, lag = conn.execute(text(REPLICA_STATUS_SQL)).one()
+                if not in_recovery:
+                    # Serveur promu ou mal configuré: rien ne garantit qu'il suive le primaire
+                    raise RuntimeError("le serveur n'est pas un réplica (pg_is_in_recovery() = false)")
+                self._status = {'lag': float(lag), 'replay_lsn': parse_lsn(replay_lsn) if replay_lsn else 0}
+            except Exception as e:
+                print(f"⚠️ Réplica indisponible, lectures sur le primaire: {str(e)}")
+                self._status = None
+                self._down_until = now + REPLICA_RETRY_SECONDS
+            self._checked_at = now
+            return self._status
+
+    def read_engine(self, min_lsn: str = None):
+        if self.replica is None:
+            return self.primary
+        status = self.status()
+        if status is None or status['lag'] > REPLICA_MAX_LAG_SECONDS:
+            return self.primary
+        if min_lsn:
+            try:
+                required = parse_lsn(min_lsn)
+            except ValueError:
+                return self.primary
+            if status['replay_lsn'] < required:
+                status = self.status(force=True)
+                if status is None or status['replay_lsn'] < required:
+                    return self.primary
+        return self.replica
+
+
+replica_monitor = ReplicaMonitor(engine, replica_engine)
\ No newline at end of file
@@ -0,0 +1,86 @@
+# event_pages.py - Pages d'événements prêtes à afficher
+"""
+Page d'événements triée, filtrée et enrichie côté base de données.
+
+La page "Événements récents" du dashboard ne demande que les N événements
+affichés (tri par date décroissante, filtre par type), avec le nom de l'unité
+et du déclarant déjà joints: le coût d'un changement de page ne dépend plus de
+la taille de la table.
+"""
+
+import os
+from typing import Optional, Dict, Any
+
+from sqlalchemy import text, func
+from sqlalchemy.orm import Session
+
+import models
+
+# Taille max d'une page (protège l'API d'une requête trop large)
+MAX_PAGE_SIZE = int(os.environ.get("EVENT_PAGE_MAX_SIZE", "100"))
+
+# Index utilisés par le tri (date décroissante, NULLS LAST comme la requête) et le filtre par type.
+# Les premiers index (NULLS FIRST par défaut) ne servaient pas au tri: ils sont remplacés.
+EVENT_PAGE_INDEXES_DDL = """
+DROP INDEX IF EXISTS idx_event_start_datetime;
+DROP INDEX IF EXISTS idx_event_type_start_datetime;
+CREATE INDEX IF NOT EXISTS idx_event_start_datetime_nl ON event (start_datetime DESC NULLS LAST, event_id DESC);
+CREATE INDEX IF NOT EXISTS idx_event_type_start_datetime_nl ON event (type, start_datetime DESC NULLS LAST, event_id DESC);
+"""
+
+
+def install_event_page_indexes(engine):
+    """Crée les index de pagination des événements (idempotent)."""
+    with engine.begin() as conn:
+        conn.execute(text(EVENT_PAGE_INDEXES_DDL))
+
+
+def read_event_page(db: Session, page: int, size: int, event_type: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Une page d'événements, du plus récent au plus ancien.
+
+    Args:
+        page: Numéro de page (0 = la plus récente)
+        size: Nombre d'événements par page (borné à MAX_PAGE_SIZE)
+        event_type: Filtre optionnel sur le type
+
+    Returns:
+        dict avec 'total', 'page', 'size' et 'items' (événements + unit_name, declared_by_name)
+    """
+    size = max(1, min(size, MAX_PAGE_SIZE))
+    page = max(0, page)
+
+    events = db.query(models.Event)
+    if event_type:
+        events = events.filter(models.Event.type == event_type)
+    total = events.with_entities(func.count(models.Event.event_id)).scalar()
+
+    # Page demandée au-delà de la fin (ex. après un changement de filtre): dernière page
+    last_page = max(0, (total - 1) // size)
+    page = min(page, last_page)
+
+    declared_by_name = func.nullif(
+        func.trim(func.concat(models.Person.name, " ", models.Person.family_name)), ""
+    )
+    rows = (
+        events
+        .outerjoin(models.OrganizationalUnit,
+                   models.OrganizationalUnit.unit_id == models.Event.organizational_unit_id)
+        .outerjoin(models.Person, models.Person.person_id == models.Event.declared_by_id)
+        .with_entities(models.Event,
+                       models.OrganizationalUnit.name.label("unit_name"),
+                       declared_by_name.label("declared_by_name"))
+        .order_by(models.Event.start_datetime.desc().nulls_last(), models.Event.event_id.desc())
+        .offset(page * size)
+        .limit(size)
+        .all()
+    )
+
+    items = []
+    for event, unit_name, person_name in rows:
+        item = {column.name: getattr(event, column.name) for column in models.Event.__table__.columns}
+        item['unit_name'] = unit_name or "Non spécifié"
+        item['declared_by_name'] = person_name or f"Person {event.declared_by_id}"
+        items.append(item)
+
+    return {"total": total, "page": page, "size": size, "items": items}
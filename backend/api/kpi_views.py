@@ -0,0 +1,239 @@
+# kpi_views.py - Indicateurs pré-agrégés du dashboard
+"""
+Vues matérialisées PostgreSQL pour les KPI et graphiques du dashboard.
+
+- kpi_event_rollup: événements par unité, mois, type et classification
+  (toutes les répartitions d'événements se déduisent de cette vue)
+- kpi_measure_cost: nombre de mesures et coût par unité
+- kpi_risk_gravity: nombre de risques par niveau de gravité
+
+Les endpoints /kpi/* lisent ces vues: le coût d'une requête dépend du nombre
+de groupes et non plus du nombre de lignes.
+
+Politique de rafraîchissement (thread de fond, REFRESH ... CONCURRENTLY pour ne
+pas bloquer les lectures): dès que KPI_REFRESH_AFTER_WRITES écritures ont été
+journalisées dans change_log, ou toutes les KPI_REFRESH_SECONDS s'il y a eu au
+moins une écriture. Sans journal des modifications: rafraîchissement périodique.
+Un premier rafraîchissement a lieu au démarrage: les écritures faites pendant
+que l'API était arrêtée ne seraient sinon jamais prises en compte.
+"""
+
+import os
+import time
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from change_feed import WATERMARK_SQL
+
+# Rafraîchissement après N écritures, ou après un délai s'il y a eu des écritures
+REFRESH_AFTER_WRITES = int(os.environ.get("KPI_REFRESH_AFTER_WRITES", "50"))
+REFRESH_SECONDS = int(os.environ.get("KPI_REFRESH_SECONDS", "60"))
+# Fréquence de vérification du thread de fond
+CHECK_SECONDS = int(os.environ.get("KPI_CHECK_SECONDS", "5"))
+
+KPI_VIEWS_DDL = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS kpi_event_rollup AS
+SELECT e.organizational_unit_id AS unit_id,
+       u.name AS unit_name,
+       date_trunc('month', e.start_datetime::timestamp)::date AS month,
+       e.type,
+       e.classification,
+       count(*) AS event_count
+FROM event e
+LEFT JOIN organizational_unit u ON u.unit_id = e.organizational_unit_id
+GROUP BY 1, 2, 3, 4, 5;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_kpi_event_rollup
+    ON kpi_event_rollup (unit_id, month, type, classification) NULLS NOT DISTINCT;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS kpi_measure_cost AS
+SELECT m.organizational_unit_id AS unit_id,
+       u.name AS unit_name,
+       count(*) AS measure_count,
+       count(m.cost) AS costed_count,
+       COALESCE(sum(m.cost), 0) AS total_cost
+FROM corrective_measure m
+LEFT JOIN organizational_unit u ON u.unit_id = m.organizational_unit_id
+GROUP BY 1, 2;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_kpi_measure_cost
+    ON kpi_measure_cost (unit_id) NULLS NOT DISTINCT;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS kpi_risk_gravity AS
+SELECT gravity, count(*) AS risk_count
+FROM risk
+GROUP BY 1;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_kpi_risk_gravity
+    ON kpi_risk_gravity (gravity) NULLS NOT DISTINCT;
+"""
+
+KPI_VIEWS = ["kpi_event_rollup", "kpi_measure_cost", "kpi_risk_gravity"]
+
+# Dimension de regroupement des événements → colonnes de kpi_event_rollup
+EVENT_DIMENSIONS = {
+    "unit": "unit_name",
+    "month": "month",
+    "type": "type",
+    "classification": "classification",
+}
+
+
+def install_kpi_views(engine):
+    """Crée les vues matérialisées et leurs index uniques (idempotent)."""
+    with engine.begin() as conn:
+        conn.execute(text(KPI_VIEWS_DDL))
+
+
+# === RAFRAÎCHISSEMENT ===
+class KPIRefresher:
+    """Rafraîchit les vues KPI selon le nombre d'écritures et le temps écoulé."""
+
+    def __init__(self, engine, after_writes: int = REFRESH_AFTER_WRITES,
+                 refresh_seconds: int = REFRESH_SECONDS, check_seconds: int = CHECK_SECONDS):
+        self.engine = engine
+        self.after_writes = after_writes
+        self.refresh_seconds = refresh_seconds
+        self.check_seconds = check_seconds
+        self.refreshed_at: Optional[datetime] = None
+        self.refreshed_seq: Optional[int] = None
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _current_sequence(self) -> Optional[int]:
+        """Position validée du journal des modifications (None s'il n'existe pas)."""
+        try:
+            with self.engine.connect() as conn:
+                return conn.execute(text(WATERMARK_SQL)).scalar()
+        except Exception:
+            return None
+
+    def _pending_writes(self) -> Optional[int]:
+        """Écritures journalisées depuis le dernier rafraîchissement (None sans journal)."""
+        try:
+            with self.engine.connect() as conn:
+                return conn.execute(text(f"""
+                    SELECT count(*) FROM change_log
+                    WHERE table_name <> '*' AND xact_id > :since AND xact_id <= ({WATERMARK_SQL})
+                """), {"since": self.refreshed_seq}).scalar()
+        except Exception:
+            return None
+
+    def is_due(self) -> bool:
+        """Vrai si N écritures ont eu lieu, ou si le délai est écoulé avec au moins une écriture."""
+        elapsed = time.time() - self._last_refresh
+        pending = self._pending_writes() if self.refreshed_seq is not None else None
+        if pending is None:
+            return elapsed >= self.refresh_seconds
+        return pending >= self.after_writes or (pending > 0 and elapsed >= self.refresh_seconds)
+
+    def refresh(self) -> Dict[str, Any]:
+        """REFRESH MATERIALIZED VIEW CONCURRENTLY de toutes les vues KPI."""
+        with self._lock:
+            seq = self._current_sequence()
+            start = time.perf_counter()
+            # CONCURRENTLY est interdit dans une transaction: connexion en autocommit
+            with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                for view in KPI_VIEWS:
+                    conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}"))
+            self._last_refresh = time.time()
+            self.refreshed_seq = seq
+            self.refreshed_at = datetime.now()
+            return {"refreshed_at": self.refreshed_at, "duration_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    def _run(self):
+        # Premier passage: rafraîchissement immédiat (écritures faites pendant l'arrêt de l'API)
+        try:
+            result = self.refresh()
+            print(f"📊 Vues KPI rafraîchies au démarrage en {result['duration_ms']} ms")
+        except Exception as e:
+            print(f"⚠️ Rafraîchissement des vues KPI impossible: {str(e)}")
+            self._last_refresh = time.time()
+        while not self._stop.wait(self.check_seconds):
+            try:
+                if self.is_due():
+                    result = self.refresh()
+                    print(f"📊 Vues KPI rafraîchies en {result['duration_ms']} ms")
+            except Exception as e:
+                print(f"⚠️ Rafraîchissement des vues KPI impossible: {str(e)}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="kpi-refresher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+# === LECTURE ===
+def read_summary(db: Session) -> Dict[str, Any]:
+    """Totaux des cartes KPI (événements, mesures, coût, unités, moyenne mensuelle)."""
+    events = db.execute(text("""
+        SELECT COALESCE(sum(event_count), 0) AS total_events,
+               count(DISTINCT unit_id) AS units_with_events
+        FROM kpi_event_rollup
+    """)).mappings().one()
+    monthly = db.execute(text("""
+        SELECT COALESCE(avg(n), 0) AS monthly_average, COALESCE(max(n), 0) AS monthly_max
+        FROM (SELECT sum(event_count) AS n FROM kpi_event_rollup
+              WHERE month IS NOT NULL GROUP BY month) per_month
+    """)).mappings().one()
+    measures = db.execute(text("""
+        SELECT COALESCE(sum(measure_count), 0) AS total_measures,
+               COALESCE(sum(total_cost), 0) AS total_cost
+        FROM kpi_measure_cost
+    """)).mappings().one()
+    total_units = db.execute(text("SELECT count(*) FROM organizational_unit")).scalar()
+
+    return {
+        "total_events": int(events["total_events"]),
+        "units_with_events": events["units_with_events"],
+        "total_units": total_units,
+        "monthly_average": float(monthly["monthly_average"]),
+        "monthly_max": int(monthly["monthly_max"]),
+        "total_measures": int(measures["total_measures"]),
+        "total_cost": float(measures["total_cost"]),
+    }
+
+
+def read_event_counts(db: Session, dimension: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Nombre d'événements par unité / mois / type / classification (plus grand d'abord, mois dans l'ordre)."""
+    column = EVENT_DIMENSIONS[dimension]
+    order = "label" if dimension == "month" else "count DESC, label"
+    rows = db.execute(
+        text(f"""
+            SELECT {column} AS label, sum(event_count) AS count
+            FROM kpi_event_rollup
+            WHERE {column} IS NOT NULL
+            GROUP BY {column}
+            ORDER BY {order}
+            LIMIT :limit
+        """),
+        {"limit": limit}
+    ).mappings().all()
+    return [{"label": str(row["label"]), "count": int(row["count"])} for row in rows]
+
+
+def read_measure_costs(db: Session) -> List[Dict[str, Any]]:
+    """Nombre de mesures et coût total par unité."""
+    rows = db.execute(text("""
+        SELECT unit_id, unit_name, measure_count, costed_count, total_cost
+        FROM kpi_measure_cost
+        ORDER BY total_cost DESC
+    """)).mappings().all()
+    return [dict(row) for row in rows]
+
+
+def read_risk_gravity(db: Session) -> List[Dict[str, Any]]:
+    """Nombre de risques par niveau de gravité."""
+    rows = db.execute(text("""
+        SELECT gravity AS label, risk_count AS count
+        FROM kpi_risk_gravity
+        WHERE gravity IS NOT NULL
+        ORDER BY gravity
+    """)).mappings().all()
+    return [{"label": str(row["label"]), "count": int(row["count"])} for row in rows]
@@ -0,0 +1,135 @@
+# lookups.py - Données de référence pour les formulaires
+"""
+Listes compactes pour les sélecteurs des formulaires du dashboard:
+
+- paires id → libellé d'une table, avec recherche classée (typeahead par
+  trigrammes, voir search.py) et résolution d'IDs précis (valeur courante
+  d'un formulaire), limitées à quelques dizaines de lignes au lieu de la
+  table entière;
+- valeurs distinctes d'une colonne catégorielle (SELECT DISTINCT, indexé).
+
+Les réponses sont mises en cache et invalidées dès qu'une écriture apparaît
+dans le journal des modifications (change_log); sans journal, elles expirent
+après LOOKUP_CACHE_SECONDS.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from change_feed import current_sequence
+from search import search_table
+
+LOOKUP_CACHE_SECONDS = int(os.environ.get("LOOKUP_CACHE_SECONDS", "300"))
+LOOKUP_CACHE_SIZE = 512
+MAX_LOOKUP_LIMIT = 200
+
+# Table (nom de route) → (table SQL, clé primaire, expression du libellé)
+LOOKUP_TABLES = {
+    "events": ("event", "event_id", "concat(coalesce(type, 'N/A'), ' (', coalesce(classification, 'N/A'), ')')"),
+    "persons": ("person", "person_id", "trim(concat(name, ' ', family_name))"),
+    "units": ("organizational_unit", "unit_id", "coalesce(name, 'N/A')"),
+    "measures": ("corrective_measure", "measure_id", "coalesce(name, 'N/A')"),
+    "risks": ("risk", "risk_id", "coalesce(name, 'N/A')"),
+}
+
+# Colonnes dont on peut demander les valeurs distinctes
+DISTINCT_COLUMNS = {
+    "events": ["type", "classification"],
+    "persons": ["role"],
+    "units": ["location"],
+    "risks": ["gravity", "probability"],
+}
+
+# Index des valeurs distinctes (event.type et event.classification: voir event_pages.py / time_series.py)
+LOOKUP_INDEXES_DDL = """
+CREATE INDEX IF NOT EXISTS idx_person_role ON person (role);
+CREATE INDEX IF NOT EXISTS idx_organizational_unit_location ON organizational_unit (location);
+CREATE INDEX IF NOT EXISTS idx_risk_gravity ON risk (gravity);
+CREATE INDEX IF NOT EXISTS idx_risk_probability ON risk (probability);
+"""
+
+# Paramètres → (date, séquence du journal, réponse)
+_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def install_lookup_indexes(engine):
+    """Crée les index des valeurs distinctes (idempotent)."""
+    with engine.begin() as conn:
+        conn.execute(text(LOOKUP_INDEXES_DDL))
+
+
+def _cached(db: Session, key: tuple, compute):
+    """Réponse en cache tant que le journal des modifications n'a pas avancé."""
+    seq = current_sequence(db)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            created_at, cached_seq, value = entry
+            fresh = cached_seq == seq if seq is not None else time.time() - created_at < LOOKUP_CACHE_SECONDS
+            if fresh:
+                _cache.move_to_end(key)
+                return value
+
+    value = compute()
+    with _cache_lock:
+        _cache[key] = (time.time(), seq, value)
+        while len(_cache) > LOOKUP_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+
+def read_lookup(db: Session, table: str, q: Optional[str] = None, ids: Optional[List[int]] = None,
+                limit: int = 50) -> List[Dict[str, Any]]:
+    """
+    Paires id → libellé d'une table.
+
+    Args:
+        q: Texte recherché (noms, matricule, identifiant, description ou ID exact)
+        ids: IDs à toujours inclure (valeur courante d'un formulaire), en tête de liste
+        limit: Nombre max de résultats de recherche
+    """
+    sql_table, pk, label = LOOKUP_TABLES[table]
+    limit = max(1, min(limit, MAX_LOOKUP_LIMIT))
+    ids = sorted(set(ids or []))
+    q = (q or "").strip()
+
+    def compute():
+        items = []
+        if ids:
+            rows = db.execute(
+                text(f"SELECT {pk}, {label} FROM {sql_table} WHERE {pk} = ANY(:ids) ORDER BY {pk}"),
+                {"ids": ids}
+            ).fetchall()
+            items.extend({"id": row[0], "label": row[1]} for row in rows)
+
+        if q:
+            # Recherche classée (index trigrammes, voir search.py)
+            matches = [{"id": r["id"], "label": r["label"]} for r in search_table(db, table, q, limit)]
+        else:
+            rows = db.execute(
+                text(f"SELECT {pk}, {label} FROM {sql_table} ORDER BY {pk} LIMIT :limit"), {"limit": limit}
+            ).fetchall()
+            matches = [{"id": row[0], "label": row[1]} for row in rows]
+        seen = {item["id"] for item in items}
+        items.extend(match for match in matches if match["id"] not in seen)
+        return items
+
+    return _cached(db, ("lookup", table, q, tuple(ids), limit), compute)
+
+
+def read_distinct_values(db: Session, table: str, column: str) -> List[str]:
+    """Valeurs distinctes (non nulles, triées) d'une colonne catégorielle."""
+    sql_table = LOOKUP_TABLES[table][0]
+
+    def compute():
+        rows = db.execute(text(f"SELECT DISTINCT {column} FROM {sql_table} WHERE {column} IS NOT NULL ORDER BY 1"))
+        return [row[0] for row in rows]
+
+    return _cached(db, ("values", table, column), compute)
@@ -1,15 +1,96 @@
 # main.py
 from fastapi import FastAPI, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 
 import models, schemas
-from database import SessionLocal, engine
+from database import SessionLocal, engine, replica_engine
+from monitoring import metrics, slow_queries, install_query_logging, request_timing_middleware
+from change_feed import FEED_TABLES, install_change_log, last_sequence, read_changes
+from event_pages import install_event_page_indexes, read_event_page
+from kpi_views import (EVENT_DIMENSIONS, KPIRefresher, install_kpi_views, read_summary,
+                       read_event_counts, read_measure_costs, read_risk_gravity)
+from time_series import BUCKETS, install_time_series_indexes, read_event_series
+from chart_queries import CHART_SOURCES, read_columns, run_query
+from lookups import (LOOKUP_TABLES, DISTINCT_COLUMNS, install_lookup_indexes,
+                     read_lookup, read_distinct_values)
+from search import SEARCH_TABLES, DEFAULT_LIMIT, install_search_indexes, search_table, search_all
+from read_routing import get_read_db, write_lsn_middleware
 
 app = FastAPI(title="Events Safety API", version="1.0.0")
 
-# Dépendance pour obtenir une session de DB par requête
+# Réponses JSON compressées (pages de 1000 lignes du dashboard)
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+# Instrumentation: latence/taille par route + log des requêtes SQL lentes
+# (ajouté après GZip → middleware externe: mesure la taille compressée)
+app.middleware("http")(request_timing_middleware)
+# Position WAL des écritures (lecture de ses propres écritures avec le réplica)
+app.middleware("http")(write_lsn_middleware)
+install_query_logging(engine)
+if replica_engine is not None:
+    install_query_logging(replica_engine)
+
+# Rafraîchissement des vues KPI (après N écritures ou périodiquement)
+kpi_refresher = KPIRefresher(engine)
+
+@app.on_event("startup")
+def setup_change_log():
+    """Installe le journal des modifications (table + triggers, idempotent)."""
+    try:
+        install_change_log(engine)
+    except Exception as e:
+        print(f"⚠️ Journal des modifications non installé: {str(e)}")
+
+@app.on_event("startup")
+def setup_event_page_indexes():
+    """Index de tri / filtre de la pagination des événements (idempotent)."""
+    try:
+        install_event_page_indexes(engine)
+    except Exception as e:
+        print(f"⚠️ Index de pagination des événements non créés: {str(e)}")
+
+@app.on_event("startup")
+def setup_time_series_indexes():
+    """Index des séries temporelles filtrées par unité / classification (idempotent)."""
+    try:
+        install_time_series_indexes(engine)
+    except Exception as e:
+        print(f"⚠️ Index des séries temporelles non créés: {str(e)}")
+
+@app.on_event("startup")
+def setup_lookup_indexes():
+    """Index des valeurs distinctes des formulaires (idempotent)."""
+    try:
+        install_lookup_indexes(engine)
+    except Exception as e:
+        print(f"⚠️ Index des listes de référence non créés: {str(e)}")
+
+@app.on_event("startup")
+def setup_search_indexes():
+    """Extension pg_trgm et index trigrammes de la recherche typeahead (idempotent)."""
+    try:
+        install_search_indexes(engine)
+    except Exception as e:
+        print(f"⚠️ Index de recherche non créés: {str(e)}")
+
+@app.on_event("startup")
+def setup_kpi_views():
+    """Crée les vues matérialisées des KPI et démarre leur rafraîchissement."""
+    try:
+        install_kpi_views(engine)
+        kpi_refresher.start()
+    except Exception as e:
+        print(f"⚠️ Vues KPI non installées: {str(e)}")
+
+@app.on_event("shutdown")
+def stop_kpi_refresher():
+    kpi_refresher.stop()
+
+# Dépendance pour obtenir une session de DB par requête (écritures: primaire;
+# les GET utilisent get_read_db, voir read_routing.py)
 def get_db():
     db = SessionLocal()
     try:
@@ -19,13 +100,18 @@ def get_db():
 
 # === ENDPOINTS POUR LES EVENTS ===
 @app.get("/events/", response_model=List[schemas.Event])
-def read_events(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_events(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     """Récupère une liste d'événements."""
     events = db.query(models.Event).offset(skip).limit(limit).all()
     return events
 
+@app.get("/events/page", response_model=schemas.EventPage)
+def read_events_page(page: int = 0, size: int = 12, type: Optional[str] = None, db: Session = Depends(get_read_db)):
+    """Page d'événements triée (plus récents d'abord), filtrée par type et enrichie des noms."""
+    return read_event_page(db, page, size, type)
+
 @app.get("/events/{event_id}", response_model=schemas.Event)
-def read_event(event_id: int, db: Session = Depends(get_db)):
+def read_event(event_id: int, db: Session = Depends(get_read_db)):
     """Récupère un événement par son identifiant."""
     event = db.query(models.Event).filter(models.Event.event_id == event_id).first()
     if event is None:
@@ -68,13 +154,13 @@ def delete_event(event_id: int, db: Session = Depends(get_db)):
 
 # === ENDPOINTS POUR LES PERSONS ===
 @app.get("/persons/", response_model=List[schemas.Person])
-def read_persons(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_persons(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     """Récupère une liste de personnes."""
     persons = db.query(models.Person).offset(skip).limit(limit).all()
     return persons
 
 @app.get("/persons/{person_id}", response_model=schemas.Person)
-def read_person(person_id: int, db: Session = Depends(get_db)):
+def read_person(person_id: int, db: Session = Depends(get_read_db)):
     """Récupère une personne par son identifiant."""
     person = db.query(models.Person).filter(models.Person.person_id == person_id).first()
     if person is None:
@@ -117,13 +203,13 @@ def delete_person(person_id: int, db: Session = Depends(get_db)):
 
 # === ENDPOINTS POUR LES ORGANIZATIONAL UNITS ===
 @app.get("/units/", response_model=List[schemas.OrganizationalUnit])
-def read_units(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_units(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     """Récupère toutes les unités organisationnelles."""
     units = db.query(models.OrganizationalUnit).offset(skip).limit(limit).all()
     return units
 
 @app.get("/units/{unit_id}", response_model=schemas.OrganizationalUnit)
-def read_unit(unit_id: int, db: Session = Depends(get_db)):
+def read_unit(unit_id: int, db: Session = Depends(get_read_db)):
     """Récupère une unité organisationnelle par son identifiant."""
     unit = db.query(models.OrganizationalUnit).filter(models.OrganizationalUnit.unit_id == unit_id).first()
     if unit is None:
@@ -166,13 +252,13 @@ def delete_unit(unit_id: int, db: Session = Depends(get_db)):
 
 # === ENDPOINTS POUR LES CORRECTIVE MEASURES ===
 @app.get("/measures/", response_model=List[schemas.CorrectiveMeasure])
-def read_measures(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_measures(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     """Récupère une liste de mesures correctives."""
     measures = db.query(models.CorrectiveMeasure).offset(skip).limit(limit).all()
     return measures
 
 @app.get("/measures/{measure_id}", response_model=schemas.CorrectiveMeasure)
-def read_measure(measure_id: int, db: Session = Depends(get_db)):
+def read_measure(measure_id: int, db: Session = Depends(get_read_db)):
     """Récupère une mesure corrective par son identifiant."""
     measure = db.query(models.CorrectiveMeasure).filter(models.CorrectiveMeasure.measure_id == measure_id).first()
     if measure is None:
@@ -215,13 +301,13 @@ def delete_measure(measure_id: int, db: Session = Depends(get_db)):
 
 # === ENDPOINTS POUR LES RISKS ===
 @app.get("/risks/", response_model=List[schemas.Risk])
-def read_risks(db: Session = Depends(get_db)):
+def read_risks(db: Session = Depends(get_read_db)):
     """Récupère tous les risques."""
     risks = db.query(models.Risk).all()
     return risks
 
 @app.get("/risks/{risk_id}", response_model=schemas.Risk)
-def read_risk(risk_id: int, db: Session = Depends(get_db)):
+def read_risk(risk_id: int, db: Session = Depends(get_read_db)):
     """Récupère un risque par son identifiant."""
     risk = db.query(models.Risk).filter(models.Risk.risk_id == risk_id).first()
     if risk is None:
@@ -262,6 +348,121 @@ def delete_risk(risk_id: int, db: Session = Depends(get_db)):
     db.commit()
     return None
 
+# === FLUX DES MODIFICATIONS (synchronisation incrémentale) ===
+@app.get("/changes/", response_model=schemas.ChangeSequence)
+def read_change_sequence(db: Session = Depends(get_read_db)):
+    """Position validée du journal (point de départ avant un chargement complet)."""
+    return {"last_seq": last_sequence(db)}
+
+@app.get("/changes/{table}", response_model=schemas.ChangeFeed)
+def read_table_changes(table: str, since: int = 0, db: Session = Depends(get_read_db)):
+    """Lignes modifiées et IDs supprimés d'une table depuis la position `since`."""
+    if table not in FEED_TABLES:
+        raise HTTPException(status_code=404, detail="Table non trouvée")
+    return read_changes(db, table, since)
+
+# === KPI (vues matérialisées) ===
+@app.get("/kpi/summary", response_model=schemas.KPISummary)
+def read_kpi_summary(db: Session = Depends(get_read_db)):
+    """Totaux des cartes KPI du dashboard."""
+    return {**read_summary(db), "refreshed_at": kpi_refresher.refreshed_at}
+
+@app.get("/kpi/events/{dimension}", response_model=List[schemas.KPICount])
+def read_kpi_events(dimension: str, limit: Optional[int] = None, db: Session = Depends(get_read_db)):
+    """Nombre d'événements par unit, month, type ou classification."""
+    if dimension not in EVENT_DIMENSIONS:
+        raise HTTPException(status_code=404, detail="Dimension non trouvée")
+    return read_event_counts(db, dimension, limit)
+
+@app.get("/kpi/measures/cost", response_model=List[schemas.KPIMeasureCost])
+def read_kpi_measure_costs(db: Session = Depends(get_read_db)):
+    """Nombre de mesures et coût total par unité."""
+    return read_measure_costs(db)
+
+@app.get("/kpi/risks/gravity", response_model=List[schemas.KPICount])
+def read_kpi_risk_gravity(db: Session = Depends(get_read_db)):
+    """Nombre de risques par niveau de gravité."""
+    return read_risk_gravity(db)
+
+@app.post("/kpi/refresh", response_model=schemas.KPIRefresh)
+def refresh_kpi_views():
+    """Force le rafraîchissement des vues KPI."""
+    return kpi_refresher.refresh()
+
+# === SÉRIES TEMPORELLES ===
+@app.get("/timeseries/events", response_model=schemas.TimeSeries)
+def read_events_timeseries(bucket: str = "month", unit_id: Optional[int] = None, type: Optional[str] = None,
+                           classification: Optional[str] = None, start: Optional[datetime] = None,
+                           end: Optional[datetime] = None, db: Session = Depends(get_read_db)):
+    """Nombre d'événements par day, week, month, quarter ou weekday (filtres optionnels)."""
+    if bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Intervalle invalide (valeurs: {', '.join(BUCKETS)})")
+    return read_event_series(db, bucket, unit_id, type, classification, start, end)
+
+# === CRÉATEUR DE GRAPHIQUES (agrégation côté base) ===
+@app.get("/charts/{source}/columns", response_model=schemas.ChartColumns)
+def read_chart_columns(source: str, db: Session = Depends(get_read_db)):
+    """Colonnes d'une table avec leur nature et leur nombre de valeurs distinctes (en cache)."""
+    if source not in CHART_SOURCES:
+        raise HTTPException(status_code=404, detail="Source non trouvée")
+    return read_columns(db, source)
+
+@app.post("/charts/query", response_model=schemas.ChartResult)
+def query_chart(spec: schemas.ChartQuery, db: Session = Depends(get_read_db)):
+    """Compile la spécification du graphique en SQL paramétré et renvoie les données agrégées."""
+    try:
+        return run_query(db, spec.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# === LISTES DE RÉFÉRENCE (formulaires) ===
+@app.get("/lookups/{table}", response_model=List[schemas.LookupItem])
+def read_table_lookup(table: str, q: Optional[str] = None, ids: Optional[str] = None,
+                      limit: int = 50, db: Session = Depends(get_read_db)):
+    """Paires id → libellé (recherche `q`, IDs `ids=1,2` toujours inclus)."""
+    if table not in LOOKUP_TABLES:
+        raise HTTPException(status_code=404, detail="Table non trouvée")
+    try:
+        id_list = [int(i) for i in ids.split(",") if i.strip()] if ids else []
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids doit être une liste d'entiers séparés par des virgules")
+    return read_lookup(db, table, q, id_list, limit)
+
+@app.get("/lookups/{table}/{column}/values", response_model=List[str])
+def read_column_values(table: str, column: str, db: Session = Depends(get_read_db)):
+    """Valeurs distinctes d'une colonne catégorielle (type, classification, role...)."""
+    if column not in DISTINCT_COLUMNS.get(table, []):
+        raise HTTPException(status_code=404, detail="Colonne non trouvée")
+    return read_distinct_values(db, table, column)
+
+# === RECHERCHE (typeahead) ===
+@app.get("/search", response_model=List[schemas.SearchResult])
+def search_records(q: str, tables: Optional[str] = None, limit: int = DEFAULT_LIMIT, db: Session = Depends(get_read_db)):
+    """Recherche classée dans plusieurs tables (`tables=persons,units`, toutes par défaut)."""
+    table_list = [t.strip() for t in tables.split(",") if t.strip()] if tables else None
+    unknown = [t for t in table_list or [] if t not in SEARCH_TABLES]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Table non trouvée: {', '.join(unknown)}")
+    return search_all(db, q, table_list, limit)
+
+@app.get("/search/{table}", response_model=List[schemas.SearchResult])
+def search_in_table(table: str, q: str, limit: int = DEFAULT_LIMIT, db: Session = Depends(get_read_db)):
+    """Top-K enregistrements d'une table correspondant à `q` (noms, matricule, identifiant, description)."""
+    if table not in SEARCH_TABLES:
+        raise HTTPException(status_code=404, detail="Table non trouvée")
+    return search_table(db, table, q, limit)
+
+# === MÉTRIQUES ===
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """Métriques de l'API au format Prometheus (latence, taille des réponses, requêtes SQL)."""
+    return metrics.render_prometheus()
+
+@app.get("/metrics/slow-queries")
+def read_slow_queries(limit: int = 20):
+    """Dernières requêtes SQL lentes avec paramètres et EXPLAIN."""
+    return list(slow_queries)[-limit:]
+
 @app.get("/")
 def root():
     """Page d'accueil de l'API."""
@@ -0,0 +1,220 @@
+# monitoring.py - Instrumentation de l'API
+"""
+Métriques et log des requêtes lentes pour l'API FastAPI.
+
+- Middleware HTTP: latence et taille des réponses par route (gabarit de route,
+  ex. /events/{event_id}) et par page du dashboard (en-tête X-Dashboard-Page).
+- Hooks SQLAlchemy (before/after_cursor_execute): durée de chaque requête SQL,
+  log des requêtes au-dessus de API_SLOW_QUERY_MS avec paramètres et EXPLAIN.
+- Export au format texte Prometheus (GET /metrics).
+"""
+
+import os
+import time
+import threading
+import contextvars
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Dict, Any
+
+from sqlalchemy import event
+from starlette.routing import Match
+
+# Seuil (ms) au-delà duquel une requête SQL est loggée avec son EXPLAIN
+SLOW_QUERY_MS = float(os.environ.get("API_SLOW_QUERY_MS", "200"))
+EXPLAIN_SLOW_QUERIES = os.environ.get("API_EXPLAIN_SLOW_QUERIES", "true").lower() == "true"
+# Nombre de requêtes lentes gardées en mémoire (GET /metrics/slow-queries)
+SLOW_QUERY_HISTORY = int(os.environ.get("API_SLOW_QUERY_HISTORY", "100"))
+
+# Pages du dashboard (en-tête X-Dashboard-Page, voir streamlit/app/app.py): toute autre
+# valeur est comptée comme "other" pour borner le nombre de séries du label page
+DASHBOARD_PAGES = {
+    "Demarrage", "Assistant IA", "Vue d'ensemble", "Evenements recents", "Statistiques",
+    "Analyses detaillees", "Createur de graphiques", "Gestion des donnees", "inconnue",
+}
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+# Description et buckets de chaque métrique
+METRICS = {
+    'api_requests_total': ("counter", "Requêtes HTTP par route, statut et page du dashboard", None),
+    'api_request_duration_seconds': ("histogram", "Latence des requêtes HTTP par route", DURATION_BUCKETS),
+    'api_response_size_bytes': ("histogram", "Taille des réponses HTTP par route", SIZE_BUCKETS),
+    'api_db_queries_total': ("counter", "Requêtes SQL exécutées par route", None),
+    'api_db_query_duration_seconds': ("histogram", "Durée des requêtes SQL par route", DURATION_BUCKETS),
+    'api_slow_queries_total': ("counter", "Requêtes SQL au-dessus du seuil API_SLOW_QUERY_MS", None),
+    'api_db_reads_total': ("counter", "Sessions de lecture par cible (target=replica|primary)", None),
+}
+
+
+class Metrics:
+    """Registre de compteurs et d'histogrammes, thread-safe."""
+
+    def __init__(self):
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        with self._lock:
+            self._counters[self._key(name, labels)] += value
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = METRICS.get(name, (None, None, DURATION_BUCKETS))[2] or DURATION_BUCKETS
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = {'buckets': buckets, 'counts': [0] * len(buckets), 'count': 0, 'sum': 0.0}
+                self._histograms[key] = histogram
+            histogram['count'] += 1
+            histogram['sum'] += value
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+
+    def render_prometheus(self) -> str:
+        """Exporte les métriques au format texte Prometheus."""
+        def fmt_labels(labels, extra=None):
+            items = list(labels) + (extra or [])
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+        lines = []
+        with self._lock:
+            names = sorted({n for n, _ in self._counters} | {n for n, _ in self._histograms})
+            for name in names:
+                kind, help_text, _ = METRICS.get(name, ("untyped", name, None))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (n, labels), value in sorted(self._counters.items()):
+                    if n == name:
+                        lines.append(f"{name}{fmt_labels(labels)} {value:g}")
+                for (n, labels), h in sorted(self._histograms.items()):
+                    if n != name:
+                        continue
+                    for bound, count in zip(h['buckets'], h['counts']):
+                        lines.append(f"{name}_bucket{fmt_labels(labels, [('le', f'{bound:g}')])} {count}")
+                    lines.append(f"{name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {h['count']}")
+                    lines.append(f"{name}_sum{fmt_labels(labels)} {h['sum']:g}")
+                    lines.append(f"{name}_count{fmt_labels(labels)} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+slow_queries = deque(maxlen=SLOW_QUERY_HISTORY)
+
+# Route (gabarit) et page du dashboard de la requête HTTP en cours
+_current_request = contextvars.ContextVar("api_current_request", default=None)
+
+
+def _route_template(request) -> str:
+    """Gabarit de la route (/events/{event_id}) pour garder peu de valeurs de label."""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path)
+    return "unmatched"
+
+
+def _dashboard_page(request) -> str:
+    """Page du dashboard à l'origine de la requête ("-" sans en-tête, "other" si inconnue)."""
+    page = request.headers.get("X-Dashboard-Page")
+    if page is None:
+        return "-"
+    return page if page in DASHBOARD_PAGES else "other"
+
+
+# === MIDDLEWARE HTTP ===
+async def request_timing_middleware(request, call_next):
+    """Mesure latence et taille de réponse par route et par page du dashboard."""
+    route = _route_template(request)
+    page = _dashboard_page(request)
+    token = _current_request.set({'route': route, 'page': page})
+
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        _current_request.reset(token)
+        metrics.inc('api_requests_total', method=request.method, route=route, status=status, page=page)
+        metrics.observe('api_request_duration_seconds', elapsed, method=request.method, route=route)
+
+    size = response.headers.get("content-length")
+    if size is not None:
+        metrics.observe('api_response_size_bytes', int(size), method=request.method, route=route)
+    response.headers["X-Response-Time-Ms"] = f"{elapsed * 1000:.1f}"
+    return response
+
+
+# === REQUÊTES SQL LENTES ===
+def _explain(cursor, statement: str, parameters) -> str:
+    """
+    EXPLAIN de la requête sur la même connexion (SELECT uniquement), dans un
+    SAVEPOINT: un EXPLAIN en échec n'annule pas la transaction de la requête HTTP.
+    """
+    if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+        return ""
+    connection = cursor.connection
+    # Hors transaction (autocommit), pas de SAVEPOINT possible ni nécessaire
+    in_transaction = not getattr(connection, "autocommit", False)
+    explain_cursor = connection.cursor()
+    try:
+        if in_transaction:
+            explain_cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            explain_cursor.execute("EXPLAIN " + statement, parameters)
+            plan = "\n".join(row[0] for row in explain_cursor.fetchall())
+        except Exception as e:
+            if in_transaction:
+                explain_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            return f"EXPLAIN impossible: {str(e)}"
+        if in_transaction:
+            explain_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        return plan
+    except Exception as e:
+        return f"EXPLAIN impossible: {str(e)}"
+    finally:
+        explain_cursor.close()
+
+
+def install_query_logging(engine):
+    """Branche les hooks SQLAlchemy de mesure des requêtes sur l'engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+        request = _current_request.get() or {'route': "-", 'page': "-"}
+        metrics.inc('api_db_queries_total', route=request['route'])
+        metrics.observe('api_db_query_duration_seconds', elapsed, route=request['route'])
+
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms < SLOW_QUERY_MS:
+            return
+
+        metrics.inc('api_slow_queries_total', route=request['route'])
+        plan = _explain(cursor, statement, parameters) if EXPLAIN_SLOW_QUERIES and not executemany else ""
+        slow_queries.append({
+            'timestamp': datetime.now().isoformat(),
+            'duration_ms': round(elapsed_ms, 1),
+            'route': request['route'],
+            'page': request['page'],
+            'statement': statement,
+            'parameters': str(parameters),
+            'explain': plan
+        })
+        print(f"🐢 Requête lente ({elapsed_ms:.0f} ms) sur {request['route']} [page: {request['page']}]\n"
+              f"📝 SQL:\n{statement}\n🔢 Paramètres: {parameters}\n📋 EXPLAIN:\n{plan}\n")
@@ -0,0 +1,62 @@
+# read_routing.py - Lectures sur le réplica, écritures sur le primaire
+"""
+Avec POSTGRES_REPLICA_HOST, les handlers GET (et le créateur de graphiques)
+lisent sur le réplica: la charge analytique ne ralentit plus la saisie des
+incidents sur le primaire.
+
+Lecture de ses propres écritures: chaque écriture réussie renvoie la position
+WAL du primaire (en-tête X-Write-LSN + cookie). Le client la renvoie dans
+X-Min-LSN (ou via le cookie): tant que le réplica ne l'a pas rejouée, ses
+lectures passent par le primaire. Au-delà de POSTGRES_REPLICA_MAX_LAG_SECONDS
+de retard, ou si le réplica ne répond pas, toutes les lectures y passent.
+"""
+
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import text
+
+from database import SessionLocal, engine, replica_engine, replica_monitor
+from monitoring import metrics
+
+WRITE_LSN_HEADER = "X-Write-LSN"
+MIN_LSN_HEADER = "X-Min-LSN"
+WRITE_LSN_COOKIE = "write_lsn"
+# Durée de vie du cookie: largement au-dessus du retard toléré
+WRITE_LSN_COOKIE_SECONDS = 60
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+# POST en lecture seule (routés vers le réplica, sans position WAL)
+READ_ONLY_PATHS = {"/charts/query"}
+
+
+def get_read_db(request: Request):
+    """Session de lecture par requête: réplica si à jour pour ce client, sinon primaire."""
+    min_lsn = request.headers.get(MIN_LSN_HEADER) or request.cookies.get(WRITE_LSN_COOKIE)
+    bind = replica_monitor.read_engine(min_lsn)
+    metrics.inc('api_db_reads_total', target="replica" if bind is not engine else "primary")
+    db = SessionLocal(bind=bind)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _current_lsn() -> str:
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT pg_current_wal_lsn()::text")).scalar()
+
+
+async def write_lsn_middleware(request, call_next):
+    """Ajoute la position WAL du primaire aux réponses des écritures réussies."""
+    response = await call_next(request)
+    if replica_engine is None or request.method in SAFE_METHODS or request.url.path in READ_ONLY_PATHS \
+            or response.status_code >= 400:
+        return response
+    try:
+        lsn = await run_in_threadpool(_current_lsn)
+    except Exception as e:
+        print(f"⚠️ Position WAL non lue: {str(e)}")
+        return response
+    response.headers[WRITE_LSN_HEADER] = lsn
+    response.set_cookie(WRITE_LSN_COOKIE, lsn, max_age=WRITE_LSN_COOKIE_SECONDS, httponly=True)
+    return response
@@ -1,6 +1,6 @@
 # schemas.py
 from pydantic import BaseModel, ConfigDict
-from typing import Optional
+from typing import Optional, List, Dict, Any
 from datetime import datetime
 
 # ============ EVENT SCHEMAS ============
@@ -30,6 +30,16 @@ class Event(EventBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+class EventCard(Event):
+    unit_name: str
+    declared_by_name: str
+
+class EventPage(BaseModel):
+    total: int
+    page: int
+    size: int
+    items: List[EventCard]
+
 # ============ PERSON SCHEMAS ============
 class PersonBase(BaseModel):
     matricule: str
@@ -112,4 +122,105 @@ class RiskUpdate(BaseModel):
 class Risk(RiskBase):
     risk_id: int
     
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+# ============ CHANGE FEED SCHEMAS ============
+class ChangeSequence(BaseModel):
+    last_seq: int
+
+class ChangeFeed(BaseModel):
+    table: str
+    since: int
+    last_seq: int
+    reset: bool = False
+    upserts: List[Dict[str, Any]] = []
+    deletes: List[int] = []
+
+
+# ============ KPI SCHEMAS ============
+class KPISummary(BaseModel):
+    total_events: int
+    units_with_events: int
+    total_units: int
+    monthly_average: float
+    monthly_max: int
+    total_measures: int
+    total_cost: float
+    refreshed_at: Optional[datetime] = None
+
+class KPICount(BaseModel):
+    label: str
+    count: int
+
+class KPIMeasureCost(BaseModel):
+    unit_id: Optional[int] = None
+    unit_name: Optional[str] = None
+    measure_count: int
+    costed_count: int
+    total_cost: float
+
+class KPIRefresh(BaseModel):
+    refreshed_at: datetime
+    duration_ms: float
+
+
+# ============ TIME SERIES SCHEMAS ============
+class TimeSeriesPoint(BaseModel):
+    period: str
+    count: int
+
+class TimeSeries(BaseModel):
+    bucket: str
+    points: List[TimeSeriesPoint]
+    cached: bool = False
+
+
+# ============ CHART QUERY SCHEMAS ============
+class ChartColumn(BaseModel):
+    name: str
+    kind: str
+    distinct: Optional[int] = None
+
+class ChartColumns(BaseModel):
+    source: str
+    row_count: int
+    columns: List[ChartColumn]
+
+class ChartMeasure(BaseModel):
+    column: Optional[str] = None
+    aggregation: str
+    alias: Optional[str] = None
+
+class ChartFilter(BaseModel):
+    column: str
+    op: str = "eq"
+    value: Any
+
+class ChartQuery(BaseModel):
+    source: str
+    dimensions: List[str] = []
+    measures: List[ChartMeasure] = []
+    filters: List[ChartFilter] = []
+    not_null: List[str] = []
+    order_by: Optional[str] = None
+    descending: bool = False
+    limit: Optional[int] = None
+    sample: bool = False
+
+class ChartResult(BaseModel):
+    columns: List[str]
+    rows: List[List[Any]]
+    truncated: bool = False
+
+
+# ============ LOOKUP SCHEMAS ============
+class LookupItem(BaseModel):
+    id: int
+    label: str
+
+
+# ============ SEARCH SCHEMAS ============
+class SearchResult(BaseModel):
+    table: str
+    id: int
+    label: str
+    score: float
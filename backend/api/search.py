@@ -0,0 +1,116 @@
+# search.py - Recherche typeahead (trigrammes PostgreSQL)
+"""
+Recherche approximative sur les personnes, unités, événements, mesures et
+risques pour les sélecteurs du dashboard.
+
+Chaque table expose un "document" (noms, matricule, identifiant,
+description...) indexé par un index GIN pg_trgm sur la même expression:
+- `document ILIKE '%texte%'` (sous-chaîne) et `texte <% document`
+  (word_similarity, tolère les fautes de frappe) utilisent l'index;
+- les résultats sont classés: ID exact, puis sous-chaîne, puis similarité.
+
+Seuls les top-K résultats sont renvoyés (quelques ms, même sur 100k lignes).
+"""
+
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Les clés primaires sont des integer (int4): un nombre plus grand n'est pas un ID
+MAX_ID = 2**31 - 1
+
+# Table (nom de route) → (table SQL, clé primaire, document recherché, libellé affiché)
+# Le document doit être identique à l'expression de l'index (sinon l'index n'est pas utilisé)
+SEARCH_TABLES = {
+    "persons": (
+        "person", "person_id",
+        "(coalesce(name, '') || ' ' || coalesce(family_name, '') || ' ' || coalesce(matricule, ''))",
+        "trim(concat(name, ' ', family_name))",
+    ),
+    "units": (
+        "organizational_unit", "unit_id",
+        "(coalesce(name, '') || ' ' || coalesce(identifier, '') || ' ' || coalesce(location, ''))",
+        "coalesce(name, 'N/A')",
+    ),
+    "events": (
+        "event", "event_id",
+        "(coalesce(type, '') || ' ' || coalesce(classification, '') || ' ' || coalesce(description, ''))",
+        "concat(coalesce(type, 'N/A'), ' (', coalesce(classification, 'N/A'), ')')",
+    ),
+    "measures": (
+        "corrective_measure", "measure_id",
+        "(coalesce(name, '') || ' ' || coalesce(description, ''))",
+        "coalesce(name, 'N/A')",
+    ),
+    "risks": (
+        "risk", "risk_id",
+        "coalesce(name, '')",
+        "coalesce(name, 'N/A')",
+    ),
+}
+
+
+def install_search_indexes(engine):
+    """Active pg_trgm et crée un index GIN trigrammes par document (idempotent)."""
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for table, (sql_table, _, document, _) in SEARCH_TABLES.items():
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS idx_{sql_table}_search_trgm "
+                f"ON {sql_table} USING gin ({document} gin_trgm_ops)"
+            ))
+
+
+def like_escape(value: str) -> str:
+    """Échappe les jokers de LIKE (% et _) et le caractère d'échappement lui-même."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_table(db: Session, table: str, q: str, limit: int = DEFAULT_LIMIT) -> List[Dict[str, Any]]:
+    """
+    Top-K enregistrements d'une table correspondant à `q`, les plus pertinents d'abord.
+
+    Returns:
+        [{table, id, label, score}] (score: 1 = ID exact ou sous-chaîne, sinon similarité 0-1)
+    """
+    sql_table, pk, document, label = SEARCH_TABLES[table]
+    limit = max(1, min(limit, MAX_LIMIT))
+    q = q.strip()
+    if not q:
+        return []
+
+    params = {"q": q, "pattern": f"%{like_escape(q)}%", "limit": limit}
+    id_match = ""
+    if q.isascii() and q.isdigit() and int(q) <= MAX_ID:
+        id_match = f"OR {pk} = :q_id"
+        params["q_id"] = int(q)
+
+    rows = db.execute(text(f"""
+        SELECT {pk} AS id, {label} AS label,
+               CASE WHEN {pk}::text = :q THEN 2
+                    WHEN {document} ILIKE :pattern ESCAPE '\\' THEN 1
+                    ELSE word_similarity(:q, {document})
+               END AS score
+        FROM {sql_table}
+        WHERE {document} ILIKE :pattern ESCAPE '\\' OR :q <% {document} {id_match}
+        ORDER BY score DESC, {pk}
+        LIMIT :limit
+    """), params).mappings().all()
+
+    return [
+        {"table": table, "id": row["id"], "label": row["label"], "score": round(min(float(row["score"]), 1.0), 3)}
+        for row in rows
+    ]
+
+
+def search_all(db: Session, q: str, tables: Optional[List[str]] = None,
+               limit: int = DEFAULT_LIMIT) -> List[Dict[str, Any]]:
+    """Recherche dans plusieurs tables, résultats fusionnés par score."""
+    results = []
+    for table in tables or list(SEARCH_TABLES):
+        results.extend(search_table(db, table, q, limit))
+    results.sort(key=lambda r: -r["score"])
+    return results[:max(1, min(limit, MAX_LIMIT))]
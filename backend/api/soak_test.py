@@ -0,0 +1,221 @@
+"""
+Test d'endurance: N utilisateurs simultanés sur l'API, connexions PostgreSQL suivies.
+
+Chaque utilisateur (un thread, une connexion HTTP keep-alive) enchaîne les
+lectures du dashboard (pages d'événements, KPI, séries, listes, recherche)
+avec un temps de réflexion aléatoire. En parallèle, pg_stat_activity est lu
+directement sur PostgreSQL (pas via PgBouncer) toutes les --sample-seconds.
+
+Le test réussit si, après la montée en charge (--warmup), le nombre de
+connexions serveur reste stable (écart max - min ≤ --max-drift) et sous
+--max-connections s'il est donné.
+
+    # Sans pooler: un pool SQLAlchemy par processus
+    docker compose up -d
+    POSTGRES_HOST=localhost python soak_test.py --users 500 --duration 300
+
+    # Avec PgBouncer en mode transaction
+    APP_DB_HOST=pgbouncer APP_DB_PORT=6432 POSTGRES_POOLER=transaction \\
+        docker compose --profile pgbouncer up -d
+    POSTGRES_HOST=localhost python soak_test.py --users 500 --duration 300 --max-connections 45
+"""
+
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import List, Dict, Any
+from urllib.parse import urlparse
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+from database import SQLALCHEMY_DATABASE_URL
+
+DEFAULT_REPORT = "soak_report.json"
+
+# (poids, chemin) des lectures d'un utilisateur du dashboard
+SCENARIO = [
+    (4, "/events/page?page={page}&size=12"),
+    (3, "/kpi/summary"),
+    (2, "/kpi/events/type"),
+    (2, "/kpi/events/month"),
+    (1, "/kpi/measures/cost"),
+    (1, "/kpi/risks/gravity"),
+    (2, "/timeseries/events?bucket=month"),
+    (1, "/lookups/persons?q={letter}"),
+    (1, "/lookups/events/type/values"),
+    (2, "/search?q={letter}{letter}"),
+    (1, "/changes/"),
+]
+
+CONNECTIONS_SQL = """
+SELECT count(*),
+       count(*) FILTER (WHERE state = 'active'),
+       count(*) FILTER (WHERE state LIKE 'idle in transaction%')
+FROM pg_stat_activity
+WHERE datname = current_database() AND backend_type = 'client backend' AND pid <> pg_backend_pid()
+"""
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Percentile au rang le plus proche."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class SoakTest:
+    """Utilisateurs simulés (threads) + échantillonnage de pg_stat_activity."""
+
+    def __init__(self, url: str, users: int, duration: float, think_seconds: float, db_url: str,
+                 sample_seconds: float):
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.users = users
+        self.duration = duration
+        self.think_seconds = think_seconds
+        self.sample_seconds = sample_seconds
+        self.monitor_engine = create_engine(db_url, poolclass=NullPool)
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.samples: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._paths = [path for weight, path in SCENARIO for _ in range(weight)]
+
+    def _user(self, seed: int):
+        """Boucle d'un utilisateur: requête, temps de réflexion, recommence."""
+        rng = random.Random(seed)
+        # Arrivées étalées sur un temps de réflexion
+        time.sleep(rng.uniform(0, self.think_seconds))
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        while not self._stop.is_set():
+            path = rng.choice(self._paths).format(page=rng.randint(0, 20),
+                                                 letter=rng.choice("abcdeilmnorst"))
+            start = time.perf_counter()
+            try:
+                conn.request("GET", path, headers={"X-Dashboard-Page": "soak"})
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except Exception as e:
+                status = type(e).__name__
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.latencies.append(elapsed)
+                self.statuses[status] += 1
+            self._stop.wait(rng.uniform(0.5, 1.5) * self.think_seconds)
+        conn.close()
+
+    def _sample(self, started: float):
+        """Nombre de connexions serveur (total, actives, idle in transaction)."""
+        with self.monitor_engine.connect() as conn:
+            total, active, idle_in_tx = conn.execute(text(CONNECTIONS_SQL)).one()
+        with self._lock:
+            requests_done = sum(self.statuses.values())
+        sample = {'t': round(time.time() - started, 1), 'connections': total, 'active': active,
+                  'idle_in_transaction': idle_in_tx, 'requests': requests_done}
+        self.samples.append(sample)
+        print(f"  t={sample['t']:>6.1f}s  connexions={total:>4}  actives={active:>4}  "
+              f"idle in tx={idle_in_tx:>3}  requêtes={requests_done}")
+
+    def run(self):
+        print(f"🚀 {self.users} utilisateurs pendant {self.duration:.0f}s sur http://{self.host}:{self.port}")
+        started = time.time()
+        threads = [threading.Thread(target=self._user, args=(i,), daemon=True) for i in range(self.users)]
+        for thread in threads:
+            thread.start()
+        try:
+            while time.time() - started < self.duration:
+                try:
+                    self._sample(started)
+                except Exception as e:
+                    print(f"⚠️ Lecture de pg_stat_activity impossible: {str(e)}")
+                time.sleep(self.sample_seconds)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join(timeout=35)
+
+
+def summarize(test: SoakTest, warmup: float, max_drift: int, max_connections: int = None) -> Dict[str, Any]:
+    """Débit, latences, erreurs et stabilité du nombre de connexions après la montée en charge."""
+    steady = [s['connections'] for s in test.samples if s['t'] >= warmup] or [s['connections'] for s in test.samples]
+    total = sum(test.statuses.values())
+    errors = sum(count for status, count in test.statuses.items() if not (isinstance(status, int) and status < 400))
+    summary = {
+        'users': test.users,
+        'duration_s': test.duration,
+        'requests': total,
+        'throughput_rps': round(total / test.duration, 1) if test.duration else 0,
+        'error_rate': round(errors / total, 4) if total else None,
+        'statuses': {str(k): v for k, v in test.statuses.items()},
+        'latency_ms': {
+            'p50': round(_percentile(test.latencies, 50), 1),
+            'p95': round(_percentile(test.latencies, 95), 1),
+            'p99': round(_percentile(test.latencies, 99), 1),
+        },
+        'connections': {
+            'min': min(steady) if steady else None,
+            'max': max(steady) if steady else None,
+            'drift': (max(steady) - min(steady)) if steady else None,
+            'peak_idle_in_transaction': max((s['idle_in_transaction'] for s in test.samples), default=None),
+        },
+    }
+    flat = steady and summary['connections']['drift'] <= max_drift
+    bounded = steady and (max_connections is None or summary['connections']['max'] <= max_connections)
+    summary['passed'] = bool(flat and bounded)
+    return summary
+
+
+def print_report(summary: Dict[str, Any]):
+    """Affiche le résumé dans le terminal."""
+    latency, connections = summary['latency_ms'], summary['connections']
+    print("-" * 72)
+    print(f"Requêtes: {summary['requests']} ({summary['throughput_rps']} req/s) | "
+          f"Erreurs: {summary['error_rate']} | Statuts: {summary['statuses']}")
+    print(f"Latence: p50={latency['p50']} ms  p95={latency['p95']} ms  p99={latency['p99']} ms")
+    print(f"Connexions (après montée en charge): min={connections['min']}  max={connections['max']}  "
+          f"écart={connections['drift']}  idle in tx max={connections['peak_idle_in_transaction']}")
+    print("✅ Nombre de connexions stable" if summary['passed'] else "❌ Nombre de connexions instable ou trop élevé")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test d'endurance de l'API (connexions PostgreSQL)")
+    parser.add_argument("--url", default="http://localhost:8000", help="URL de l'API")
+    parser.add_argument("--users", type=int, default=500, help="Utilisateurs simultanés")
+    parser.add_argument("--duration", type=float, default=300, help="Durée du test (secondes)")
+    parser.add_argument("--think", type=float, default=1.0, help="Temps de réflexion moyen entre deux requêtes (s)")
+    parser.add_argument("--warmup", type=float, default=30, help="Montée en charge ignorée pour la stabilité (s)")
+    parser.add_argument("--sample-seconds", type=float, default=5, help="Intervalle de lecture de pg_stat_activity")
+    parser.add_argument("--max-drift", type=int, default=2, help="Écart max - min toléré des connexions")
+    parser.add_argument("--max-connections", type=int, help="Plafond de connexions serveur attendu")
+    parser.add_argument("--db-url", default=SQLALCHEMY_DATABASE_URL, help="PostgreSQL direct (pas PgBouncer)")
+    parser.add_argument("--output", default=DEFAULT_REPORT, help="Rapport JSON à écrire")
+    args = parser.parse_args(argv)
+
+    test = SoakTest(args.url, args.users, args.duration, args.think, args.db_url, args.sample_seconds)
+    test.run()
+    summary = summarize(test, args.warmup, args.max_drift, args.max_connections)
+    print_report(summary)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({'generated_at': datetime.now().isoformat(), 'summary': summary, 'samples': test.samples},
+                  f, ensure_ascii=False, indent=2)
+    print(f"\n📄 Rapport écrit dans {args.output}")
+
+    return 0 if summary['passed'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
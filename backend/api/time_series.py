@@ -0,0 +1,118 @@
+# time_series.py - Séries temporelles d'événements agrégées côté base
+"""
+Nombre d'événements par intervalle de temps (jour, semaine, mois, trimestre)
+ou par jour de la semaine, avec filtres optionnels (unité, type, classification,
+période). Le regroupement est fait par PostgreSQL (date_trunc sur start_datetime,
+indexé), le dashboard ne reçoit que les points de la courbe.
+
+Les séries sont gardées en mémoire et réutilisées tant que le journal des
+modifications (change_log) n'a pas avancé; sans journal, elles expirent après
+TIMESERIES_CACHE_SECONDS.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from change_feed import current_sequence
+
+# Intervalle → champ de date_trunc ('weekday' = jour de la semaine ISO, 1 = lundi)
+BUCKETS = {
+    "day": "day",
+    "week": "week",
+    "month": "month",
+    "quarter": "quarter",
+    "weekday": None,
+}
+
+CACHE_SECONDS = int(os.environ.get("TIMESERIES_CACHE_SECONDS", "60"))
+CACHE_SIZE = 256
+
+# Index des filtres par unité / classification combinés à la date
+# (date seule et type + date: voir event_pages.py)
+TIME_SERIES_INDEXES_DDL = """
+CREATE INDEX IF NOT EXISTS idx_event_unit_start_datetime ON event (organizational_unit_id, start_datetime);
+CREATE INDEX IF NOT EXISTS idx_event_classification_start_datetime ON event (classification, start_datetime);
+"""
+
+# Clé (paramètres) → (date, séquence du journal, série)
+_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def install_time_series_indexes(engine):
+    """Crée les index des séries temporelles filtrées (idempotent)."""
+    with engine.begin() as conn:
+        conn.execute(text(TIME_SERIES_INDEXES_DDL))
+
+
+def _query_series(db: Session, bucket: str, filters: Dict[str, Any]):
+    """Exécute le regroupement dans PostgreSQL."""
+    if BUCKETS[bucket] is None:
+        period = "extract(isodow FROM start_datetime::timestamp)::int"
+    else:
+        period = f"date_trunc('{BUCKETS[bucket]}', start_datetime::timestamp)::date"
+
+    conditions = ["start_datetime IS NOT NULL"]
+    params = {}
+    if filters.get("unit_id") is not None:
+        conditions.append("organizational_unit_id = :unit_id")
+        params["unit_id"] = filters["unit_id"]
+    if filters.get("type"):
+        conditions.append("type = :type")
+        params["type"] = filters["type"]
+    if filters.get("classification"):
+        conditions.append("classification = :classification")
+        params["classification"] = filters["classification"]
+    if filters.get("start") is not None:
+        conditions.append("start_datetime >= :start")
+        params["start"] = filters["start"]
+    if filters.get("end") is not None:
+        conditions.append("start_datetime < :end")
+        params["end"] = filters["end"]
+
+    rows = db.execute(text(f"""
+        SELECT {period} AS period, count(*) AS count
+        FROM event
+        WHERE {' AND '.join(conditions)}
+        GROUP BY 1
+        ORDER BY 1
+    """), params).fetchall()
+    return [{"period": str(period_value), "count": count} for period_value, count in rows]
+
+
+def read_event_series(db: Session, bucket: str, unit_id: Optional[int] = None,
+                      event_type: Optional[str] = None, classification: Optional[str] = None,
+                      start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Série du nombre d'événements par intervalle.
+
+    Returns:
+        dict avec 'bucket', 'points' ([{period, count}], dans l'ordre) et 'cached'
+    """
+    filters = {"unit_id": unit_id, "type": event_type, "classification": classification,
+               "start": start, "end": end}
+    key = (bucket, unit_id, event_type, classification, start, end)
+    seq = current_sequence(db)
+
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            created_at, cached_seq, points = entry
+            fresh = cached_seq == seq if seq is not None else time.time() - created_at < CACHE_SECONDS
+            if fresh:
+                _cache.move_to_end(key)
+                return {"bucket": bucket, "points": points, "cached": True}
+
+    points = _query_series(db, bucket, filters)
+    with _cache_lock:
+        _cache[key] = (time.time(), seq, points)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return {"bucket": bucket, "points": points, "cached": False}
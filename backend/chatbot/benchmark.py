@@ -0,0 +1,328 @@
+"""
+Banc d'essai hors-ligne du pipeline question → SQL → lignes.
+
+Exécute le catalogue de questions (benchmark_questions.json) à travers
+SQLGenerator et DataRetriever, puis rapporte pour chaque question:
+- la latence par étape (LLM, génération SQL, exécution SQL, formatage, total)
+- le nombre de tentatives (retries du DataRetriever) et d'appels LLM
+- les tokens de prompt envoyés au modèle
+- la correction du résultat, comparé à une requête SQL de référence
+
+Le LLM est choisi par LLM_BACKEND (voir llm_backend.py):
+    # 1. Enregistrer une fois les réponses Gemini (clé API requise)
+    LLM_BACKEND=record LLM_CASSETTE=benchmark_cassette.jsonl python benchmark.py
+    # 2. Rejouer sans clé ni réseau (résultats reproductibles)
+    LLM_BACKEND=replay LLM_CASSETTE=benchmark_cassette.jsonl python benchmark.py
+
+Base locale chargée depuis db_backup/events.backup:
+    docker compose --profile bench up -d bench_db
+    POSTGRES_HOST=localhost POSTGRES_PORT=5433 python benchmark.py --restore
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Optional, Dict, Any, List
+
+from sqlalchemy import text
+
+# Pas d'exemples appris: les prompts doivent rester identiques d'une exécution à l'autre (cassette)
+os.environ.setdefault("CHAT_EXAMPLE_STORE", "off")
+
+from database import SessionLocal, SQLALCHEMY_DATABASE_URL
+from data_retriever import DataRetriever
+from llm_backend import get_llm_model
+from sql_generator import SQLGenerator
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CATALOGUE = os.path.join(BASE_DIR, "benchmark_questions.json")
+DEFAULT_BACKUP = os.path.join(BASE_DIR, "..", "..", "db_backup", "events.backup")
+DEFAULT_REPORT = "benchmark_report.json"
+
+STAGES = ["llm_ms", "sql_generation_ms", "db_ms", "format_ms", "total_ms"]
+
+
+# === INSTRUMENTATION ===
+class InstrumentedModel:
+    """Enveloppe le modèle LLM pour mesurer chaque appel (latence + tokens)."""
+
+    def __init__(self, model):
+        self.model = model
+        self.calls = []
+
+    def reset(self):
+        self.calls = []
+
+    def generate_content(self, prompt, **kwargs):
+        start = time.perf_counter()
+        response = self.model.generate_content(prompt, **kwargs)
+        elapsed = (time.perf_counter() - start) * 1000
+        usage = getattr(response, "usage_metadata", None)
+        self.calls.append({
+            'latency_ms': elapsed,
+            'recorded_latency_ms': getattr(response, "latency_ms", None),
+            'prompt_tokens': getattr(usage, "prompt_token_count", 0) or 0,
+            'output_tokens': getattr(usage, "candidates_token_count", 0) or 0
+        })
+        return response
+
+
+class TimedSQLGenerator(SQLGenerator):
+    """SQLGenerator qui cumule le temps passé dans generate_sql_query."""
+
+    def __init__(self, model):
+        super().__init__(model=model)
+        self.elapsed_ms = 0.0
+
+    def generate_sql_query(self, question: str, conversation_history: list = None) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            return super().generate_sql_query(question, conversation_history)
+        finally:
+            self.elapsed_ms += (time.perf_counter() - start) * 1000
+
+
+def instrument_db(retriever: DataRetriever) -> Dict[str, float]:
+    """Mesure le temps des requêtes SQL exécutées par le DataRetriever."""
+    timing = {'db_ms': 0.0}
+    execute = retriever.db.execute
+
+    def timed_execute(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return execute(*args, **kwargs)
+        finally:
+            timing['db_ms'] += (time.perf_counter() - start) * 1000
+
+    retriever.db.execute = timed_execute
+    return timing
+
+
+# === BASE LOCALE ===
+def restore_database(backup_path: str):
+    """Charge db_backup/events.backup dans la base configurée (POSTGRES_*)."""
+    print(f"📦 Restauration de {backup_path}...")
+    subprocess.run(
+        ["pg_restore", "--no-owner", "--clean", "--if-exists", "-d", SQLALCHEMY_DATABASE_URL, backup_path],
+        check=False
+    )
+
+
+# === CORRECTION ===
+def _normalize(value):
+    """Rend les valeurs comparables entre requête générée et requête de référence."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float, Decimal)):
+        return round(float(value), 2)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value).strip()
+
+
+def _rows(db, sql: str) -> List[Counter]:
+    """Exécute une requête et retourne chaque ligne comme multiensemble de valeurs."""
+    return [Counter(_normalize(v) for v in row) for row in db.execute(text(sql)).fetchall()]
+
+
+def _match_rows(reference: List[Counter], generated: List[Counter], exact: bool) -> bool:
+    """Chaque ligne de référence doit être contenue dans une ligne générée (colonnes en plus tolérées)."""
+    remaining = list(generated)
+    for ref in reference:
+        for i, gen in enumerate(remaining):
+            if not (ref - gen):
+                del remaining[i]
+                break
+        else:
+            return False
+    return not remaining if exact else True
+
+
+def check_result(db, case: Dict[str, Any], generated_sql: Optional[str]) -> Optional[bool]:
+    """
+    Compare le résultat de la requête générée à la référence.
+
+    Modes (champ "check" du catalogue):
+    - exact: mêmes lignes (ordre et colonnes supplémentaires ignorés)
+    - contains: toutes les lignes de référence sont présentes
+    - value: la valeur de référence (1re ligne, 1re colonne) apparaît dans la 1re ligne générée
+    Retourne None si la question n'a pas de référence.
+    """
+    if not case.get('reference_sql'):
+        return None
+    if not generated_sql:
+        return False
+
+    reference = _rows(db, case['reference_sql'])
+    try:
+        generated = _rows(db, generated_sql)
+    except Exception:
+        db.rollback()
+        return False
+
+    mode = case.get('check', 'exact')
+    if mode == 'value':
+        if not reference or not generated:
+            return not reference and not generated
+        expected = next(iter(reference[0]))
+        return expected in generated[0]
+    return _match_rows(reference, generated, exact=(mode == 'exact'))
+
+
+# === EXÉCUTION ===
+def run_case(case: Dict[str, Any], model: InstrumentedModel, eval_db) -> Dict[str, Any]:
+    """Fait passer une question dans le pipeline et mesure chaque étape."""
+    model.reset()
+    retriever = DataRetriever()
+    retriever.sql_gen = TimedSQLGenerator(model)
+    timing = instrument_db(retriever)
+
+    start = time.perf_counter()
+    try:
+        search_result = retriever.search_relevant_data(case['question'], case.get('history'))
+    except Exception as e:
+        search_result = {'success': False, 'error': f"{type(e).__name__}: {str(e)}", 'attempts': 0}
+    total_ms = (time.perf_counter() - start) * 1000
+
+    llm_ms = sum(c['latency_ms'] for c in model.calls)
+    recorded = [c['recorded_latency_ms'] for c in model.calls if c['recorded_latency_ms']]
+    sql_generation_ms = retriever.sql_gen.elapsed_ms
+    retriever.db.close()
+
+    if search_result.get('success'):
+        correct = check_result(eval_db, case, search_result.get('sql_raw'))
+    else:
+        correct = False if case.get('reference_sql') else None
+
+    return {
+        'id': case['id'],
+        'source': case.get('source'),
+        'question': case['question'],
+        'success': search_result.get('success', False),
+        'correct': correct,
+        'attempts': search_result.get('attempts', 0),
+        'retries': max(search_result.get('attempts', 0) - 1, 0),
+        'llm_calls': len(model.calls),
+        'prompt_tokens': sum(c['prompt_tokens'] for c in model.calls),
+        'output_tokens': sum(c['output_tokens'] for c in model.calls),
+        'row_count': search_result.get('row_count', 0),
+        'sql': search_result.get('sql_raw'),
+        'error': search_result.get('error'),
+        'llm_ms': round(llm_ms, 1),
+        'llm_recorded_ms': round(sum(recorded), 1) if recorded else None,
+        'sql_generation_ms': round(sql_generation_ms, 1),
+        'db_ms': round(timing['db_ms'], 1),
+        'format_ms': round(max(total_ms - sql_generation_ms - timing['db_ms'], 0.0), 1),
+        'total_ms': round(total_ms, 1)
+    }
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Percentile au rang le plus proche."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Agrégats du rapport: latences p50/p95, retries, tokens, exactitude."""
+    graded = [r for r in runs if r['correct'] is not None]
+    summary = {
+        'runs': len(runs),
+        'success_rate': round(sum(r['success'] for r in runs) / len(runs), 3) if runs else 0,
+        'first_try_rate': round(sum(r['success'] and r['attempts'] <= 1 for r in runs) / len(runs), 3) if runs else 0,
+        'accuracy': round(sum(r['correct'] for r in graded) / len(graded), 3) if graded else None,
+        'graded': len(graded),
+        'mean_retries': round(sum(r['retries'] for r in runs) / len(runs), 2) if runs else 0,
+        'llm_calls': sum(r['llm_calls'] for r in runs),
+        'prompt_tokens_total': sum(r['prompt_tokens'] for r in runs),
+        'prompt_tokens_mean': round(sum(r['prompt_tokens'] for r in runs) / len(runs), 1) if runs else 0,
+        'latency': {}
+    }
+    for stage in STAGES + ['llm_recorded_ms']:
+        values = [r[stage] for r in runs if r[stage] is not None]
+        if values:
+            summary['latency'][stage] = {
+                'p50': round(_percentile(values, 50), 1),
+                'p95': round(_percentile(values, 95), 1),
+                'max': round(max(values), 1)
+            }
+    return summary
+
+
+def print_report(runs: List[Dict[str, Any]], summary: Dict[str, Any]):
+    """Affiche le tableau des résultats dans le terminal."""
+    marks = {True: "✅", False: "❌", None: "—"}
+    print(f"\n{'ID':<30} {'OK':<3} {'Try':>3} {'Tok':>6} {'LLM ms':>8} {'DB ms':>7} {'Total':>8}")
+    print("-" * 72)
+    for r in runs:
+        print(f"{r['id']:<30} {marks[r['correct']]:<3} {r['attempts']:>3} {r['prompt_tokens']:>6} "
+              f"{r['llm_ms']:>8.1f} {r['db_ms']:>7.1f} {r['total_ms']:>8.1f}")
+    print("-" * 72)
+    print(f"Succès: {summary['success_rate']:.0%} | 1er essai: {summary['first_try_rate']:.0%} | "
+          f"Exactitude: {summary['accuracy'] if summary['accuracy'] is not None else 'n/a'} ({summary['graded']} notées) | "
+          f"Retries moyens: {summary['mean_retries']} | Tokens prompt: {summary['prompt_tokens_total']}")
+    for stage, stats in summary['latency'].items():
+        print(f"  {stage:<18} p50={stats['p50']:>8.1f}  p95={stats['p95']:>8.1f}  max={stats['max']:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai hors-ligne du pipeline NL → SQL")
+    parser.add_argument("--catalogue", default=DEFAULT_CATALOGUE, help="Fichier JSON des questions")
+    parser.add_argument("--only", help="IDs de questions à exécuter, séparés par des virgules")
+    parser.add_argument("--repeat", type=int, default=1, help="Nombre de passages du catalogue")
+    parser.add_argument("--output", default=DEFAULT_REPORT, help="Rapport JSON à écrire")
+    parser.add_argument("--restore", action="store_true", help="Restaurer la base depuis le backup avant de commencer")
+    parser.add_argument("--backup", default=DEFAULT_BACKUP, help="Chemin du fichier pg_restore")
+    args = parser.parse_args(argv)
+
+    if args.restore:
+        restore_database(args.backup)
+
+    with open(args.catalogue, encoding="utf-8") as f:
+        catalogue = json.load(f)
+    if args.only:
+        wanted = set(args.only.split(","))
+        catalogue = [c for c in catalogue if c['id'] in wanted]
+
+    base_model, model_name = get_llm_model()
+    model = InstrumentedModel(base_model)
+    eval_db = SessionLocal()
+
+    runs = []
+    try:
+        for _ in range(args.repeat):
+            for case in catalogue:
+                runs.append(run_case(case, model, eval_db))
+    finally:
+        eval_db.close()
+
+    summary = summarize(runs)
+    print_report(runs, summary)
+
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'model': model_name,
+        'backend': os.getenv("LLM_BACKEND", "gemini"),
+        'summary': summary,
+        'runs': runs
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    print(f"\n📄 Rapport écrit dans {args.output}")
+
+    return 0 if summary['success_rate'] == 1 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+# change_log.py - Lecture du journal des modifications pour les index du chatbot
+"""
+Le journal change_log est créé par l'API (change_feed.py): des triggers PostgreSQL
+y ajoutent une ligne (seq, table_name, row_id, op, xact_id) à chaque INSERT /
+UPDATE / DELETE. Les index en mémoire du chatbot (embeddings, BM25) s'en servent
+pour ne traiter que les lignes modifiées depuis leur dernier passage.
+
+La position lue est la même que celle du flux de l'API: plus grand xact_id sous
+le xmin du snapshot, pour ne jamais sauter une transaction validée en retard.
+"""
+
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+# Voir change_feed.py (API): toutes les transactions d'xact_id inférieur au xmin sont terminées
+WATERMARK_SQL = """
+SELECT COALESCE(MAX(xact_id), 0) FROM change_log
+WHERE xact_id < pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+"""
+
+
+def current_sequence(db: Session) -> Optional[int]:
+    """Position validée du journal (0 si vide, None si le journal n'existe pas: pas d'incrémental)."""
+    try:
+        return db.execute(text(WATERMARK_SQL)).scalar()
+    except Exception:
+        db.rollback()
+        return None
+
+
+def read_changed_rows(db: Session, tables: List[str], since: int) -> Optional[Dict[str, Any]]:
+    """
+    Lignes des `tables` modifiées depuis `since` (dernière opération par ligne).
+
+    Returns:
+        None si le journal n'existe pas, sinon dict avec 'last_seq', 'reset'
+        (True si le journal a été purgé après `since`: tout reconstruire) et
+        'changes' {table: {'upserts': [ids], 'deletes': [ids]}}
+    """
+    last_seq = current_sequence(db)
+    if last_seq is None:
+        return None
+    feed = {'last_seq': last_seq, 'reset': False, 'changes': {table: {'upserts': [], 'deletes': []} for table in tables}}
+    if last_seq <= since:
+        return feed
+
+    # Ligne repère de la purge: plus grand xact_id supprimé
+    purged_upto = db.execute(text("SELECT MAX(xact_id) FROM change_log WHERE table_name = '*'")).scalar()
+    if purged_upto is not None and since < purged_upto:
+        feed['reset'] = True
+        return feed
+
+    rows = db.execute(text("""
+        SELECT DISTINCT ON (table_name, row_id) table_name, row_id, op
+        FROM change_log
+        WHERE table_name = ANY(:tables) AND xact_id > :since AND xact_id <= :last_seq
+        ORDER BY table_name, row_id, seq DESC
+    """), {"tables": tables, "since": since, "last_seq": last_seq}).fetchall()
+    for table_name, row_id, op in rows:
+        feed['changes'][table_name]['upserts' if op == 'U' else 'deletes'].append(row_id)
+    return feed
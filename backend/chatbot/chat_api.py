@@ -0,0 +1,320 @@
+"""
+API HTTP headless du chatbot (FastAPI).
+
+Expose le pipeline de chat_engine sans Streamlit:
+- POST /chat            → réponse en Server-Sent Events (ou JSON si stream=false)
+- GET /chat/sessions/{id}    → mémoire conversationnelle d'une session
+- DELETE /chat/sessions/{id} → réinitialise une session
+- GET /metrics          → métriques Prometheus, GET /traces → dernières traces
+- GET /schema           → schéma lu dans le catalogue PostgreSQL (utilisé dans les prompts)
+
+La mémoire conversationnelle est stockée côté serveur, indexée par session_id,
+ce qui permet à d'autres outils de s'intégrer (et de faire des tests de charge).
+
+Lancement: uvicorn chat_api:app --host 0.0.0.0 --port 8001
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Optional, List, Dict, Any
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel
+
+from chat_engine import ChatEngine
+from data_retriever import DataRetriever
+from database import SessionLocal
+from keyword_index import keyword_index
+from schema_catalog import schema_catalog
+from text_retrieval import description_retriever
+from prompts import DASHBOARD_SYSTEM_PROMPT, build_dashboard_answer_prompt
+from tracing import tracer, metrics
+
+# Durée de vie d'une session inactive et nombre max de sessions gardées en mémoire
+SESSION_TTL_SECONDS = int(os.environ.get("CHAT_SESSION_TTL", "3600"))
+MAX_SESSIONS = int(os.environ.get("CHAT_MAX_SESSIONS", "1000"))
+
+app = FastAPI(title="Events Safety Chat API", version="1.0.0")
+
+
+# === SCHÉMAS ===
+class ChatRequest(BaseModel):
+    question: str
+    session_id: Optional[str] = None
+    stream: bool = True
+
+
+class ChatResponse(BaseModel):
+    session_id: str
+    response: str
+    sql: Optional[str] = None
+    row_count: int = 0
+    success: bool = False
+    attempts: int = 0
+    chart: Optional[Dict[str, Any]] = None
+
+
+class ChatSession(BaseModel):
+    session_id: str
+    history: List[Dict[str, Any]]
+    updated_at: float
+
+
+# === MÉMOIRE CONVERSATIONNELLE CÔTÉ SERVEUR ===
+class SessionStore:
+    """Historique des conversations indexé par session_id (TTL + taille bornée)."""
+
+    def __init__(self, ttl: int = SESSION_TTL_SECONDS, max_sessions: int = MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _purge(self):
+        """Supprime les sessions expirées puis les plus anciennes si trop nombreuses."""
+        now = time.time()
+        expired = [sid for sid, s in self._sessions.items() if now - s['updated_at'] > self.ttl]
+        for sid in expired:
+            del self._sessions[sid]
+
+        if len(self._sessions) > self.max_sessions:
+            oldest = sorted(self._sessions, key=lambda sid: self._sessions[sid]['updated_at'])
+            for sid in oldest[:len(self._sessions) - self.max_sessions]:
+                del self._sessions[sid]
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._purge()
+            return self._sessions.get(session_id)
+
+    def history(self, session_id: str) -> List[Dict[str, Any]]:
+        session = self.get(session_id)
+        return list(session['history']) if session else []
+
+    def save(self, session_id: str, history: List[Dict[str, Any]]):
+        with self._lock:
+            self._sessions[session_id] = {'history': history, 'updated_at': time.time()}
+            self._purge()
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+
+sessions = SessionStore()
+
+
+@app.on_event("startup")
+def setup_schema_catalog():
+    """Lit le schéma dans le catalogue PostgreSQL une fois au démarrage (mis en cache)."""
+    schema_catalog.get()
+
+
+@app.on_event("startup")
+def setup_description_search():
+    """Index plein texte des descriptions + chargement/synchronisation de l'index sémantique."""
+    description_retriever.start()
+
+
+@app.on_event("startup")
+def setup_keyword_index():
+    """Construit l'index BM25 du fallback (sinon construit à la première recherche de secours)."""
+    db = SessionLocal()
+    try:
+        keyword_index.sync(db)
+    except Exception as e:
+        print(f"⚠️ Impossible de construire l'index BM25: {str(e)}")
+    finally:
+        db.close()
+
+
+@app.on_event("shutdown")
+def stop_embedding_index():
+    if description_retriever.embeddings is not None:
+        description_retriever.embeddings.stop()
+
+
+def create_engine() -> ChatEngine:
+    """
+    Un moteur par requête: le DataRetriever porte une session SQLAlchemy qui
+    ne doit pas être partagée entre threads (fermée par l'appelant en fin de
+    requête, voir _close_engine). Le modèle Gemini, lui, est partagé.
+    """
+    return ChatEngine(
+        system_prompt=DASHBOARD_SYSTEM_PROMPT,
+        answer_prompt_builder=build_dashboard_answer_prompt,
+        max_chart_attempts=int(os.environ.get("CHAT_MAX_CHART_ATTEMPTS", "3")),
+        detect_general_questions=True,
+        retriever=DataRetriever()
+    )
+
+
+def _close_engine(engine: ChatEngine):
+    """Rend la connexion du DataRetriever au pool (idempotent)."""
+    engine.retriever.close()
+
+
+def _retrieval_summary(search_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Informations sur la requête SQL exposées au client."""
+    return {
+        'sql': search_result.get('sql_raw') or search_result.get('sql_used'),
+        'explanation': search_result.get('explanation'),
+        'row_count': search_result.get('row_count', 0),
+        'success': search_result.get('success', False),
+        'attempts': search_result.get('attempts', 0),
+        'is_general': search_result.get('is_general', False),
+        'error': search_result.get('error'),
+    }
+
+
+def _chart_payload(chart: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Sérialise la figure Plotly (JSON Plotly) si un graphique a été produit."""
+    if not chart['success'] or chart['figure'] is None:
+        return None
+    return {'figure': json.loads(chart['figure'].to_json()), 'attempts': chart['attempts']}
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Formate un évènement Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _stream_turn(engine: ChatEngine, session_id: str, question: str):
+    """
+    Générateur SSE: session → retrieval → token* → chart? → done.
+
+    Chaque morceau du flux peut être produit dans un thread différent: le span
+    racine est donc réactivé explicitement autour de chaque étape.
+    """
+    turn = engine.start_turn(question, ui="api")
+    turn.set(session_id=session_id)
+    yield _sse("session", {'session_id': session_id})
+
+    try:
+        with tracer.activate(turn):
+            history = sessions.history(session_id)
+            prepared_history = engine.prepare_history(history, question)
+            search_result = engine.retrieve(question, prepared_history)
+        yield _sse("retrieval", _retrieval_summary(search_result))
+
+        with tracer.activate(turn):
+            stream = engine.answer_stream(question, search_result)
+        chunks = []
+        for text in stream:
+            chunks.append(text)
+            yield _sse("token", {'text': text})
+        assistant_response = "".join(chunks)
+
+        with tracer.activate(turn):
+            chart = engine.build_chart(assistant_response, search_result.get('context', ''))
+        chart_payload = _chart_payload(chart)
+        if chart_payload:
+            yield _sse("chart", chart_payload)
+
+        sessions.save(session_id, engine.remember(history, question, search_result, assistant_response))
+        yield _sse("done", {'session_id': session_id, 'response': assistant_response})
+
+    except Exception as e:
+        turn.set(error=f"{type(e).__name__}: {str(e)}")
+        yield _sse("error", {'session_id': session_id, 'error': f"{type(e).__name__}: {str(e)}"})
+
+    finally:
+        turn.end()
+        _close_engine(engine)
+
+
+# === ENDPOINTS ===
+@app.post("/chat", response_model=ChatResponse)
+def chat(request: ChatRequest):
+    """Pose une question au chatbot. Réponse en SSE par défaut, JSON si stream=false."""
+    if not request.question.strip():
+        raise HTTPException(status_code=422, detail="Question vide")
+
+    session_id = request.session_id or uuid.uuid4().hex
+    engine = create_engine()
+
+    if request.stream:
+        # Le bloc finally du générateur ferme la session; la tâche de fond couvre
+        # un flux jamais démarré (client parti avant le premier octet)
+        return StreamingResponse(
+            _stream_turn(engine, session_id, request.question),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            background=BackgroundTask(_close_engine, engine)
+        )
+
+    try:
+        history = sessions.history(session_id)
+        turn = engine.run(request.question, history, ui="api")
+        sessions.save(session_id, turn['history'])
+    finally:
+        _close_engine(engine)
+
+    summary = _retrieval_summary(turn['search_result'])
+    return ChatResponse(
+        session_id=session_id,
+        response=turn['response'],
+        sql=summary['sql'],
+        row_count=summary['row_count'],
+        success=summary['success'],
+        attempts=summary['attempts'],
+        chart=_chart_payload(turn['chart'])
+    )
+
+
+@app.get("/chat/sessions/{session_id}", response_model=ChatSession)
+def read_session(session_id: str):
+    """Récupère la mémoire conversationnelle d'une session."""
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session non trouvée")
+    return ChatSession(session_id=session_id, history=session['history'], updated_at=session['updated_at'])
+
+
+@app.delete("/chat/sessions/{session_id}", status_code=204)
+def delete_session(session_id: str):
+    """Réinitialise la conversation d'une session."""
+    if not sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session non trouvée")
+    return None
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """Métriques du chatbot au format Prometheus (durées par étape, retries, lignes, prompts)."""
+    return metrics.render_prometheus()
+
+
+@app.get("/schema")
+def read_schema(refresh: bool = False):
+    """Schéma en cache (tables, colonnes, clés, index, lignes estimées, valeurs catégorielles)."""
+    if refresh:
+        schema_catalog.load()
+    return {"source": schema_catalog.source, "tables": schema_catalog.get(), "prompt": schema_catalog.render()}
+
+
+@app.get("/traces")
+def read_traces(limit: int = 20):
+    """Dernières traces complètes (arbre des spans de chaque tour)."""
+    return list(tracer.recent)[-limit:]
+
+
+@app.get("/")
+def root():
+    """Page d'accueil de l'API du chatbot."""
+    return {
+        "message": "Bienvenue sur l'API du chatbot Events Safety",
+        "endpoints": {
+            "chat": "/chat",
+            "sessions": "/chat/sessions/{session_id}",
+            "metrics": "/metrics",
+            "traces": "/traces",
+            "schema": "/schema",
+            "docs": "/docs"
+        }
+    }
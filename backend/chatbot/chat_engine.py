@@ -0,0 +1,487 @@
+"""
+Moteur du chatbot indépendant de l'interface.
+
+Pipeline d'un tour de conversation:
+    question → SQL (DataRetriever) → lignes → réponse LLM → graphique Plotly optionnel
+
+Utilisé par les deux front ends Streamlit (`chatbot_app.py` et l'onglet
+"Assistant IA" du dashboard). Les imports lourds (plotly, pandas) et le
+modèle Gemini sont chargés une seule fois par processus (état "chaud" au niveau
+du module), pas à chaque rerun de Streamlit.
+
+Point unique pour ajouter cache et instrumentation: la classe `ChatEngine`
+(spans et métriques par étape: voir tracing.py).
+"""
+
+import re
+import json
+from typing import Optional, Dict, Any, List, Callable
+
+from dotenv import load_dotenv
+import plotly
+import plotly.express as px
+import plotly.graph_objects as go
+import pandas as pd
+import numpy as np
+
+from data_retriever import data_retriever
+from llm_backend import get_llm_model
+from memory_utils import prepare_context_for_sql
+from tracing import tracer, metrics, record_prompt
+from prompts import (
+    SYSTEM_PROMPT,
+    DASHBOARD_SYSTEM_PROMPT,
+    build_answer_prompt,
+    build_dashboard_answer_prompt,
+    build_general_answer_prompt,
+    build_chart_correction_prompt,
+)
+
+load_dotenv()
+
+# Taille de la mémoire conversationnelle (échanges gardés / envoyés au SQL)
+MAX_HISTORY = 5
+SQL_HISTORY_WINDOW = 3
+
+
+# --- Modèle Gemini partagé (chargé une fois par processus) ---
+def get_gemini_model():
+    """
+    Retourne le modèle LLM partagé (model, model_name).
+    Gemini par défaut, ou backend record/replay selon LLM_BACKEND (voir llm_backend.py).
+    """
+    return get_llm_model()
+
+
+# --- Fonction d'exécution sécurisée du code Plotly ---
+FORBIDDEN_PATTERNS = [
+    r'\bos\b', r'\bsys\b', r'\bsubprocess\b', r'\beval\b',
+    r'\bexec\b', r'\b__import__\b', r'\bopen\b', r'\bfile\b',
+    r'\bcompile\b', r'\bglobals\b', r'\blocals\b'
+]
+
+# Imports autorisés dans le code généré
+SAFE_IMPORTS = {
+    'plotly': plotly,
+    'px': px,
+    'go': go,
+    'pd': pd,
+    'np': np,
+    'json': json
+}
+
+# Builtins étendus disponibles dans le namespace sécurisé
+SAFE_BUILTINS = {
+    'range': range, 'len': len, 'str': str, 'int': int, 'float': float,
+    'list': list, 'dict': dict, 'tuple': tuple, 'set': set,
+    'zip': zip, 'enumerate': enumerate, 'min': min, 'max': max,
+    'sum': sum, 'abs': abs, 'round': round, 'sorted': sorted,
+    'reversed': reversed, 'map': map, 'filter': filter,
+    'any': any, 'all': all, 'isinstance': isinstance, 'type': type,
+    'bool': bool, 'True': True, 'False': False, 'None': None,
+}
+
+
+def execute_plotly_code_safely(code: str, data_context: dict) -> tuple:
+    """
+    Exécute du code Python Plotly dans un environnement sécurisé.
+
+    Args:
+        code: Code Python à exécuter
+        data_context: Dictionnaire contenant les données (df, etc.)
+
+    Returns:
+        (success: bool, result: plotly.graph_objs.Figure or error message)
+    """
+    for pattern in FORBIDDEN_PATTERNS:
+        if re.search(pattern, code, re.IGNORECASE):
+            return False, f"Code interdit détecté: {pattern}"
+
+    safe_namespace = {
+        '__builtins__': dict(SAFE_BUILTINS),
+        **SAFE_IMPORTS,
+        **data_context
+    }
+
+    try:
+        exec(code, safe_namespace)
+
+        if 'fig' in safe_namespace:
+            return True, safe_namespace['fig']
+        else:
+            return False, "Aucune variable 'fig' trouvée dans le code"
+
+    except Exception as e:
+        return False, f"Erreur d'exécution: {str(e)}"
+
+
+def extract_code_from_response(text: str) -> str:
+    """Extrait le code Python d'une réponse Gemini et nettoie les imports."""
+    patterns = [
+        r'```python\n(.*?)```',
+        r'```python\s+(.*?)```',
+        r'```py\n(.*?)```',
+        r'```\n(.*?)```',
+    ]
+
+    code = ""
+    for pattern in patterns:
+        match = re.search(pattern, text, re.DOTALL)
+        if match:
+            code = match.group(1).strip()
+            # Vérifier que c'est bien du code Python (contient fig)
+            if 'fig' in code or 'px.' in code or 'go.' in code:
+                break
+
+    # Si aucun bloc trouvé mais le texte contient du code apparent
+    if not code and ('fig =' in text or 'px.' in text or 'go.' in text):
+        code = text.strip()
+
+    if not code:
+        return ""
+
+    # Nettoyer le code: retirer les imports interdits (modules déjà disponibles)
+    cleaned_lines = []
+    removed_imports = []
+
+    for line in code.split('\n'):
+        line_stripped = line.strip()
+        if (line_stripped.startswith('import ') or
+            line_stripped.startswith('from ') or
+            ('import' in line_stripped and ('plotly' in line_stripped or 'pandas' in line_stripped or 'numpy' in line_stripped))):
+            removed_imports.append(line_stripped)
+            continue
+        cleaned_lines.append(line)
+
+    if removed_imports:
+        print(f"🧹 {len(removed_imports)} import(s) automatiquement retirés (déjà disponibles)")
+
+    return '\n'.join(cleaned_lines).strip()
+
+
+def strip_code_blocks(text: str, python_only: bool = False) -> str:
+    """Retire les blocs de code d'une réponse pour n'afficher que le texte."""
+    text_only = re.sub(r'```python.*?```', '', text, flags=re.DOTALL)
+    if not python_only:
+        text_only = re.sub(r'```.*?```', '', text_only, flags=re.DOTALL)
+    return text_only.strip()
+
+
+def parse_context_to_dataframe(context: str) -> pd.DataFrame:
+    """
+    Reconstruit un DataFrame à partir du contexte texte du data_retriever.
+    Format: "### Résultat X:\\n  - colonne: valeur\\n  - colonne: valeur"
+    """
+    if not context or context == "Aucune donnée":
+        return pd.DataFrame()
+
+    data_rows = []
+    current_row = {}
+
+    for line in context.strip().split('\n'):
+        line = line.strip()
+        if line.startswith('### Résultat'):
+            # Nouveau résultat, sauvegarder le précédent
+            if current_row:
+                data_rows.append(current_row)
+            current_row = {}
+        elif line.startswith('- ') or line.startswith('•'):
+            key_value = line.lstrip('- •').strip()
+            if ':' in key_value:
+                key, value = key_value.split(':', 1)
+                current_row[key.strip()] = value.strip()
+
+    if current_row:
+        data_rows.append(current_row)
+
+    if not data_rows:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(data_rows)
+
+    # Convertir les types numériques si possible
+    for col in df.columns:
+        try:
+            df[col] = pd.to_numeric(df[col])
+        except (ValueError, TypeError):
+            pass
+
+    return df
+
+
+def has_valid_data(context: str) -> bool:
+    """Vérifie que le contexte contient des données exploitables pour un graphique."""
+    return bool(context and
+                context.strip() and
+                context != "Aucune donnée" and
+                len(context.strip()) > 20)
+
+
+def is_general_question(question: str) -> bool:
+    """Détecte si la question est générale (définition, abréviation, concept) et ne nécessite pas de requête SQL."""
+    question_lower = question.lower()
+
+    # Mots-clés de questions générales
+    general_keywords = [
+        "c'est quoi", "qu'est-ce que", "qu'est ce que", "que signifie",
+        "définition de", "définir", "explique", "expliquer",
+        "ça veut dire quoi", "signification de", "qu'est-ce qu'un",
+        "comment définir", "que veut dire"
+    ]
+
+    # Abréviations communes EHS
+    ehs_abbreviations = [
+        "ehs", "hse", "ppe", "epi", "loto", "cnesst", "csst",
+        "osha", "iso", "sds", "fds", "msds", "jha", "jsa",
+        "hazmat", "ria", "ppr", "permis"
+    ]
+
+    has_general_keyword = any(keyword in question_lower for keyword in general_keywords)
+    mentions_abbreviation = any(abbr in question_lower for abbr in ehs_abbreviations)
+
+    # Mots-clés qui indiquent qu'on veut des données de la BDD
+    data_keywords = [
+        "liste", "combien", "nombre", "total", "derniers", "récents",
+        "événement", "incident", "risque", "mesure", "personne",
+        "dans la base", "enregistrés", "trouvé", "affiche", "montre-moi"
+    ]
+    has_data_keyword = any(keyword in question_lower for keyword in data_keywords)
+
+    # Question générale si : mots-clés généraux OU abréviation ET PAS de demande de données
+    return (has_general_keyword or mentions_abbreviation) and not has_data_keyword
+
+
+class ChatEngine:
+    """Pipeline question → SQL → données → réponse → graphique, sans dépendance UI."""
+
+    def __init__(self,
+                 system_prompt: str = SYSTEM_PROMPT,
+                 answer_prompt_builder: Callable[[str, str, str, str], str] = build_answer_prompt,
+                 max_chart_attempts: int = 5,
+                 detect_general_questions: bool = False,
+                 retriever=None):
+        self.system_prompt = system_prompt
+        self.answer_prompt_builder = answer_prompt_builder
+        self.max_chart_attempts = max_chart_attempts
+        self.detect_general_questions = detect_general_questions
+        self.retriever = retriever or data_retriever
+
+    @property
+    def model(self):
+        return get_gemini_model()[0]
+
+    @property
+    def model_name(self) -> str:
+        return get_gemini_model()[1]
+
+    # --- Étape 1: mémoire + récupération des données ---
+    def prepare_history(self, history: List[Dict[str, Any]], question: str) -> List[Dict[str, Any]]:
+        """Prépare la mémoire envoyée au générateur SQL (3 derniers échanges max)."""
+        with tracer.span("prepare_context", history_size=len(history)):
+            return prepare_context_for_sql(history[-SQL_HISTORY_WINDOW:], question)
+
+    def retrieve(self, question: str, prepared_history: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Traduit la question en SQL et exécute la requête.
+
+        Returns:
+            dict du data_retriever ('context', 'sql_used', 'success', ...) +
+            'is_general' et 'schema'
+        """
+        if self.detect_general_questions and is_general_question(question):
+            metrics.inc('chat_general_questions_total')
+            return {
+                'context': "Question générale ne nécessitant pas de données de la base.",
+                'schema': "",
+                'sql_used': None,
+                'explanation': "",
+                'success': False,
+                'row_count': 0,
+                'attempts': 0,
+                'is_general': True
+            }
+
+        search_result = self.retriever.search_relevant_data(question, prepared_history)
+        search_result['schema'] = self.retriever.get_database_schema()
+        search_result['is_general'] = False
+        return search_result
+
+    # --- Étape 2: réponse du LLM ---
+    def build_prompt(self, question: str, search_result: Dict[str, Any]) -> str:
+        """Construit le prompt de réponse selon le type de question."""
+        if search_result.get('is_general'):
+            return build_general_answer_prompt(self.system_prompt, question)
+
+        return self.answer_prompt_builder(
+            self.system_prompt,
+            search_result.get('schema', ''),
+            search_result.get('context', 'Aucune donnée'),
+            question
+        )
+
+    def answer(self, question: str, search_result: Dict[str, Any]) -> str:
+        """Génère la réponse textuelle du LLM à partir des données récupérées."""
+        # Requête prédéfinie avec réponse mise en forme (CHAT_TEMPLATED_ANSWERS): pas d'appel au LLM
+        if search_result.get('templated_answer'):
+            return search_result['templated_answer']
+        with tracer.span("answer_llm") as span:
+            prompt = self.build_prompt(question, search_result)
+            record_prompt("answer", prompt)
+            response = self.model.generate_content(prompt)
+            span.set(response_chars=len(response.text))
+            return response.text
+
+    def answer_stream(self, question: str, search_result: Dict[str, Any]):
+        """
+        Génère la réponse du LLM morceau par morceau (pour le streaming SSE).
+
+        Le span "answer_llm" est créé à l'appel (rattaché au span courant) et
+        terminé quand le flux est épuisé: les morceaux peuvent être consommés
+        depuis d'autres threads.
+        """
+        if search_result.get('templated_answer'):
+            return iter([search_result['templated_answer']])
+        span = tracer.start_span("answer_llm", stream=True)
+        with tracer.activate(span):
+            prompt = self.build_prompt(question, search_result)
+            record_prompt("answer", prompt)
+
+        def chunks():
+            size = 0
+            try:
+                for chunk in self.model.generate_content(prompt, stream=True):
+                    text = getattr(chunk, 'text', '')
+                    if text:
+                        size += len(text)
+                        yield text
+            except Exception as e:
+                span.set(error=f"{type(e).__name__}: {str(e)}")
+                raise
+            finally:
+                span.set(response_chars=size)
+                span.end()
+
+        return chunks()
+
+    # --- Étape 3: graphique optionnel ---
+    def build_chart(self, assistant_response: str, context: str) -> Dict[str, Any]:
+        """
+        Exécute le code Plotly contenu dans la réponse (avec corrections par le LLM).
+
+        Returns:
+            dict avec 'requested' (bloc de code présent), 'has_data', 'code',
+            'df', 'figure', 'success', 'attempts', 'errors', 'text_only'
+        """
+        chart = {
+            'requested': "```" in assistant_response,
+            'has_data': has_valid_data(context),
+            'code': "",
+            'df': None,
+            'figure': None,
+            'success': False,
+            'attempts': 0,
+            'errors': [],
+            'text_only': strip_code_blocks(assistant_response),
+        }
+
+        if not chart['requested'] or not chart['has_data']:
+            return chart
+
+        code = extract_code_from_response(assistant_response)
+        chart['code'] = code
+        if not code:
+            return chart
+
+        try:
+            with tracer.span("parse_dataframe") as span:
+                df = parse_context_to_dataframe(context)
+                span.set(rows=len(df))
+        except Exception as e:
+            chart['errors'].append(f"Erreur lors du parsing des données: {str(e)}")
+            df = pd.DataFrame()
+        chart['df'] = df
+
+        current_code = code
+        for attempt in range(1, self.max_chart_attempts + 1):
+            chart['attempts'] = attempt
+            with tracer.span("chart_execute", attempt=attempt) as span:
+                success_code, result = execute_plotly_code_safely(current_code, {'df': df})
+                span.set(success=success_code)
+
+            if success_code and result is not None and hasattr(result, 'to_html'):
+                chart['success'] = True
+                chart['figure'] = result
+                chart['code'] = current_code
+                chart['text_only'] = strip_code_blocks(assistant_response, python_only=True)
+                break
+
+            chart['errors'].append(str(result))
+            if attempt >= self.max_chart_attempts:
+                break
+
+            # Échec - demander une correction au LLM
+            columns = list(df.columns) if df is not None and not df.empty else "DataFrame vide"
+            try:
+                with tracer.span("chart_correction", attempt=attempt):
+                    prompt = build_chart_correction_prompt(current_code, result, columns)
+                    record_prompt("chart_correction", prompt)
+                    correction = self.model.generate_content(prompt)
+                current_code = extract_code_from_response(correction.text)
+                chart['code'] = current_code
+            except Exception as e:
+                chart['errors'].append(f"Erreur lors de la correction: {str(e)}")
+                break
+
+        metrics.observe('chat_chart_attempts', chart['attempts'])
+        return chart
+
+    # --- Mémoire conversationnelle ---
+    def remember(self, history: List[Dict[str, Any]], question: str,
+                 search_result: Dict[str, Any], assistant_response: str) -> List[Dict[str, Any]]:
+        """Ajoute l'échange à l'historique et garde les MAX_HISTORY derniers."""
+        context = search_result.get('context', '')
+        history = history + [{
+            "question": question,
+            "sql": search_result.get('sql_used') or "",
+            "result": context[:800] if context else "",
+            "assistant_response": assistant_response[:300]
+        }]
+        return history[-MAX_HISTORY:]
+
+    # --- Traces ---
+    def start_turn(self, question: str, **attributes):
+        """Crée le span racine d'un tour de chat (non activé, voir tracer.activate)."""
+        metrics.inc('chat_turns_total', **attributes)
+        return tracer.start_span("chat_turn", question_chars=len(question), **attributes)
+
+    def trace_turn(self, question: str, **attributes):
+        """Span racine d'un tour de chat, à utiliser en `with` autour des étapes."""
+        return tracer.scope(self.start_turn(question, **attributes))
+
+    # --- Tour complet (usage headless) ---
+    def run(self, question: str, history: Optional[List[Dict[str, Any]]] = None, **trace_attributes) -> Dict[str, Any]:
+        """Exécute un tour complet et retourne la réponse, le graphique et la nouvelle mémoire."""
+        history = history or []
+        with self.trace_turn(question, **trace_attributes):
+            prepared_history = self.prepare_history(history, question)
+            search_result = self.retrieve(question, prepared_history)
+            assistant_response = self.answer(question, search_result)
+            chart = self.build_chart(assistant_response, search_result.get('context', ''))
+
+        return {
+            'question': question,
+            'search_result': search_result,
+            'response': assistant_response,
+            'chart': chart,
+            'history': self.remember(history, question, search_result, assistant_response)
+        }
+
+
+# Instances partagées par les front ends
+chat_engine = ChatEngine()
+dashboard_chat_engine = ChatEngine(
+    system_prompt=DASHBOARD_SYSTEM_PROMPT,
+    answer_prompt_builder=build_dashboard_answer_prompt,
+    max_chart_attempts=1,
+    detect_general_questions=True
+)
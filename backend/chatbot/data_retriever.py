@@ -6,9 +6,16 @@ et les formater pour le contexte RAG du LLM.
 
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from database import SessionLocal
+from database import SessionLocal, replica_monitor
 import models
 from sql_generator import sql_generator
+from schema_catalog import schema_catalog
+from example_store import example_store, is_reusable
+from intents import match_intent, render_answer, TEMPLATED_ANSWERS
+from keyword_index import keyword_index, format_hits
+from text_retrieval import description_retriever, is_semantic_question, format_documents
+from tracing import tracer, metrics
+import prepared_statements
 import traceback
 
 
@@ -19,69 +26,50 @@ class DataRetriever:
         self.db = SessionLocal()
         self.sql_gen = sql_generator
     
-    def __del__(self):
-        """Ferme la connexion à la DB."""
+    def close(self):
+        """Ferme la session (la connexion retourne au pool)."""
         if hasattr(self, 'db'):
             self.db.close()
     
+    def __del__(self):
+        """Ferme la connexion à la DB."""
+        self.close()
+    
     def get_database_schema(self) -> str:
-        """Retourne une description du schéma de la base de données."""
-        schema = """
-        ## Schéma de la base de données:
-        
-        ### Table: person
-        - person_id (Integer, PK)
-        - matricule (String)
-        - name (String)
-        - family_name (String)
-        - role (String)
-        
-        ### Table: organizational_unit
-        - unit_id (Integer, PK)
-        - identifier (String)
-        - name (String)
-        - location (String)
-        
-        ### Table: event
-        - event_id (Integer, PK)
-        - declared_by_id (Integer, FK -> person)
-        - description (Text)
-        - start_datetime (Text)
-        - end_datetime (Text)
-        - organizational_unit_id (Integer, FK -> organizational_unit)
-        - type (String)
-        - classification (String)
-        
-        ### Table: risk
-        - risk_id (Integer, PK)
-        - name (String)
-        - gravity (String)
-        - probability (String)
-        
-        ### Table: corrective_measure
-        - measure_id (Integer, PK)
-        - name (String)
-        - description (Text)
-        - owner_id (Integer, FK -> person)
-        - implementation_date (Text)
-        - cost (Float)
-        - organizational_unit_id (Integer, FK -> organizational_unit)
-        
-        ### Table: event_employee (liaison)
-        - event_id (FK -> event)
-        - person_id (FK -> person)
-        
-        ### Table: event_risk (liaison)
-        - event_id (FK -> event)
-        - risk_id (FK -> risk)
-        
-        ### Table: event_corrective_measure (liaison)
-        - event_id (FK -> event)
-        - measure_id (FK -> corrective_measure)
-        """
-        return schema
+        """Retourne une description du schéma de la base de données (catalogue PostgreSQL en cache)."""
+        return schema_catalog.render(title="## Schéma de la base de données:")
     
     def search_relevant_data(self, query: str, conversation_history: list = None) -> dict:
+        """
+        Recherche les données pertinentes (voir _search_relevant_data) dans un span
+        "retrieval" et enregistre tentatives, retries et nombre de lignes.
+        Pour les questions sur le contenu des descriptions (ou si le SQL a échoué),
+        les descriptions trouvées par recherche plein texte/sémantique sont ajoutées au contexte.
+        """
+        # Nouvelle transaction par question, sur le réplica s'il est à jour (voir database.py)
+        self.db.close()
+        self.db.bind = replica_monitor.read_engine()
+        try:
+            with tracer.span("retrieval") as span:
+                span.set(replica=self.db.bind is not replica_monitor.primary)
+                result = self._intent_search(query, conversation_history) or \
+                    self._search_relevant_data(query, conversation_history)
+                if is_semantic_question(query) or not result.get('success', False):
+                    self._merge_descriptions(query, result)
+                attempts = result.get('attempts', 0)
+                span.set(attempts=attempts, success=result.get('success', False), row_count=result.get('row_count', 0),
+                         documents=result.get('document_count', 0), intent=result.get('intent'))
+                metrics.observe('chat_sql_attempts', attempts)
+                if attempts > 1:
+                    metrics.inc('chat_sql_retries_total', attempts - 1)
+                return result
+        finally:
+            # Lecture seule: fin de transaction et connexion rendue au pool entre deux questions
+            # (pas de connexion "idle in transaction", indispensable derrière PgBouncer)
+            self.db.rollback()
+            self.db.close()
+    
+    def _search_relevant_data(self, query: str, conversation_history: list = None) -> dict:
         """
         Recherche les données pertinentes dans la DB en fonction de la requête.
         Utilise le SQL Generator pour traduire la question en SQL.
@@ -105,7 +93,9 @@ class DataRetriever:
                     error_context = f"\n\n**ERREUR PRÉCÉDENTE (tentative {attempt}):**\n{last_error}\n\n**CORRIGE cette erreur dans ta nouvelle requête.**"
                 
                 # Étape 1: Générer la requête SQL à partir de la question
-                sql_result = self.sql_gen.generate_sql_query(query + error_context, conversation_history)
+                with tracer.span("sql_generation", attempt=attempt + 1) as span:
+                    sql_result = self.sql_gen.generate_sql_query(query + error_context, conversation_history)
+                    span.set(success=sql_result['success'])
                 
                 if not sql_result['success']:
                     if attempt == max_retries - 1:
@@ -142,8 +132,11 @@ class DataRetriever:
                 print(f"\n🔍 DEBUG - Tentative {attempt + 1}/{max_retries}")
                 print(f"📝 SQL à exécuter:\n{sql_query}\n")
                 
-                result = self.db.execute(text(sql_query))
-                rows = result.fetchall()
+                with tracer.span("db_execute", attempt=attempt + 1) as span:
+                    result = prepared_statements.execute(self.db, sql_query)
+                    rows = result.fetchall()
+                    span.set(row_count=len(rows))
+                metrics.observe('chat_rows_returned', len(rows))
                 
                 print(f"✅ Requête réussie - {len(rows)} résultat(s)\n")
                 
@@ -159,30 +152,14 @@ class DataRetriever:
                         'attempts': attempt + 1
                     }
                 
-                # Formater les résultats en texte structuré
-                context_lines = [f"## Résultats de la requête ({len(rows)} ligne(s)):\n"]
-                
-                # Récupérer les noms de colonnes
-                if hasattr(result, 'keys'):
-                    columns = result.keys()
-                else:
-                    columns = [f"col_{i}" for i in range(len(rows[0]))]
-                
-                # Formater chaque ligne
-                for i, row in enumerate(rows[:50], 1):  # Limiter à 50 résultats max
-                    context_lines.append(f"### Résultat {i}:")
-                    row_dict = dict(zip(columns, row))
-                    for key, value in row_dict.items():
-                        if value is not None:
-                            context_lines.append(f"  - {key}: {value}")
-                    context_lines.append("")
+                with tracer.span("format_context", row_count=len(rows)):
+                    columns = result.keys() if hasattr(result, 'keys') else [f"col_{i}" for i in range(len(rows[0]))]
+                    context = self._format_rows(rows, columns)
                 
-                if len(rows) > 50:
-                    context_lines.append(f"\n⚠️ {len(rows) - 50} résultats supplémentaires non affichés.")
-                
-                # Succès ! Retourner les résultats
+                # Succès ! Mémoriser l'exemple pour les prochains prompts, puis retourner les résultats
+                example_store.record(query, sql_query, len(rows), attempt + 1)
                 return {
-                    'context': "\n".join(context_lines),
+                    'context': context,
                     'sql_used': sql_formatted,
                     'sql_raw': sql_query,
                     'explanation': explanation,
@@ -192,6 +169,8 @@ class DataRetriever:
                 }
                 
             except Exception as e:
+                # Transaction en échec annulée: prochain essai (ou recherche dans les descriptions) sur une transaction saine
+                self.db.rollback()
                 # Enregistrer l'erreur pour le prochain essai
                 last_error = f"{type(e).__name__}: {str(e)}"
                 
@@ -225,49 +204,93 @@ class DataRetriever:
             'attempts': max_retries
         }
     
+    def _intent_search(self, query: str, conversation_history: list = None):
+        """
+        Chemin rapide: question fréquente reconnue (voir intents.py) → requête
+        paramétrée exécutée directement, sans génération SQL par le LLM.
+        Retourne None si aucune intention ne correspond ou si la requête échoue.
+        """
+        # Les questions de suivi (« et ses risques ? ») passent par le LLM, qui voit l'historique
+        if conversation_history and not is_reusable(query):
+            return None
+        with tracer.span("intent_match") as span:
+            intent = match_intent(query)
+            span.set(intent=intent['intent'] if intent else None)
+        if intent is None:
+            return None
+        
+        try:
+            with tracer.span("db_execute", intent=intent['intent']) as span:
+                result = prepared_statements.execute(self.db, intent['sql'], intent['params'])
+                rows = result.fetchall()
+                columns = list(result.keys())
+                span.set(row_count=len(rows))
+        except Exception as e:
+            self.db.rollback()
+            print(f"⚠️ Requête de l'intention '{intent['intent']}' en échec, génération SQL: {str(e)}")
+            return None
+        metrics.observe('chat_rows_returned', len(rows))
+        metrics.inc('chat_intent_hits_total', intent=intent['intent'])
+        print(f"🧭 Intention '{intent['intent']}' ({intent['slots']}) - {len(rows)} résultat(s)")
+        
+        response = {
+            'context': self._format_rows(rows, columns) if rows else "Aucun résultat trouvé pour cette requête.",
+            'sql_used': self.sql_gen.format_sql_pretty(intent['sql']),
+            'sql_raw': intent['sql'],
+            'explanation': f"Requête prédéfinie ({intent['intent']})",
+            'success': True,
+            'row_count': len(rows),
+            'attempts': 0,
+            'intent': intent['intent'],
+        }
+        if TEMPLATED_ANSWERS:
+            response['templated_answer'] = render_answer(intent['title'], columns, rows)
+        return response
+    
+    @staticmethod
+    def _format_rows(rows, columns) -> str:
+        """Résultats en texte structuré pour le contexte (50 lignes max)."""
+        context_lines = [f"## Résultats de la requête ({len(rows)} ligne(s)):\n"]
+        for i, row in enumerate(rows[:50], 1):
+            context_lines.append(f"### Résultat {i}:")
+            for key, value in zip(columns, row):
+                if value is not None:
+                    context_lines.append(f"  - {key}: {value}")
+            context_lines.append("")
+        if len(rows) > 50:
+            context_lines.append(f"\n⚠️ {len(rows) - 50} résultats supplémentaires non affichés.")
+        return "\n".join(context_lines)
+    
+    def _merge_descriptions(self, query: str, result: dict):
+        """Ajoute au contexte les descriptions d'événements/mesures pertinentes pour la question."""
+        try:
+            documents = description_retriever.search(self.db, query)
+        except Exception as e:
+            self.db.rollback()
+            print(f"⚠️ Recherche dans les descriptions impossible: {str(e)}")
+            return
+        if documents:
+            result['context'] = f"{result.get('context') or ''}\n\n{format_documents(documents)}".strip()
+            result['document_count'] = len(documents)
+    
     def _fallback_search(self, query: str) -> str:
         """
-        Méthode de recherche basique (fallback) si la génération SQL échoue.
+        Recherche de secours si la génération SQL échoue: top-K des événements,
+        risques, mesures et personnes classés par BM25 (voir keyword_index.py).
         """
         context = []
-        query_lower = query.lower()
         
         try:
-            # Recherche dans les événements
-            if any(word in query_lower for word in ['événement', 'event', 'incident', 'accident', 'récent']):
-                events = self.db.query(models.Event).limit(10).all()
-                if events:
-                    context.append("### Événements récents:")
-                    for event in events:
-                        context.append(f"- ID {event.event_id}: {event.description} "
-                                     f"(Type: {event.type}, Classification: {event.classification})")
-            
-            # Recherche dans les risques
-            if any(word in query_lower for word in ['risque', 'risk', 'danger', 'gravité']):
-                risks = self.db.query(models.Risk).limit(10).all()
-                if risks:
-                    context.append("\n### Risques identifiés:")
-                    for risk in risks:
-                        context.append(f"- {risk.name} (Gravité: {risk.gravity}, "
-                                     f"Probabilité: {risk.probability})")
-            
-            # Recherche dans les mesures correctives
-            if any(word in query_lower for word in ['mesure', 'correction', 'action', 'prévention']):
-                measures = self.db.query(models.CorrectiveMeasure).limit(10).all()
-                if measures:
-                    context.append("\n### Mesures correctives:")
-                    for measure in measures:
-                        context.append(f"- {measure.name}: {measure.description} "
-                                     f"(Coût: {measure.cost if measure.cost else 'N/A'})")
+            # Les tentatives SQL ont pu laisser la transaction en échec
+            self.db.rollback()
             
-            # Recherche dans les personnes
-            if any(word in query_lower for word in ['personne', 'employé', 'responsable', 'auteur', 'impliqué']):
-                persons = self.db.query(models.Person).limit(10).all()
-                if persons:
-                    context.append("\n### Personnes:")
-                    for person in persons:
-                        context.append(f"- {person.name} {person.family_name} "
-                                     f"(Matricule: {person.matricule}, Rôle: {person.role})")
+            # Documents les plus pertinents (BM25 en mémoire, sans appel LLM)
+            with tracer.span("fallback_search") as span:
+                keyword_index.sync(self.db)
+                hits = keyword_index.search(query)
+                span.set(hits=len(hits))
+            if hits:
+                context.append(format_hits(hits))
             
             # Si aucune donnée pertinente n'a été trouvée, on récupère un aperçu général
             if not context:
@@ -0,0 +1,326 @@
+# embedding_index.py - Index d'embeddings incrémental des descriptions
+"""
+Index sémantique de event.description et corrective_measure.description,
+persisté sur disque et maintenu incrémentalement.
+
+Fichiers (CHAT_EMBEDDING_DIR):
+- vectors.npy: matrice float32 (n × d) des embeddings normalisés, ouverte en mmap
+  au démarrage (chargement O(1), les pages sont lues à la demande)
+- keys.npy: int64 (n × 3) → (code source, id, hash du texte)
+- meta.json: encodeur, dernière position du change_log intégrée
+
+Un thread lit le change_log (triggers PostgreSQL posés par l'API sur chaque
+INSERT / UPDATE / DELETE) et n'encode que les descriptions nouvelles ou dont le
+texte a changé, par lots. Les modifications restent en mémoire (delta) et sont
+fusionnées dans les fichiers (compaction) au-delà de CHAT_EMBEDDING_COMPACT_AFTER
+lignes ou toutes les CHAT_EMBEDDING_COMPACT_SECONDS.
+
+Encodeurs (CHAT_EMBEDDINGS):
+- "local": sentence-transformers sur CPU (pip install sentence-transformers)
+- "gemini": API d'embeddings Gemini
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import List, Dict, Tuple, Optional
+
+import numpy as np
+from sqlalchemy import text
+
+from change_log import current_sequence, read_changed_rows
+from tracing import tracer
+
+# Encodeur: "off" (défaut), "local" ou "gemini"
+ENCODER = os.environ.get("CHAT_EMBEDDINGS", "off").lower()
+LOCAL_MODEL = os.environ.get("CHAT_EMBEDDING_LOCAL_MODEL", "paraphrase-multilingual-MiniLM-L12-v2")
+GEMINI_MODEL = os.environ.get("CHAT_EMBEDDING_MODEL", "models/text-embedding-004")
+EMBEDDING_BATCH = int(os.environ.get("CHAT_EMBEDDING_BATCH", "64"))
+INDEX_DIR = os.environ.get("CHAT_EMBEDDING_DIR", "embedding_index")
+SYNC_SECONDS = int(os.environ.get("CHAT_EMBEDDING_SYNC_SECONDS", "30"))
+COMPACT_AFTER = int(os.environ.get("CHAT_EMBEDDING_COMPACT_AFTER", "500"))
+COMPACT_SECONDS = int(os.environ.get("CHAT_EMBEDDING_COMPACT_SECONDS", "600"))
+
+# Source → (table SQL, clé primaire, code dans keys.npy)
+INDEXED_TABLES = {
+    "event": ("event", "event_id", 0),
+    "measure": ("corrective_measure", "measure_id", 1),
+}
+SOURCE_BY_CODE = {code: source for source, (_, _, code) in INDEXED_TABLES.items()}
+SOURCE_BY_TABLE = {table: source for source, (table, _, _) in INDEXED_TABLES.items()}
+
+
+def text_hash(value: str) -> int:
+    """Hash 64 bits du texte (détecte les descriptions réellement modifiées)."""
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return (matrix / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+# === ENCODEURS ===
+class LocalEncoder:
+    """Modèle sentence-transformers exécuté sur CPU (dépendance optionnelle)."""
+
+    def __init__(self, model_name: str = LOCAL_MODEL):
+        from sentence_transformers import SentenceTransformer
+
+        self.name = f"local:{model_name}"
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts: List[str], query: bool = False) -> np.ndarray:
+        vectors = self.model.encode(texts, batch_size=EMBEDDING_BATCH, normalize_embeddings=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+class GeminiEncoder:
+    """API d'embeddings Gemini (un appel par lot de EMBEDDING_BATCH textes)."""
+
+    def __init__(self, model_name: str = GEMINI_MODEL):
+        import google.generativeai as genai
+
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        self.genai = genai
+        self.model_name = model_name
+        self.name = f"gemini:{model_name}"
+
+    def encode(self, texts: List[str], query: bool = False) -> np.ndarray:
+        task_type = "retrieval_query" if query else "retrieval_document"
+        vectors = []
+        for start in range(0, len(texts), EMBEDDING_BATCH):
+            result = self.genai.embed_content(model=self.model_name, content=texts[start:start + EMBEDDING_BATCH],
+                                              task_type=task_type)
+            vectors.extend(result['embedding'])
+        return normalize(np.asarray(vectors, dtype=np.float32))
+
+
+def create_encoder(kind: str):
+    if kind == "local":
+        return LocalEncoder()
+    if kind == "gemini":
+        return GeminiEncoder()
+    raise ValueError(f"CHAT_EMBEDDINGS inconnu: {kind} (attendu: off, local, gemini)")
+
+
+# === INDEX ===
+class EmbeddingIndex:
+    """
+    Base persistée (mmap, lignes invalidées par `alive`) + delta en mémoire.
+    Seul le thread de synchronisation modifie l'index; les recherches lisent sous verrou.
+    """
+
+    def __init__(self, session_factory, encoder_kind: str = ENCODER, directory: str = INDEX_DIR):
+        self.session_factory = session_factory
+        self.encoder_kind = encoder_kind
+        self.directory = directory
+        self.encoder = None
+        self.matrix: Optional[np.ndarray] = None
+        self.keys = np.zeros((0, 3), dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.positions: Dict[Tuple[str, int], int] = {}
+        self.delta: Dict[Tuple[str, int], Tuple[int, np.ndarray]] = {}
+        self.last_seq = 0
+        self._compacted_at = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self) -> bool:
+        return self.matrix is not None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    # --- Cycle de vie ---
+    def start(self):
+        """Charge (ou construit) l'index puis le synchronise en arrière-plan (non bloquant, une seule fois)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="embedding-index")
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        try:
+            self.encoder = create_encoder(self.encoder_kind)
+            if self._load():
+                print(f"🧭 Index sémantique chargé (mmap): {len(self.positions)} description(s), seq {self.last_seq}")
+            else:
+                self.rebuild()
+        except Exception as e:
+            print(f"⚠️ Index sémantique indisponible: {str(e)}")
+            return
+
+        while not self._stop.wait(SYNC_SECONDS):
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"⚠️ Synchronisation de l'index sémantique impossible: {str(e)}")
+
+    # --- Persistance ---
+    def _load(self) -> bool:
+        """Ouvre les fichiers en mmap si ils existent et viennent du même encodeur."""
+        try:
+            with open(self._path("meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("encoder") != self.encoder.name:
+                return False
+            matrix = np.load(self._path("vectors.npy"), mmap_mode="r")
+            keys = np.load(self._path("keys.npy"))
+        except (FileNotFoundError, ValueError):
+            return False
+
+        positions = {(SOURCE_BY_CODE[int(code)], int(doc_id)): i for i, (code, doc_id, _) in enumerate(keys)}
+        with self._lock:
+            self.matrix, self.keys = matrix, keys
+            self.alive = np.ones(len(keys), dtype=bool)
+            self.positions = positions
+            self.delta = {}
+            self.last_seq = int(meta.get("last_seq", 0))
+        self._compacted_at = time.time()
+        return True
+
+    def _write(self, keys: np.ndarray, matrix: np.ndarray, last_seq: int):
+        """Écrit les fichiers (remplacement atomique, les mmap ouverts restent valides)."""
+        os.makedirs(self.directory, exist_ok=True)
+        np.save(self._path("vectors.tmp.npy"), matrix.astype(np.float32, copy=False))
+        np.save(self._path("keys.tmp.npy"), keys.astype(np.int64, copy=False))
+        os.replace(self._path("vectors.tmp.npy"), self._path("vectors.npy"))
+        os.replace(self._path("keys.tmp.npy"), self._path("keys.npy"))
+        self._write_meta(last_seq)
+
+    def _write_meta(self, last_seq: int):
+        with open(self._path("meta.tmp.json"), "w", encoding="utf-8") as f:
+            json.dump({"encoder": self.encoder.name, "last_seq": last_seq, "updated_at": time.time()}, f)
+        os.replace(self._path("meta.tmp.json"), self._path("meta.json"))
+
+    # --- Construction et mises à jour ---
+    def rebuild(self):
+        """Encode toutes les descriptions et réécrit l'index."""
+        db = self.session_factory()
+        try:
+            # seq lu avant les lignes: les écritures concurrentes seront rejouées (idempotent grâce aux hashes)
+            last_seq = current_sequence(db) or 0
+            keys, texts = [], []
+            for source, (table, pk, code) in INDEXED_TABLES.items():
+                rows = db.execute(text(
+                    f"SELECT {pk}, description FROM {table} WHERE coalesce(description, '') <> '' ORDER BY {pk}"
+                )).fetchall()
+                keys.extend((code, row[0], text_hash(row[1])) for row in rows)
+                texts.extend(row[1] for row in rows)
+        finally:
+            db.close()
+
+        with tracer.span("embedding_index_build", documents=len(texts)):
+            matrix = self.encoder.encode(texts) if texts else np.zeros((0, 1), dtype=np.float32)
+        self._write(np.asarray(keys, dtype=np.int64).reshape(-1, 3), matrix, last_seq)
+        self._load()
+        print(f"🧭 Index sémantique construit: {len(keys)} description(s)")
+
+    def _current_hash(self, key: Tuple[str, int]) -> Optional[int]:
+        if key in self.delta:
+            return self.delta[key][0]
+        position = self.positions.get(key)
+        if position is not None and self.alive[position]:
+            return int(self.keys[position, 2])
+        return None
+
+    def sync(self):
+        """Intègre les lignes event / corrective_measure modifiées depuis last_seq."""
+        db = self.session_factory()
+        try:
+            feed = read_changed_rows(db, list(SOURCE_BY_TABLE), self.last_seq)
+            if feed is None or feed['last_seq'] <= self.last_seq:
+                return
+            if feed['reset']:
+                # Journal purgé depuis le dernier passage: impossible de garantir la complétude
+                db.close()
+                self.rebuild()
+                return
+            seq = feed['last_seq']
+
+            removed, changed = set(), {}
+            for source, (table, pk, _) in INDEXED_TABLES.items():
+                upsert_ids = feed['changes'][table]['upserts']
+                removed |= {(source, row_id) for row_id in feed['changes'][table]['deletes']}
+                current = dict(db.execute(
+                    text(f"SELECT {pk}, description FROM {table} WHERE {pk} = ANY(:ids)"), {"ids": upsert_ids}
+                ).fetchall()) if upsert_ids else {}
+                for row_id in upsert_ids:
+                    description = current.get(row_id) or ""
+                    if not description:
+                        removed.add((source, row_id))
+                    elif self._current_hash((source, row_id)) != text_hash(description):
+                        changed[(source, row_id)] = description
+        finally:
+            db.close()
+
+        # Encodage hors verrou: seuls les textes nouveaux ou modifiés
+        vectors = None
+        if changed:
+            with tracer.span("embedding_index_update", documents=len(changed)):
+                vectors = self.encoder.encode(list(changed.values()))
+
+        with self._lock:
+            for key in removed | set(changed):
+                position = self.positions.get(key)
+                if position is not None:
+                    self.alive[position] = False
+                self.delta.pop(key, None)
+            for i, (key, description) in enumerate(changed.items()):
+                self.delta[key] = (text_hash(description), vectors[i])
+            self.last_seq = seq
+
+        if changed or removed:
+            print(f"🧭 Index sémantique: {len(changed)} description(s) encodée(s), {len(removed)} retirée(s)")
+        pending = len(self.delta) + int((~self.alive).sum())
+        if pending >= COMPACT_AFTER or (pending and time.time() - self._compacted_at >= COMPACT_SECONDS):
+            self.compact()
+        elif not pending:
+            self._write_meta(self.last_seq)
+
+    def compact(self):
+        """Fusionne base vivante + delta dans de nouveaux fichiers puis les rouvre en mmap."""
+        # Le thread de synchronisation est le seul écrivain: l'état lu ici ne change pas pendant l'écriture
+        alive = self.alive.copy()
+        delta = list(self.delta.items())
+        codes = {source: code for source, (_, _, code) in INDEXED_TABLES.items()}
+        keys = np.concatenate([
+            self.keys[alive],
+            np.asarray([(codes[source], doc_id, h) for (source, doc_id), (h, _) in delta], dtype=np.int64).reshape(-1, 3)
+        ])
+        parts = [np.asarray(self.matrix[alive])] if alive.any() else []
+        if delta:
+            parts.append(np.stack([vector for _, (_, vector) in delta]))
+        self._write(keys, np.concatenate(parts) if len(keys) else np.zeros((0, 1), dtype=np.float32), self.last_seq)
+        self._load()
+
+    # --- Recherche ---
+    def search(self, question: str, limit: int) -> List[Tuple[str, int, float]]:
+        """(source, id, similarité cosinus) des descriptions les plus proches."""
+        if not self.ready:
+            return []
+        query = self.encoder.encode([question], query=True)[0]
+
+        with self._lock:
+            candidates = []
+            if len(self.keys):
+                scores = np.asarray(self.matrix @ query)
+                scores[~self.alive] = -np.inf
+                top = np.argpartition(-scores, min(limit, len(scores) - 1))[:limit]
+                candidates.extend(
+                    (SOURCE_BY_CODE[int(self.keys[i, 0])], int(self.keys[i, 1]), float(scores[i]))
+                    for i in top if np.isfinite(scores[i])
+                )
+            candidates.extend((source, doc_id, float(vector @ query))
+                              for (source, doc_id), (_, vector) in self.delta.items())
+
+        candidates.sort(key=lambda item: -item[2])
+        return candidates[:limit]
@@ -0,0 +1,167 @@
+# example_store.py - Exemples SQL appris des requêtes réussies
+"""
+Chaque requête réussie (question, SQL, row_count > 0) est enregistrée dans la
+table PostgreSQL chat_sql_example, partagée par les processus du chatbot.
+Les questions sont indexées en mémoire (TF-IDF, similarité cosinus): le
+prompt SQL reçoit les exemples passés les plus proches de la nouvelle
+question, en plus des exemples statiques.
+
+Les questions de suivi qui dépendent de l'historique (« et lui ? ») ne sont
+pas enregistrées: leur SQL n'a de sens que dans leur conversation.
+"""
+
+import os
+import re
+import math
+import time
+import threading
+import unicodedata
+from collections import Counter
+from typing import List, Dict, Any
+
+from sqlalchemy import text
+
+from database import engine
+from keyword_index import tokenize
+from tracing import record_cache
+
+# "on" (défaut) ou "off" (ex. benchmark: prompts reproductibles)
+EXAMPLE_STORE = os.environ.get("CHAT_EXAMPLE_STORE", "on").lower()
+MAX_EXAMPLES = int(os.environ.get("CHAT_EXAMPLE_STORE_MAX", "2000"))
+MIN_SIMILARITY = float(os.environ.get("CHAT_EXAMPLE_MIN_SIMILARITY", "0.3"))
+# Relecture de la table pour voir les exemples ajoutés par les autres processus
+RELOAD_SECONDS = int(os.environ.get("CHAT_EXAMPLE_RELOAD_SECONDS", "60"))
+MIN_TERMS = 2
+
+EXAMPLE_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS chat_sql_example (
+    example_id SERIAL PRIMARY KEY,
+    question_key TEXT NOT NULL UNIQUE,
+    question TEXT NOT NULL,
+    sql TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    attempts INTEGER NOT NULL,
+    uses INTEGER NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+"""
+
+# Références à l'historique: le SQL ne se réutilise pas tel quel
+ANAPHORA = {"cette", "cet", "celui", "celle", "ceux", "celles", "lui", "elle", "eux", "ca",
+            "dernier", "derniere", "precedent", "precedente", "meme"}
+
+
+def is_reusable(question: str) -> bool:
+    """Question autonome: assez de mots utiles et aucune référence à l'historique."""
+    value = unicodedata.normalize("NFKD", question.lower())
+    words = set(re.findall(r"[a-z0-9]+", "".join(c for c in value if not unicodedata.combining(c))))
+    return len(set(tokenize(question))) >= MIN_TERMS and not words & ANAPHORA
+
+
+class ExampleStore:
+    """Table chat_sql_example + index TF-IDF des questions en mémoire."""
+
+    def __init__(self, enabled: bool = EXAMPLE_STORE == "on"):
+        self.enabled = enabled
+        self.examples: List[Dict[str, Any]] = []
+        self._vectors: List[Dict[str, float]] = []
+        self._df: Counter = Counter()
+        self._keys: Dict[str, int] = {}
+        self._loaded_at = 0.0
+        self._ready = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def question_key(question: str) -> str:
+        return " ".join(sorted(set(tokenize(question))))
+
+    # --- Persistance ---
+    def load(self):
+        """Crée la table si besoin et (re)charge les exemples les plus récents."""
+        with engine.begin() as conn:
+            conn.execute(text(EXAMPLE_TABLE_DDL))
+            rows = conn.execute(text("""
+                SELECT question, sql, row_count, uses FROM chat_sql_example
+                ORDER BY updated_at DESC LIMIT :limit
+            """), {"limit": MAX_EXAMPLES}).mappings().all()
+        with self._lock:
+            self.examples, self._keys = [], {}
+            for row in rows:
+                self._append(dict(row))
+            self._reindex()
+            self._loaded_at = time.time()
+            self._ready = True
+
+    def _ensure_loaded(self) -> bool:
+        if not self.enabled:
+            return False
+        # Premier appel, puis relecture périodique (ou nouvel essai après un échec)
+        if time.time() - self._loaded_at >= RELOAD_SECONDS:
+            try:
+                self.load()
+            except Exception as e:
+                print(f"⚠️ Exemples SQL appris indisponibles: {str(e)}")
+                self._loaded_at = time.time()
+        return self._ready
+
+    def record(self, question: str, sql: str, row_count: int, attempts: int):
+        """Enregistre une requête réussie (ignorée si vide ou dépendante de l'historique)."""
+        if not self.enabled or row_count <= 0 or not is_reusable(question):
+            return
+        key = self.question_key(question)
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(EXAMPLE_TABLE_DDL))
+                conn.execute(text("""
+                    INSERT INTO chat_sql_example (question_key, question, sql, row_count, attempts)
+                    VALUES (:key, :question, :sql, :row_count, :attempts)
+                    ON CONFLICT (question_key) DO UPDATE
+                    SET question = EXCLUDED.question, sql = EXCLUDED.sql, row_count = EXCLUDED.row_count,
+                        attempts = EXCLUDED.attempts, uses = chat_sql_example.uses + 1, updated_at = now()
+                """), {"key": key, "question": question, "sql": sql, "row_count": row_count, "attempts": attempts})
+        except Exception as e:
+            print(f"⚠️ Impossible d'enregistrer l'exemple SQL: {str(e)}")
+            return
+        with self._lock:
+            self._append({'question': question, 'sql': sql, 'row_count': row_count, 'uses': 1})
+            self._reindex()
+
+    # --- Index TF-IDF ---
+    def _append(self, example: Dict[str, Any]):
+        key = self.question_key(example['question'])
+        if key in self._keys:
+            self.examples[self._keys[key]] = example
+        else:
+            self._keys[key] = len(self.examples)
+            self.examples.append(example)
+
+    def _reindex(self):
+        """Recalcule les vecteurs TF-IDF normalisés (quelques milliers de questions: négligeable)."""
+        counts = [Counter(tokenize(example['question'])) for example in self.examples]
+        self._df = Counter(term for count in counts for term in count)
+        self._vectors = [self._vector(count) for count in counts]
+
+    def _vector(self, counts: Counter) -> Dict[str, float]:
+        n = len(self.examples)
+        vector = {term: tf * (math.log((1 + n) / (1 + self._df.get(term, 0))) + 1) for term, tf in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {term: v / norm for term, v in vector.items()}
+
+    def nearest(self, question: str, k: int) -> List[Dict[str, Any]]:
+        """Les k exemples passés les plus proches (similarité ≥ MIN_SIMILARITY)."""
+        if k <= 0 or not self._ensure_loaded():
+            return []
+        with self._lock:
+            query = self._vector(Counter(tokenize(question)))
+            scored = []
+            for example, vector in zip(self.examples, self._vectors):
+                similarity = sum(weight * vector.get(term, 0.0) for term, weight in query.items())
+                if similarity >= MIN_SIMILARITY:
+                    scored.append((similarity, example))
+        scored.sort(key=lambda item: -item[0])
+        record_cache("sql_examples", bool(scored))
+        return [{**example, 'similarity': round(similarity, 3)} for similarity, example in scored[:k]]
+
+
+# Instance partagée
+example_store = ExampleStore()
@@ -0,0 +1,299 @@
+# intents.py - Réponses directes aux questions fréquentes (sans génération SQL)
+"""
+Les questions les plus courantes (« événements récents », « coût total des
+mesures », « personnes impliquées dans l'événement 5 », « risques
+critiques »...) correspondent à quelques requêtes SQL paramétrées.
+
+Classification en deux temps:
+1. expressions régulières par intention (précises, prioritaires);
+2. à défaut, modèle local léger: similarité cosinus (sac de mots) avec des
+   formulations d'exemple, au-dessus de CHAT_INTENT_MIN_SIMILARITY.
+Les paramètres (ID, nombre, type, année) sont extraits de la question; une
+intention dont un paramètre obligatoire manque n'est pas retenue. Une question
+avec négation (« ne ... pas », « sauf », « hors », « non ») n'est jamais
+traitée par une requête prédéfinie: elle passe par la génération SQL.
+
+Le LLM ne sert plus qu'à rédiger la réponse, ou pas du tout avec
+CHAT_TEMPLATED_ANSWERS=true (réponse mise en forme directement).
+"""
+
+import os
+import re
+import math
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+from keyword_index import tokenize
+from schema_catalog import schema_catalog
+
+FAST_PATH = os.environ.get("CHAT_INTENT_FAST_PATH", "true").lower() == "true"
+TEMPLATED_ANSWERS = os.environ.get("CHAT_TEMPLATED_ANSWERS", "false").lower() == "true"
+INTENT_MIN_SIMILARITY = float(os.environ.get("CHAT_INTENT_MIN_SIMILARITY", "0.75"))
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+EVENT_ID = r"(?:[ée]v[ée]nement|incident|accident)\s*(?:n[°o]\.?|#|num[ée]ro)?\s*(?P<event_id>\d+)"
+
+# Nom → patterns, formulations d'exemple, paramètres obligatoires, SQL ({where}
+# complété selon les paramètres), titre de la réponse mise en forme
+INTENTS = {
+    "event_persons": {
+        'patterns': [rf"(personnes?|employ[ée]s?|gens|qui).{{0,60}}(impliqu|concern|particip|pr[ée]sent).{{0,40}}{EVENT_ID}"],
+        'examples': ["personnes impliquées dans l'événement", "qui a participé à l'événement"],
+        'required': ["event_id"],
+        'sql': """
+SELECT p.person_id, p.name || ' ' || p.family_name AS nom_complet, p.matricule, p.role
+FROM person p
+INNER JOIN event_employee ee ON p.person_id = ee.person_id
+WHERE ee.event_id = :event_id
+ORDER BY p.family_name, p.name;""",
+        'title': "Personnes impliquées dans l'événement {event_id}",
+    },
+    "event_risks": {
+        'patterns': [rf"risques?.{{0,60}}{EVENT_ID}"],
+        'examples': ["risques associés à l'événement", "quels risques pour l'événement"],
+        'required': ["event_id"],
+        'sql': """
+SELECT r.risk_id, r.name, r.gravity, r.probability
+FROM risk r
+INNER JOIN event_risk er ON r.risk_id = er.risk_id
+WHERE er.event_id = :event_id
+ORDER BY r.risk_id;""",
+        'title': "Risques associés à l'événement {event_id}",
+    },
+    "event_measures": {
+        'patterns': [rf"mesures?.{{0,60}}{EVENT_ID}"],
+        'examples': ["mesures correctives de l'événement", "quelles mesures pour l'événement"],
+        'required': ["event_id"],
+        'sql': """
+SELECT cm.measure_id, cm.name, cm.description, cm.cost, cm.implementation_date,
+       p.name || ' ' || p.family_name AS responsable
+FROM corrective_measure cm
+INNER JOIN event_corrective_measure ecm ON cm.measure_id = ecm.measure_id
+LEFT JOIN person p ON cm.owner_id = p.person_id
+WHERE ecm.event_id = :event_id
+ORDER BY cm.measure_id;""",
+        'title': "Mesures correctives de l'événement {event_id}",
+    },
+    "event_details": {
+        'patterns': [rf"^\W*(?:d[ée]tails?|infos?|informations?|montre(?:-moi)?|donne(?:-moi)?)?\W*(?:\w+\W+){{0,3}}{EVENT_ID}\W*$"],
+        'examples': ["détails de l'événement", "informations sur l'événement"],
+        'required': ["event_id"],
+        'sql': """
+SELECT e.event_id, e.description, e.type, e.classification, e.start_datetime, e.end_datetime,
+       p.name || ' ' || p.family_name AS declarant, ou.name AS unite
+FROM event e
+LEFT JOIN person p ON e.declared_by_id = p.person_id
+LEFT JOIN organizational_unit ou ON e.organizational_unit_id = ou.unit_id
+WHERE e.event_id = :event_id;""",
+        'title': "Événement {event_id}",
+    },
+    "recent_events": {
+        'patterns': [r"\b(derni[eè]re?s?|r[ée]cente?s?|plus r[ée]cent)\b.{0,40}\b([ée]v[ée]nements?|incidents?|accidents?)\b",
+                     r"\b([ée]v[ée]nements?|incidents?|accidents?)\b.{0,40}\b(r[ée]cente?s?|derni[eè]re?s?)\b"],
+        'examples': ["événements récents", "derniers événements", "derniers incidents déclarés"],
+        'required': [],
+        'sql': """
+SELECT e.event_id, e.description, e.type, e.classification,
+       e.start_datetime, p.name || ' ' || p.family_name AS declarant,
+       ou.name AS unite
+FROM event e
+LEFT JOIN person p ON e.declared_by_id = p.person_id
+LEFT JOIN organizational_unit ou ON e.organizational_unit_id = ou.unit_id{where}
+ORDER BY e.start_datetime DESC
+LIMIT :limit;""",
+        'title': "Derniers événements",
+    },
+    "measure_cost_by_unit": {
+        'patterns': [r"\b(co[uû]ts?|budget|montant|d[ée]penses?)\b.{0,40}\bmesures?\b.{0,40}\bpar\s+(unit[ée]|d[ée]partement|service|site)"],
+        'examples': ["coût des mesures par unité", "budget des mesures correctives par unité"],
+        'required': [],
+        'sql': """
+SELECT ou.name AS unite,
+       COUNT(cm.measure_id) AS nb_mesures,
+       COALESCE(SUM(cm.cost), 0) AS cout_total
+FROM organizational_unit ou
+LEFT JOIN corrective_measure cm ON ou.unit_id = cm.organizational_unit_id
+GROUP BY ou.unit_id, ou.name
+ORDER BY cout_total DESC;""",
+        'title': "Coût des mesures correctives par unité",
+    },
+    "measure_cost_total": {
+        'patterns': [r"\b(co[uû]ts?|budget|montant|d[ée]penses?)\s+(total|totaux|global|cumul[ée])?.{0,30}\bmesures?\b",
+                     r"\bcombien\b.{0,20}\bco[uû]t.{0,30}\bmesures?\b"],
+        'examples': ["coût total des mesures correctives", "budget total des mesures"],
+        'required': [],
+        'sql': """
+SELECT COUNT(cm.measure_id) AS nb_mesures,
+       COALESCE(SUM(cm.cost), 0) AS cout_total,
+       ROUND(CAST(AVG(cm.cost) AS NUMERIC), 2) AS cout_moyen
+FROM corrective_measure cm;""",
+        'title': "Coût total des mesures correctives",
+    },
+    "critical_risks": {
+        'patterns': [r"\brisques?\b.{0,30}\b(critiques?|[ée]lev[ée]e?s?|graves?|majeure?s?|importante?s?)\b"],
+        'examples': ["risques critiques", "risques les plus graves", "liste des risques élevés"],
+        'required': [],
+        'sql': """
+SELECT r.risk_id, r.name, r.gravity, r.probability,
+       COUNT(er.event_id) AS nb_events
+FROM risk r
+LEFT JOIN event_risk er ON r.risk_id = er.risk_id
+WHERE r.gravity ILIKE ANY (ARRAY['%critique%', '%élev%', '%grave%', '%majeur%', '%haut%'])
+GROUP BY r.risk_id, r.name, r.gravity, r.probability
+ORDER BY nb_events DESC;""",
+        'title': "Risques critiques",
+    },
+    "events_by_type": {
+        'patterns': [r"\b(combien|nombre|r[ée]partition)\b.{0,30}\b([ée]v[ée]nements?|incidents?)\b.{0,20}\b(par|selon)\s+type"],
+        'examples': ["combien d'événements par type", "répartition des événements par type"],
+        'required': [],
+        'sql': """
+SELECT e.type, COUNT(*) AS nombre
+FROM event e{where}
+GROUP BY e.type
+ORDER BY nombre DESC;""",
+        'title': "Nombre d'événements par type",
+    },
+}
+
+# Mots tolérés en plus du vocabulaire des exemples; tout autre mot (unité, personne,
+# condition...) signale une contrainte que la requête prédéfinie ignorerait → LLM
+COMMON_TERMS = {"type", "annee", "depui", "detail", "information", "info", "donner", "voir", "afficher",
+                "lister", "savoir", "connaitre", "peut", "peux", "veux", "voudrai", "aimerai", "stp", "merci",
+                "numero", "id", "no", "n", "nombre", "total", "toute", "tou", "premier", "dernier", "plu",
+                "recent", "recente", "ete", "etait", "ya", "il", "quoi", "lesquel", "lesquelle", "liste",
+                "incident", "accident", "evenement", "declare", "declaree", "associe", "associee", "lie", "liee"}
+
+# Négations et exclusions: la requête prédéfinie répondrait l'inverse de la question
+NEGATION = re.compile(
+    r"\b(?:ne\s|n['’])\s*(?:\S+\s+){0,4}?(?:pas|jamais|plus|aucun|aucune|rien)\b"
+    r"|\b(?:sauf|hors|non|except[ée]e?s?)\b",
+    re.IGNORECASE
+)
+
+COMPILED = {name: [re.compile(p, re.IGNORECASE) for p in intent['patterns']] for name, intent in INTENTS.items()}
+VOCABULARY = {name: set(tokenize(" ".join(intent['examples']))) | COMMON_TERMS for name, intent in INTENTS.items()}
+EXEMPLARS = [(name, Counter(tokenize(example))) for name, intent in INTENTS.items() for example in intent['examples']]
+
+
+def _cosine(a: Counter, b: Counter) -> float:
+    dot = sum(a[t] * b[t] for t in a if t in b)
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm if norm else 0.0
+
+
+def classify(question: str) -> Tuple[Optional[str], Optional[re.Match], float]:
+    """(intention, match regex éventuel, confiance) — (None, None, 0) si rien ne correspond."""
+    for name, patterns in COMPILED.items():
+        for pattern in patterns:
+            match = pattern.search(question)
+            if match:
+                return name, match, 1.0
+    terms = Counter(tokenize(question))
+    best_name, best_score = None, 0.0
+    for name, exemplar in EXEMPLARS:
+        score = _cosine(terms, exemplar)
+        if score > best_score:
+            best_name, best_score = name, score
+    if best_score >= INTENT_MIN_SIMILARITY:
+        return best_name, None, best_score
+    return None, None, 0.0
+
+
+def extract_slots(question: str, match: Optional[re.Match]) -> Dict[str, Any]:
+    """ID d'événement, nombre de lignes, type d'événement et année cités dans la question."""
+    slots: Dict[str, Any] = {}
+    event_id = match.groupdict().get('event_id') if match else None
+    if event_id is None:
+        found = re.search(EVENT_ID, question, re.IGNORECASE)
+        event_id = found.group('event_id') if found else None
+    if event_id is not None:
+        slots['event_id'] = int(event_id)
+
+    limit = re.search(r"\b(\d{1,3})\s+(?:derni|premi|plus)", question, re.IGNORECASE)
+    slots['limit'] = min(int(limit.group(1)), MAX_LIMIT) if limit else DEFAULT_LIMIT
+
+    year = re.search(r"\b(?:en|depuis|de|pour)\s+((?:19|20)\d{2})\b", question, re.IGNORECASE)
+    if year:
+        slots['year'] = year.group(1)
+
+    # Types d'événements connus (catalogue) cités dans la question
+    terms = set(tokenize(question))
+    for table_column, values in schema_catalog.categorical_values().items():
+        if table_column == "event.type":
+            for value in values:
+                if set(tokenize(value)) and set(tokenize(value)) <= terms:
+                    slots['event_type'] = value
+                    break
+    return slots
+
+
+def _unexplained_terms(name: str, question: str, slots: Dict[str, Any]) -> set:
+    """Mots de la question qui ne sont ni du vocabulaire de l'intention ni des paramètres."""
+    explained = set(VOCABULARY[name])
+    if 'event_type' in slots:
+        explained |= set(tokenize(slots['event_type']))
+    terms = {t for t in tokenize(question) if not t.isdigit()}
+    return terms - explained
+
+
+def build_query(name: str, slots: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """SQL paramétré de l'intention, filtres optionnels ajoutés selon les paramètres."""
+    sql = INTENTS[name]['sql'].strip()
+    conditions, params = [], {k: v for k, v in slots.items() if f":{k}" in sql}
+    if 'event_type' in slots:
+        conditions.append("e.type = :event_type")
+        params['event_type'] = slots['event_type']
+    if 'year' in slots:
+        conditions.append("CAST(e.start_datetime AS TEXT) LIKE :year_prefix")
+        params['year_prefix'] = f"{slots['year']}%"
+    where = ("\nWHERE " + " AND ".join(conditions)) if conditions else ""
+    return sql.replace("{where}", where), params
+
+
+def match_intent(question: str) -> Optional[Dict[str, Any]]:
+    """
+    Intention reconnue avec sa requête prête à exécuter.
+
+    Returns:
+        None, ou dict avec 'intent', 'confidence', 'slots', 'sql', 'params', 'title'
+    """
+    if not FAST_PATH or NEGATION.search(question):
+        return None
+    name, match, confidence = classify(question)
+    if name is None:
+        return None
+    slots = extract_slots(question, match)
+    if any(slot not in slots for slot in INTENTS[name]['required']):
+        return None
+    filters = "{where}" in INTENTS[name]['sql']
+    if not filters and ('event_type' in slots or 'year' in slots):
+        return None
+    if _unexplained_terms(name, question, slots):
+        return None
+    sql, params = build_query(name, slots)
+    title = INTENTS[name]['title'].format(**slots)
+    if 'event_type' in slots:
+        title += f" (type {slots['event_type']})"
+    if 'year' in slots:
+        title += f" en {slots['year']}"
+    return {'intent': name, 'confidence': round(confidence, 3), 'slots': slots,
+            'sql': sql, 'params': params, 'title': title}
+
+
+def render_answer(title: str, columns: List[str], rows: List[tuple], max_rows: int = 20) -> str:
+    """Réponse mise en forme sans LLM: titre + tableau markdown."""
+    if not rows:
+        return f"**{title}**\n\nAucun résultat trouvé."
+
+    def cell(value):
+        return "" if value is None else str(value).replace("|", "\\|").replace("\n", " ")
+
+    lines = [f"**{title}** ({len(rows)} résultat(s))", "",
+             "| " + " | ".join(columns) + " |",
+             "|" + "---|" * len(columns)]
+    lines.extend("| " + " | ".join(cell(v) for v in row) + " |" for row in rows[:max_rows])
+    if len(rows) > max_rows:
+        lines.append(f"\n… {len(rows) - max_rows} résultat(s) supplémentaire(s) non affiché(s).")
+    return "\n".join(lines)
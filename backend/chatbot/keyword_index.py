@@ -0,0 +1,225 @@
+# keyword_index.py - Recherche BM25 en mémoire (fallback sans LLM)
+"""
+Index inversé en mémoire des textes des événements, risques, mesures
+correctives et personnes, interrogé avec BM25.
+
+Sert de fallback quand la génération SQL échoue: le contexte reste pertinent,
+en quelques millisecondes et sans appel au LLM. L'index est construit au
+démarrage de chat_api (sinon au premier appel) puis mis à jour
+incrémentalement à partir du change_log, au plus toutes les CHAT_BM25_SYNC_SECONDS.
+"""
+
+import os
+import re
+import math
+import time
+import heapq
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import List, Dict, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from change_log import current_sequence, read_changed_rows
+from tracing import tracer
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+SYNC_SECONDS = int(os.environ.get("CHAT_BM25_SYNC_SECONDS", "10"))
+FALLBACK_TOP_K = int(os.environ.get("CHAT_FALLBACK_TOP_K", "10"))
+
+# Source → (table SQL, clé primaire, libellé de section, requête des documents, format d'une ligne)
+DOCUMENT_SOURCES = {
+    "event": ("event", "event_id", "Événements pertinents", """
+        SELECT event_id AS id, description, type, classification, start_datetime
+        FROM event {where}
+    """, "- ID {id}: {description} (Type: {type}, Classification: {classification}, Début: {start_datetime})"),
+    "risk": ("risk", "risk_id", "Risques pertinents", """
+        SELECT risk_id AS id, name, gravity, probability
+        FROM risk {where}
+    """, "- ID {id}: {name} (Gravité: {gravity}, Probabilité: {probability})"),
+    "measure": ("corrective_measure", "measure_id", "Mesures correctives pertinentes", """
+        SELECT measure_id AS id, name, description, cost, implementation_date
+        FROM corrective_measure {where}
+    """, "- ID {id}: {name}: {description} (Coût: {cost}, Mise en place: {implementation_date})"),
+    "person": ("person", "person_id", "Personnes pertinentes", """
+        SELECT person_id AS id, name, family_name, matricule, role
+        FROM person {where}
+    """, "- ID {id}: {name} {family_name} (Matricule: {matricule}, Rôle: {role})"),
+}
+
+# Mots vides français (après suppression des accents)
+STOPWORDS = {
+    "le", "la", "les", "un", "une", "des", "du", "de", "d", "l", "et", "ou", "a", "au", "aux",
+    "en", "dans", "sur", "pour", "par", "avec", "sans", "sous", "que", "qui", "quoi", "quel",
+    "quels", "quelle", "quelles", "est", "sont", "ont", "il", "elle", "ils", "elles", "on",
+    "ce", "ces", "cet", "cette", "se", "sa", "son", "ses", "leur", "leurs", "ne", "pas", "plus",
+    "y", "moi", "me", "mes", "nous", "vous", "tous", "tout", "toutes", "combien", "liste",
+    "donne", "montre", "affiche", "peux", "tu", "je", "the", "of", "and", "what", "which",
+}
+
+
+def tokenize(value: str) -> List[str]:
+    """Minuscules, sans accents, mots vides retirés, pluriels simples ramenés au singulier."""
+    value = unicodedata.normalize("NFKD", value.lower())
+    value = "".join(c for c in value if not unicodedata.combining(c))
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", value):
+        if token in STOPWORDS or len(token) < 2:
+            continue
+        if len(token) > 3 and token[-1] in "sx" and not token.isdigit():
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Index inversé terme → {document: fréquence}, mis à jour document par document."""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[Tuple[str, int], int]] = defaultdict(dict)
+        self.lengths: Dict[Tuple[str, int], int] = {}
+        self.lines: Dict[Tuple[str, int], str] = {}
+        self.terms: Dict[Tuple[str, int], Counter] = {}
+        self.total_length = 0
+        self.last_seq = 0
+        self.built = False
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    # --- Mise à jour ---
+    def remove(self, key: Tuple[str, int]):
+        counts = self.terms.pop(key, None)
+        if counts is None:
+            return
+        for term in counts:
+            postings = self.postings[term]
+            postings.pop(key, None)
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(key)
+        self.lines.pop(key, None)
+
+    def add(self, key: Tuple[str, int], document: str, line: str):
+        self.remove(key)
+        counts = Counter(tokenize(document))
+        if not counts:
+            return
+        for term, tf in counts.items():
+            self.postings[term][key] = tf
+        self.terms[key] = counts
+        self.lengths[key] = sum(counts.values())
+        self.total_length += self.lengths[key]
+        self.lines[key] = line
+
+    @staticmethod
+    def _load_rows(db: Session, source: str, ids=None):
+        """(clé, texte indexé, ligne de contexte) des lignes de `source` (toutes ou `ids`)."""
+        _, pk, _, sql, line_format = DOCUMENT_SOURCES[source]
+        where = f"WHERE {pk} = ANY(:ids)" if ids is not None else ""
+        for row in db.execute(text(sql.format(where=where)), {"ids": ids} if ids is not None else {}).mappings():
+            values = {k: (v if v is not None else "N/A") for k, v in row.items()}
+            document = " ".join(str(v) for k, v in row.items() if k != 'id' and v is not None)
+            yield (source, row['id']), document, line_format.format(**values)
+
+    def build(self, db: Session):
+        """Indexe toutes les lignes (seq du journal lu avant: les écritures concurrentes seront rejouées)."""
+        last_seq = current_sequence(db) or 0
+        with tracer.span("bm25_build") as span:
+            fresh = BM25Index()
+            for source in DOCUMENT_SOURCES:
+                for key, document, line in self._load_rows(db, source):
+                    fresh.add(key, document, line)
+            with self._lock:
+                self.postings, self.lengths, self.lines, self.terms = fresh.postings, fresh.lengths, fresh.lines, fresh.terms
+                self.total_length = fresh.total_length
+                self.last_seq = last_seq
+                self.built = True
+            self._synced_at = time.time()
+            span.set(documents=len(fresh.lengths), terms=len(fresh.postings))
+        print(f"🔎 Index BM25 prêt: {len(fresh.lengths)} document(s), {len(fresh.postings)} terme(s)")
+
+    def sync(self, db: Session):
+        """
+        Construit l'index au premier appel, puis réindexe les lignes modifiées
+        depuis last_seq (au plus toutes les SYNC_SECONDS). Un seul thread à la fois:
+        les autres cherchent dans l'état courant.
+        """
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            if not self.built:
+                self.build(db)
+            elif time.time() - self._synced_at >= SYNC_SECONDS:
+                self._synced_at = time.time()
+                self._apply_changes(db)
+        finally:
+            self._sync_lock.release()
+
+    def _apply_changes(self, db: Session):
+        tables = {table: source for source, (table, *_) in DOCUMENT_SOURCES.items()}
+        feed = read_changed_rows(db, list(tables), self.last_seq)
+        if feed is None or feed['last_seq'] <= self.last_seq:
+            return
+        if feed['reset']:
+            self.build(db)
+            return
+
+        updates = []
+        for table, source in tables.items():
+            changes = feed['changes'][table]
+            updates.extend((key, None, None) for key in ((source, row_id) for row_id in changes['deletes']))
+            if changes['upserts']:
+                found = list(self._load_rows(db, source, changes['upserts']))
+                updates.extend(found)
+                # Ligne modifiée puis supprimée entre-temps
+                missing = set(changes['upserts']) - {key[1] for key, _, _ in found}
+                updates.extend(((source, row_id), None, None) for row_id in missing)
+
+        with self._lock:
+            for key, document, line in updates:
+                if document is None:
+                    self.remove(key)
+                else:
+                    self.add(key, document, line)
+            self.last_seq = feed['last_seq']
+
+    # --- Recherche ---
+    def search(self, query: str, top_k: int = FALLBACK_TOP_K) -> List[Tuple[float, Tuple[str, int], str]]:
+        """(score, clé, ligne de contexte) des top_k documents pour la requête."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self.lengths)
+            if not n or not terms:
+                return []
+            average_length = self.total_length / n
+            scores = defaultdict(float)
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, tf in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[key] / average_length)
+                    scores[key] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [(score, key, self.lines[key]) for key, score in best]
+
+
+def format_hits(hits: List[Tuple[float, Tuple[str, int], str]]) -> str:
+    """Contexte groupé par source, dans l'ordre de pertinence."""
+    sections: Dict[str, List[str]] = {}
+    for _, (source, _), line in hits:
+        sections.setdefault(source, []).append(line)
+    lines = []
+    for source, source_lines in sections.items():
+        lines.append(f"\n### {DOCUMENT_SOURCES[source][2]} (recherche par mots-clés):")
+        lines.extend(source_lines)
+    return "\n".join(lines).strip()
+
+
+# Instance partagée par tous les DataRetriever du processus
+keyword_index = BM25Index()
@@ -0,0 +1,187 @@
+"""
+Backends LLM interchangeables pour le chatbot.
+
+Sélection par la variable d'environnement LLM_BACKEND:
+- "gemini" (défaut): appels réels à Gemini (GEMINI_API_KEY requise)
+- "record": appels réels à Gemini + enregistrement prompt → réponse dans une cassette JSONL
+- "replay": rejoue les réponses enregistrées, sans clé API ni réseau
+
+La cassette (LLM_CASSETTE, défaut: llm_cassette.jsonl) est indexée par le hash
+SHA-256 du prompt. Les modèles exposent la même interface que
+genai.GenerativeModel: generate_content(prompt, stream=False) → objet avec .text
+et .usage_metadata.
+"""
+
+import os
+import json
+import hashlib
+import threading
+import time
+from types import SimpleNamespace
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_CASSETTE = "llm_cassette.jsonl"
+
+
+def prompt_key(prompt) -> str:
+    """Clé stable d'un prompt (seules les parties texte comptent)."""
+    if isinstance(prompt, (list, tuple)):
+        prompt = "\n".join(p for p in prompt if isinstance(p, str))
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimation grossière (≈ 4 caractères par token) quand l'usage n'est pas fourni."""
+    return max(1, len(text) // 4) if text else 0
+
+
+class LLMResponse:
+    """Réponse compatible avec celle de genai (text + usage_metadata, itérable en stream)."""
+
+    def __init__(self, text: str, prompt_tokens: int = 0, output_tokens: int = 0, latency_ms: float = 0.0):
+        self.text = text
+        # Latence de l'appel réel (mesurée à l'enregistrement)
+        self.latency_ms = latency_ms
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens
+        )
+
+    def __iter__(self):
+        # En mode stream, la réponse enregistrée est rendue en un seul morceau
+        yield self
+
+
+class Cassette:
+    """Stockage JSONL des échanges prompt → réponse."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._records = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        record = json.loads(line)
+                        self._records[record["key"]] = record
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, key: str):
+        return self._records.get(key)
+
+    def add(self, record: dict):
+        with self._lock:
+            self._records[record["key"]] = record
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _usage(response, prompt, text) -> tuple:
+    """Extrait (prompt_tokens, output_tokens) de la réponse Gemini, sinon estime."""
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    if not prompt_tokens:
+        prompt_text = prompt if isinstance(prompt, str) else "\n".join(p for p in prompt if isinstance(p, str))
+        prompt_tokens = estimate_tokens(prompt_text)
+    if not output_tokens:
+        output_tokens = estimate_tokens(text)
+    return prompt_tokens, output_tokens
+
+
+class RecordingModel:
+    """Appelle le vrai modèle et enregistre chaque échange dans la cassette."""
+
+    def __init__(self, inner, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+
+    def generate_content(self, prompt, stream: bool = False, **kwargs):
+        # Appel non streamé pour enregistrer la réponse complète
+        start = time.perf_counter()
+        response = self.inner.generate_content(prompt, **kwargs)
+        text = response.text
+        latency_ms = (time.perf_counter() - start) * 1000
+        prompt_tokens, output_tokens = _usage(response, prompt, text)
+        self.cassette.add({
+            "key": prompt_key(prompt),
+            "text": text,
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+            "latency_ms": round(latency_ms, 1)
+        })
+        return LLMResponse(text, prompt_tokens, output_tokens, latency_ms)
+
+
+class ReplayModel:
+    """Rejoue les réponses de la cassette (aucun appel réseau)."""
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+
+    def generate_content(self, prompt, stream: bool = False, **kwargs):
+        key = prompt_key(prompt)
+        record = self.cassette.get(key)
+        if record is None:
+            raise LookupError(f"Aucune réponse enregistrée pour ce prompt (clé {key[:12]}) dans {self.cassette.path}")
+        return LLMResponse(
+            record["text"],
+            record.get("prompt_tokens", 0),
+            record.get("output_tokens", 0),
+            record.get("latency_ms", 0.0)
+        )
+
+
+def create_gemini_model():
+    """Initialise le modèle Gemini avec fallback vers gemini-pro. Retourne (model, model_name)."""
+    import google.generativeai as genai
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY non trouvée")
+
+    genai.configure(api_key=api_key)
+    try:
+        return genai.GenerativeModel('gemini-2.5-flash'), "gemini-2.5-flash"
+    except Exception:
+        return genai.GenerativeModel('gemini-pro'), "gemini-pro"
+
+
+# --- Modèle partagé par le processus ---
+_model_lock = threading.Lock()
+_model = None
+_model_name = None
+
+
+def get_llm_model():
+    """
+    Retourne le modèle LLM partagé (model, model_name) selon LLM_BACKEND.
+    Initialisé une seule fois par processus.
+    """
+    global _model, _model_name
+    if _model is not None:
+        return _model, _model_name
+
+    with _model_lock:
+        if _model is None:
+            backend = os.getenv("LLM_BACKEND", "gemini").lower()
+            cassette_path = os.getenv("LLM_CASSETTE", DEFAULT_CASSETTE)
+
+            if backend == "replay":
+                _model, _model_name = ReplayModel(Cassette(cassette_path)), f"replay:{cassette_path}"
+            elif backend == "record":
+                inner, inner_name = create_gemini_model()
+                _model, _model_name = RecordingModel(inner, Cassette(cassette_path)), f"record:{inner_name}"
+            elif backend == "gemini":
+                _model, _model_name = create_gemini_model()
+            else:
+                raise ValueError(f"LLM_BACKEND inconnu: {backend} (attendu: gemini, record, replay)")
+
+    return _model, _model_name
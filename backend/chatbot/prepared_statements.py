@@ -0,0 +1,160 @@
+# prepared_statements.py - Requêtes préparées côté serveur pour le SQL validé
+"""
+Les requêtes générées ou prédéfinies ne diffèrent souvent que par leurs
+littéraux (`WHERE ee.event_id = 5` / `= 102`): PostgreSQL les replanifie à
+chaque fois. Ce module:
+
+1. paramétrise les littéraux comparés (`= 5`, `LIKE '%x%'`, `LIMIT 10`...) et
+   les paramètres nommés (`:event_id`) en $1, $2...;
+2. prépare la requête (PREPARE) une fois par connexion, dans un cache LRU
+   rangé dans connection.info (il vit et meurt avec la connexion DBAPI);
+3. l'exécute avec EXECUTE et les valeurs liées: les littéraux ne font plus
+   partie du texte planifié.
+
+Une requête valide que PostgreSQL refuse de préparer (type d'un paramètre
+indéterminable, instruction non préparable...) est exécutée telle quelle et
+n'est plus retentée. Une requête invalide ou une transaction déjà en échec ne
+marque rien: l'erreur est renvoyée à l'appelant, transaction annulée.
+
+Derrière PgBouncer en mode transaction (POSTGRES_POOLER=transaction), deux
+transactions peuvent utiliser deux connexions serveur différentes: une requête
+préparée n'y survit pas, la couche est donc désactivée par défaut.
+"""
+
+import os
+import re
+import hashlib
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from database import TRANSACTION_POOLING
+from tracing import record_cache
+
+PREPARED_STATEMENTS = os.environ.get("CHAT_PREPARED_STATEMENTS",
+                                     "false" if TRANSACTION_POOLING else "true").lower() == "true"
+# Requêtes préparées gardées par connexion (les plus anciennes sont désallouées)
+MAX_PREPARED = int(os.environ.get("CHAT_PREPARED_MAX", "100"))
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<string>'(?:[^']|'')*')
+  | (?P<ident>"(?:[^"]|"")*")
+  | (?P<bind>(?<![:\w]):[A-Za-z_]\w*)
+  | (?P<number>(?<![\w.$])\d+(?:\.\d+)?(?![\w.]))
+  | (?P<word>[A-Za-z_][\w$]*)
+  | (?P<op><>|!=|<=|>=|::|[=<>])
+  | (?P<other>\S)
+""", re.VERBOSE)
+
+# Un littéral n'est paramétré qu'après ces tokens: ailleurs (ORDER BY 1, INTERVAL '7 days',
+# listes, appels de fonction), le remplacer changerait le sens ou la syntaxe de la requête
+PARAMETER_CONTEXTS = {"=", "<>", "!=", "<", ">", "<=", ">=", "LIKE", "ILIKE", "LIMIT", "OFFSET"}
+
+# Noms de requêtes refusées par PREPARE (communs à toutes les connexions)
+_unpreparable = set()
+
+# SQLSTATE propres à la préparation: type de paramètre indéterminable, résolution
+# d'opérateur/fonction sur un paramètre sans type, instruction non préparable
+PREPARE_ERROR_CODES = {"42P18", "42725", "42883", "42804", "42601", "0A000"}
+
+
+def _is_preparation_error(error: Exception) -> bool:
+    """Vrai si PREPARE a échoué à cause de la préparation elle-même (et non d'une transaction en échec)."""
+    return getattr(getattr(error, "orig", None), "pgcode", None) in PREPARE_ERROR_CODES
+
+
+def parameterize(sql: str, params: Optional[Dict[str, Any]] = None) -> Tuple[str, List[Any]]:
+    """
+    Remplace les littéraux comparés et les paramètres nommés par $1, $2...
+
+    Returns:
+        (texte paramétré, valeurs dans l'ordre des $n)
+    """
+    params = params or {}
+    parts, values, positions = [], [], {}
+    last, previous, previous_kind, operand = 0, None, None, None
+    for match in TOKEN_PATTERN.finditer(sql):
+        kind, token = match.lastgroup, match.group()
+        replacement = None
+        if kind == "bind" and token[1:] in params:
+            # Un même paramètre nommé réutilise son $n
+            name = token[1:]
+            if name not in positions:
+                values.append(params[name])
+                positions[name] = len(values)
+            replacement = f"${positions[name]}"
+        elif kind in ("string", "number") and previous in PARAMETER_CONTEXTS and operand not in ("string", "number"):
+            # `1 = 1` reste tel quel: `$1 = $2` n'aurait pas de type
+            if kind == "string":
+                values.append(token[1:-1].replace("''", "'"))
+            else:
+                values.append(int(token) if token.isdigit() else Decimal(token))
+            replacement = f"${len(values)}"
+        if replacement is not None:
+            parts.append(sql[last:match.start()])
+            parts.append(replacement)
+            last = match.end()
+        if kind == "op":
+            operand = previous_kind
+        previous, previous_kind = (token.upper() if kind in ("word", "op") else token), kind
+    parts.append(sql[last:])
+    return "".join(parts).strip().rstrip(";").strip(), values
+
+
+def statement_name(template: str) -> str:
+    return "chat_q_" + hashlib.sha1(template.encode("utf-8")).hexdigest()[:16]
+
+
+def execute(db: Session, sql: str, params: Optional[Dict[str, Any]] = None):
+    """
+    Exécute une requête SELECT validée via une requête préparée de la connexion
+    courante (mêmes résultats que db.execute(text(sql), params)).
+    """
+    if not PREPARED_STATEMENTS:
+        return db.execute(text(sql), params or {})
+
+    template, values = parameterize(sql, params)
+    name = statement_name(template)
+    if name in _unpreparable:
+        return db.execute(text(sql), params or {})
+
+    prepared: OrderedDict = db.connection().info.setdefault("prepared_statements", OrderedDict())
+    hit = name in prepared
+    record_cache("prepared_statements", hit)
+    if hit:
+        prepared.move_to_end(name)
+    else:
+        try:
+            db.execute(text(f"PREPARE {name} AS {template}"))
+        except Exception as e:
+            # Requête invalide (l'exécution directe lèvera l'erreur réelle) ou non préparable
+            db.rollback()
+            try:
+                result = db.execute(text(sql), params or {})
+            except Exception:
+                # Transaction annulée: l'appelant peut réessayer sur la même session
+                db.rollback()
+                raise
+            # Requête valide: seul un refus propre à PREPARE la fait exécuter directement à l'avenir
+            if _is_preparation_error(e):
+                _unpreparable.add(name)
+            print(f"⚠️ Requête non préparée, exécution directe: {str(e).splitlines()[0]}")
+            return result
+        prepared[name] = template
+        if len(prepared) > MAX_PREPARED:
+            oldest, _ = prepared.popitem(last=False)
+            db.execute(text(f"DEALLOCATE {oldest}"))
+
+    arguments = ", ".join(f":p{i}" for i in range(1, len(values) + 1))
+    statement = f"EXECUTE {name}({arguments})" if values else f"EXECUTE {name}"
+    try:
+        return db.execute(text(statement), {f"p{i}": v for i, v in enumerate(values, 1)})
+    except Exception as e:
+        db.rollback()
+        # Requête préparée disparue (DISCARD ALL, connexion réinitialisée): recréée au prochain appel
+        if name in str(e) and "does not exist" in str(e):
+            prepared.pop(name, None)
+        raise
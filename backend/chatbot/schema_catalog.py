@@ -0,0 +1,242 @@
+# schema_catalog.py - Schéma de la base lu dans le catalogue PostgreSQL
+"""
+Remplace les descriptions de schéma écrites à la main (SQLGenerator et
+DataRetriever) par une lecture du catalogue PostgreSQL:
+tables, colonnes et types, clés primaires et étrangères, index, nombre de
+lignes estimé (pg_class.reltuples) et valeurs distinctes des colonnes texte
+courtes et peu variées (type, classification, gravity...), repérées grâce aux
+statistiques de l'optimiseur (pg_stats) pour ne pas parcourir les colonnes de
+texte libre.
+
+Le résultat est mis en cache (rechargé après CHAT_SCHEMA_TTL_SECONDS) et rendu
+en fragments compacts pour les prompts. Si la base est inaccessible, le
+schéma est rendu à partir de models.py.
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Any, List, Optional, Iterable
+
+from sqlalchemy import text
+
+from database import engine, Base
+
+SCHEMA_TTL_SECONDS = int(os.environ.get("CHAT_SCHEMA_TTL_SECONDS", "3600"))
+# Au-delà de ce nombre de valeurs distinctes, une colonne n'est pas considérée catégorielle
+CATEGORICAL_MAX_VALUES = int(os.environ.get("CHAT_SCHEMA_MAX_VALUES", "15"))
+CATEGORICAL_MAX_LENGTH = 60
+
+# Tables techniques jamais montrées au LLM
+INTERNAL_TABLES = {"change_log", "chat_sql_example"}
+
+STRING_TYPES = {"character varying", "text", "character"}
+TYPE_ALIASES = {
+    "character varying": "varchar",
+    "integer": "int",
+    "bigint": "bigint",
+    "double precision": "float",
+    "timestamp without time zone": "timestamp",
+    "timestamp with time zone": "timestamptz",
+}
+
+COLUMNS_SQL = """
+SELECT c.table_name, c.column_name, c.data_type
+FROM information_schema.columns c
+JOIN information_schema.tables t ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+WHERE c.table_schema = 'public' AND t.table_type = 'BASE TABLE'
+ORDER BY c.table_name, c.ordinal_position
+"""
+
+CONSTRAINTS_SQL = """
+SELECT con.contype, rel.relname, att.attname, frel.relname, fatt.attname
+FROM pg_constraint con
+JOIN pg_class rel ON rel.oid = con.conrelid
+JOIN pg_namespace ns ON ns.oid = rel.relnamespace
+CROSS JOIN LATERAL unnest(con.conkey) WITH ORDINALITY AS k(attnum, n)
+JOIN pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = k.attnum
+LEFT JOIN pg_class frel ON frel.oid = con.confrelid
+LEFT JOIN pg_attribute fatt ON fatt.attrelid = con.confrelid AND fatt.attnum = con.confkey[k.n]
+WHERE ns.nspname = 'public' AND con.contype IN ('p', 'f')
+"""
+
+INDEXES_SQL = """
+SELECT t.relname, i.relname, array_agg(a.attname ORDER BY k.n)
+FROM pg_index ix
+JOIN pg_class t ON t.oid = ix.indrelid
+JOIN pg_class i ON i.oid = ix.indexrelid
+JOIN pg_namespace ns ON ns.oid = t.relnamespace
+CROSS JOIN LATERAL unnest(ix.indkey) WITH ORDINALITY AS k(attnum, n)
+JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+WHERE ns.nspname = 'public' AND NOT ix.indisprimary
+GROUP BY t.relname, i.relname
+"""
+
+COLUMN_STATS_SQL = """
+SELECT tablename, attname, n_distinct, avg_width
+FROM pg_stats
+WHERE schemaname = 'public'
+"""
+
+ROW_ESTIMATES_SQL = """
+SELECT c.relname, c.reltuples::bigint
+FROM pg_class c
+JOIN pg_namespace ns ON ns.oid = c.relnamespace
+WHERE ns.nspname = 'public' AND c.relkind = 'r'
+"""
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _is_categorical_candidate(col: Dict[str, Any], stats, rows: int) -> bool:
+    """
+    Colonne texte courte et peu variée d'après pg_stats (n_distinct négatif =
+    fraction du nombre de lignes). Sans statistiques (table jamais analysée),
+    seules les colonnes varchar/char sont retenues: le type text sert au texte libre.
+    """
+    if col['type'] not in STRING_TYPES or col['pk'] or col['fk']:
+        return False
+    if stats is None:
+        return col['type'] != "text"
+    n_distinct, avg_width = stats
+    distinct = n_distinct if n_distinct >= 0 else -n_distinct * rows
+    return 0 < distinct <= CATEGORICAL_MAX_VALUES and (avg_width or 0) <= CATEGORICAL_MAX_LENGTH
+
+
+def reflect_schema(conn) -> Dict[str, Dict[str, Any]]:
+    """
+    Lit le catalogue.
+
+    Returns:
+        {table: {'rows': int, 'indexes': {nom: [colonnes]},
+                 'columns': [{'name', 'type', 'pk', 'fk', 'values'}]}}
+    """
+    tables: Dict[str, Dict[str, Any]] = {}
+    for table, column, data_type in conn.execute(text(COLUMNS_SQL)):
+        if table in INTERNAL_TABLES:
+            continue
+        table_info = tables.setdefault(table, {'rows': 0, 'indexes': {}, 'columns': []})
+        table_info['columns'].append({'name': column, 'type': data_type, 'pk': False, 'fk': None, 'values': None})
+
+    columns = {(table, col['name']): col for table, info in tables.items() for col in info['columns']}
+    for kind, table, column, ref_table, ref_column in conn.execute(text(CONSTRAINTS_SQL)):
+        col = columns.get((table, column))
+        if col is None:
+            continue
+        if kind == 'p':
+            col['pk'] = True
+        else:
+            col['fk'] = f"{ref_table}.{ref_column}"
+
+    for table, index_name, index_columns in conn.execute(text(INDEXES_SQL)):
+        if table in tables:
+            tables[table]['indexes'][index_name] = list(index_columns)
+
+    for table, estimate in conn.execute(text(ROW_ESTIMATES_SQL)):
+        if table in tables:
+            # reltuples = -1 tant que la table n'a jamais été analysée
+            tables[table]['rows'] = estimate if estimate >= 0 else \
+                conn.execute(text(f"SELECT count(*) FROM {_quote(table)}")).scalar()
+
+    column_stats = {(table, column): (n_distinct, avg_width)
+                    for table, column, n_distinct, avg_width in conn.execute(text(COLUMN_STATS_SQL))}
+
+    # Valeurs des colonnes texte courtes et peu variées (hors clés)
+    for table, info in tables.items():
+        for col in info['columns']:
+            if not _is_categorical_candidate(col, column_stats.get((table, col['name'])), info['rows']):
+                continue
+            values = conn.execute(text(
+                f"SELECT DISTINCT {_quote(col['name'])} FROM {_quote(table)} "
+                f"WHERE {_quote(col['name'])} IS NOT NULL ORDER BY 1 LIMIT :n"
+            ), {"n": CATEGORICAL_MAX_VALUES + 1}).scalars().all()
+            if values and len(values) <= CATEGORICAL_MAX_VALUES and \
+                    max(len(str(v)) for v in values) <= CATEGORICAL_MAX_LENGTH:
+                col['values'] = [str(v) for v in values]
+    return tables
+
+
+def schema_from_models() -> Dict[str, Dict[str, Any]]:
+    """Schéma minimal tiré de models.py (base inaccessible)."""
+    tables = {}
+    for table in Base.metadata.sorted_tables:
+        tables[table.name] = {'rows': 0, 'indexes': {}, 'columns': [
+            {'name': col.name, 'type': str(col.type).lower(), 'pk': col.primary_key,
+             'fk': next((f"{fk.column.table.name}.{fk.column.name}" for fk in col.foreign_keys), None),
+             'values': None}
+            for col in table.columns
+        ]}
+    return tables
+
+
+def render_column(col: Dict[str, Any]) -> str:
+    parts = [col['name'], TYPE_ALIASES.get(col['type'], col['type'])]
+    if col['pk']:
+        parts.append("PK")
+    if col['fk']:
+        parts.append(f"→ {col['fk']}")
+    rendered = " ".join(parts)
+    if col['values']:
+        rendered += " ∈ {" + ", ".join(f"'{v}'" for v in col['values']) + "}"
+    return rendered
+
+
+class SchemaCatalog:
+    """Cache du schéma réfléchi, partagé par le processus."""
+
+    def __init__(self, ttl: int = SCHEMA_TTL_SECONDS):
+        self.ttl = ttl
+        self.tables: Optional[Dict[str, Dict[str, Any]]] = None
+        self.source = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Lit le catalogue (ou models.py en secours) et remplace le cache."""
+        try:
+            with engine.connect() as conn:
+                tables, source = reflect_schema(conn), "catalog"
+            print(f"📚 Schéma lu dans le catalogue PostgreSQL: {len(tables)} table(s)")
+        except Exception as e:
+            print(f"⚠️ Lecture du catalogue impossible, schéma de models.py utilisé: {str(e)}")
+            tables, source = schema_from_models(), "models"
+        self.tables, self.source = tables, source
+        self._loaded_at = time.time()
+
+    def _stale(self) -> bool:
+        # En mode dégradé (models.py), on retente le catalogue après une minute
+        ttl = self.ttl if self.source == "catalog" else 60
+        return self.tables is None or time.time() - self._loaded_at >= ttl
+
+    def get(self) -> Dict[str, Dict[str, Any]]:
+        """Schéma en cache (chargé au premier appel, rechargé après le TTL)."""
+        if self._stale():
+            with self._lock:
+                if self._stale():
+                    self.load()
+        return self.tables
+
+    def categorical_values(self) -> Dict[str, List[str]]:
+        """'table.colonne' → valeurs connues des colonnes catégorielles."""
+        return {f"{table}.{col['name']}": col['values']
+                for table, info in self.get().items() for col in info['columns'] if col['values']}
+
+    def render(self, tables: Optional[Iterable[str]] = None, title: str = "## SCHÉMA POSTGRESQL") -> str:
+        """
+        Fragment de prompt compact: une ligne par table avec colonnes, types,
+        clés, nombre de lignes estimé et valeurs possibles des colonnes catégorielles.
+        """
+        schema = self.get()
+        selected = [t for t in (tables or sorted(schema)) if t in schema]
+        lines = [title]
+        for table in selected:
+            info = schema[table]
+            rows = f" (~{info['rows']} lignes)" if info['rows'] else ""
+            lines.append(f"- {table}{rows}: " + ", ".join(render_column(col) for col in info['columns']))
+        return "\n".join(lines)
+
+
+# Instance partagée
+schema_catalog = SchemaCatalog()
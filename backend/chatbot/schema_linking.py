@@ -0,0 +1,188 @@
+# schema_linking.py - Sélection du sous-schéma et des exemples utiles à une question
+"""
+Étape de "schema linking" avant la génération SQL: au lieu d'envoyer toutes
+les tables et tous les exemples, on garde ceux que la question concerne.
+
+- Lexical: mots de la question ↔ synonymes des tables, noms de colonnes et
+  valeurs connues des colonnes catégorielles (schema_catalog).
+- Tables citées dans le SQL de l'historique (questions de suivi: « Et les risques ? »).
+- Sémantique (optionnel, CHAT_SCHEMA_EMBEDDINGS=true avec CHAT_EMBEDDINGS=local|gemini):
+  similarité entre la question et la description de chaque table.
+- Tables de liaison reliant deux tables retenues et cibles des clés étrangères ajoutées.
+
+Si rien n'est reconnu, le schéma complet est envoyé (aucune perte de précision).
+"""
+
+import os
+import re
+import threading
+from typing import List, Dict, Any, Optional, Set
+
+import numpy as np
+
+from embedding_index import ENCODER, create_encoder
+from keyword_index import tokenize
+from schema_catalog import schema_catalog
+
+SCHEMA_EMBEDDINGS = os.environ.get("CHAT_SCHEMA_EMBEDDINGS", "false").lower() == "true"
+SCHEMA_LINK_THRESHOLD = float(os.environ.get("CHAT_SCHEMA_LINK_THRESHOLD", "0.35"))
+# Nombre d'exemples SQL gardés dans le prompt
+EXAMPLES_K = int(os.environ.get("CHAT_SQL_EXAMPLES_K", "2"))
+
+# Mots (tokenisés: minuscules, sans accents, singulier) → tables
+TABLE_SYNONYMS = {
+    "event": {"evenement", "event", "incident", "accident", "declaration", "declare", "survenu", "signale",
+              "classification", "presque"},
+    "person": {"personne", "employe", "employee", "salarie", "travailleur", "declarant", "responsable",
+               "matricule", "nom", "prenom", "role", "implique", "auteur", "proprietaire"},
+    "organizational_unit": {"unite", "departement", "service", "site", "atelier", "usine", "secteur",
+                            "localisation", "lieu", "location"},
+    "risk": {"risque", "danger", "gravite", "grave", "critique", "probabilite", "severite"},
+    "corrective_measure": {"mesure", "corrective", "correctif", "action", "prevention", "cout", "budget",
+                           "depense", "montant", "implementation", "mise"},
+    "event_employee": {"implique", "impliquee", "participant", "temoin", "concerne"},
+}
+
+SQL_TABLE_PATTERN = re.compile(r"\b(?:from|join)\s+([a-z_][a-z0-9_]*)", re.IGNORECASE)
+
+
+def tables_in_sql(sql: str) -> Set[str]:
+    """Tables citées après FROM / JOIN."""
+    return {name.lower() for name in SQL_TABLE_PATTERN.findall(sql or "")}
+
+
+class SchemaLinker:
+    """Relie une question aux tables, colonnes et valeurs du schéma en cache."""
+
+    def __init__(self, use_embeddings: bool = SCHEMA_EMBEDDINGS and ENCODER != "off"):
+        self.use_embeddings = use_embeddings
+        self._encoder = None
+        self._table_vectors = None
+        self._lock = threading.Lock()
+
+    # --- Lexical ---
+    @staticmethod
+    def _lexical_tables(terms: Set[str], schema: Dict[str, Dict[str, Any]]) -> Dict[str, List[str]]:
+        """table → raisons (synonyme, colonne ou valeur reconnue)."""
+        matches: Dict[str, List[str]] = {}
+        for table, synonyms in TABLE_SYNONYMS.items():
+            found = terms & synonyms
+            if found and table in schema:
+                matches.setdefault(table, []).extend(sorted(found))
+        for table, info in schema.items():
+            for col in info['columns']:
+                col_terms = set(tokenize(col['name'].replace("_", " ")))
+                if col_terms and col_terms <= terms and not col['pk'] and not col['fk']:
+                    matches.setdefault(table, []).append(col['name'])
+                for value in col['values'] or []:
+                    value_terms = set(tokenize(value))
+                    if value_terms and value_terms <= terms:
+                        matches.setdefault(table, []).append(f"{table}.{col['name']}='{value}'")
+        return matches
+
+    # --- Sémantique (optionnel) ---
+    def _semantic_tables(self, question: str, schema: Dict[str, Dict[str, Any]]) -> List[str]:
+        try:
+            with self._lock:
+                if self._encoder is None:
+                    self._encoder = create_encoder(ENCODER)
+                if self._table_vectors is None:
+                    names = sorted(schema)
+                    documents = [
+                        f"{name}: " + ", ".join(col['name'] for col in schema[name]['columns'])
+                        + " " + " ".join(sorted(TABLE_SYNONYMS.get(name, ())))
+                        for name in names
+                    ]
+                    self._table_vectors = (names, self._encoder.encode(documents))
+            names, vectors = self._table_vectors
+            scores = vectors @ self._encoder.encode([question], query=True)[0]
+            return [names[i] for i in np.argsort(-scores)[:2] if scores[i] >= SCHEMA_LINK_THRESHOLD]
+        except Exception as e:
+            print(f"⚠️ Schema linking sémantique indisponible: {str(e)}")
+            self.use_embeddings = False
+            return []
+
+    # --- Sélection ---
+    @staticmethod
+    def _expand(selected: Set[str], schema: Dict[str, Dict[str, Any]]) -> Set[str]:
+        """
+        Ajoute les tables de liaison reliant deux tables retenues, les tables
+        reliées par une table de liaison retenue, puis les cibles directes des
+        clés étrangères (noms du déclarant, de l'unité...).
+        """
+        def foreign_tables(table):
+            return {col['fk'].split(".")[0] for col in schema.get(table, {}).get('columns', []) if col['fk']}
+
+        def is_link_table(table):
+            columns = schema.get(table, {}).get('columns', [])
+            return bool(columns) and all(col['fk'] for col in columns)
+
+        result = set(selected)
+        for table in schema:
+            if is_link_table(table) and len(foreign_tables(table) & selected) >= 2:
+                result.add(table)
+        for table in list(result):
+            if is_link_table(table):
+                result |= foreign_tables(table)
+        for table in list(result):
+            if not is_link_table(table):
+                result |= foreign_tables(table)
+        return result
+
+    def link(self, question: str, conversation_history: Optional[list] = None) -> Dict[str, Any]:
+        """
+        Returns:
+            dict avec 'tables' (liste triée, None = schéma complet), 'reasons'
+            {table: [termes]} et 'values' (valeurs catégorielles citées)
+        """
+        schema = schema_catalog.get()
+        terms = set(tokenize(question))
+        reasons = self._lexical_tables(terms, schema)
+
+        for exchange in (conversation_history or [])[-2:]:
+            for table in tables_in_sql(exchange.get('sql', '')) & set(schema):
+                reasons.setdefault(table, []).append("historique")
+
+        if self.use_embeddings:
+            for table in self._semantic_tables(question, schema):
+                reasons.setdefault(table, []).append("sémantique")
+
+        if not reasons:
+            return {'tables': None, 'reasons': {}, 'values': []}
+
+        tables = self._expand(set(reasons), schema)
+        values = [reason for found in reasons.values() for reason in found if "=" in reason]
+        return {'tables': sorted(tables), 'reasons': reasons, 'values': values}
+
+
+def select_examples(question: str, examples: List[Dict[str, Any]], tables: Optional[List[str]],
+                    k: int = EXAMPLES_K) -> List[Dict[str, Any]]:
+    """
+    Les k exemples les plus proches: recouvrement des mots (Jaccard) + bonus
+    si leurs tables sont dans le sous-schéma retenu.
+    """
+    if k <= 0:
+        return []
+    terms = set(tokenize(question))
+    selected = set(tables or [])
+
+    def score(example):
+        example_terms = set(tokenize(example['question']))
+        overlap = len(terms & example_terms) / max(len(terms | example_terms), 1)
+        example_tables = tables_in_sql(example['sql'])
+        table_bonus = len(example_tables & selected) / max(len(example_tables), 1) if selected else 0.0
+        return overlap + 0.5 * table_bonus
+
+    ranked = sorted(examples, key=score, reverse=True)
+    return [example for example in ranked[:k] if score(example) > 0] or ranked[:1]
+
+
+def render_examples(examples: List[Dict[str, Any]]) -> str:
+    lines = ["## EXEMPLES SQL CORRECTS:"]
+    for i, example in enumerate(examples, 1):
+        lines.append(f"\n-- Ex{i}: {example['question']}\n{example['sql'].strip()}")
+    return "\n".join(lines)
+
+
+# Instance partagée
+schema_linker = SchemaLinker()
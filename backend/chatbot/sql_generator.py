@@ -21,72 +21,24 @@ EXEMPLE D'UTILISATION:
 LIMITES:
 - Maximum 5 tentatives de génération SQL avant abandon
 - Historique limité aux 5 derniers échanges
-- Nécessite GEMINI_API_KEY configurée
+- Nécessite GEMINI_API_KEY configurée (sauf LLM_BACKEND=replay, voir llm_backend.py)
 """
 
-import os
 from dotenv import load_dotenv
-import google.generativeai as genai
 from typing import Optional, Dict, Any
 import re
 
-load_dotenv()
-
-class SQLGenerator:
-    """Générateur de requêtes SQL à partir de langage naturel."""
-    
-    def __init__(self):
-        """Initialise le générateur SQL avec Gemini."""
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY non trouvée")
-        
-        genai.configure(api_key=api_key)
-        try:
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
-        except:
-            self.model = genai.GenerativeModel('gemini-pro')
-    
-    def get_database_schema_detailed(self) -> str:
-        """Retourne un schéma détaillé de la base de données pour la génération SQL."""
-        return """
-## SCHÉMA POSTGRESQL
-
-### person (personnes)
-- person_id (PK)
-- matricule, name, family_name, role
+from llm_backend import get_llm_model
+from schema_catalog import schema_catalog
+from schema_linking import schema_linker, select_examples, render_examples, EXAMPLES_K
+from example_store import example_store
+from tracing import tracer, record_prompt
 
-### organizational_unit (unités)
-- unit_id (PK)
-- identifier, name, location
-
-### event (événements - TABLE CENTRALE)
-- event_id (PK)
-- declared_by_id (FK → person.person_id)
-- description (TEXT)
-- start_datetime, end_datetime
-- organizational_unit_id (FK → organizational_unit.unit_id)
-- type, classification
-
-### risk (risques)
-- risk_id (PK)
-- name, gravity, probability
-
-### corrective_measure (mesures)
-- measure_id (PK)
-- name, description
-- owner_id (FK → person.person_id)
-- implementation_date, cost
-- organizational_unit_id (FK → organizational_unit.unit_id)
-
-### TABLES DE LIAISON:
-- event_employee (event_id, person_id)
-- event_risk (event_id, risk_id)
-- event_corrective_measure (event_id, measure_id)
-
-## EXEMPLES SQL CORRECTS:
+load_dotenv()
 
--- Ex1: Événements récents avec détails
+# Exemples de référence (les plus proches de la question sont mis dans le prompt)
+SQL_EXAMPLES = [
+    {'question': "Événements récents avec détails", 'sql': """
 SELECT e.event_id, e.description, e.type, e.classification, 
        e.start_datetime, p.name || ' ' || p.family_name AS declarant,
        ou.name AS unite
@@ -94,39 +46,71 @@ FROM event e
 LEFT JOIN person p ON e.declared_by_id = p.person_id
 LEFT JOIN organizational_unit ou ON e.organizational_unit_id = ou.unit_id
 ORDER BY e.start_datetime DESC 
-LIMIT 10;
-
--- Ex2: Personnes impliquées dans événement spécifique
+LIMIT 10;"""},
+    {'question': "Personnes impliquées dans un événement spécifique", 'sql': """
 SELECT p.person_id, p.name, p.family_name, p.role
 FROM person p
 INNER JOIN event_employee ee ON p.person_id = ee.person_id
-WHERE ee.event_id = 5;
-
--- Ex3: Statistiques par type d'événement (GROUP BY)
+WHERE ee.event_id = 5;"""},
+    {'question': "Statistiques par type d'événement (GROUP BY)", 'sql': """
 SELECT e.type, COUNT(*) AS nombre, 
        COUNT(DISTINCT e.declared_by_id) AS nb_declarants
 FROM event e
 GROUP BY e.type
-ORDER BY nombre DESC;
-
--- Ex4: Risques critiques avec leurs événements
+ORDER BY nombre DESC;"""},
+    {'question': "Risques critiques avec leurs événements", 'sql': """
 SELECT r.risk_id, r.name, r.gravity, r.probability,
        COUNT(er.event_id) AS nb_events
 FROM risk r
 LEFT JOIN event_risk er ON r.risk_id = er.risk_id
 WHERE r.gravity = 'Élevée' OR r.gravity = 'Critique'
 GROUP BY r.risk_id, r.name, r.gravity, r.probability
-ORDER BY nb_events DESC;
-
--- Ex5: Coût total des mesures par unité
+ORDER BY nb_events DESC;"""},
+    {'question': "Coût total des mesures par unité", 'sql': """
 SELECT ou.name AS unite, 
        COUNT(cm.measure_id) AS nb_mesures,
        COALESCE(SUM(cm.cost), 0) AS cout_total
 FROM organizational_unit ou
 LEFT JOIN corrective_measure cm ON ou.unit_id = cm.organizational_unit_id
 GROUP BY ou.unit_id, ou.name
-ORDER BY cout_total DESC;
-"""
+ORDER BY cout_total DESC;"""},
+]
+
+
+class SQLGenerator:
+    """Générateur de requêtes SQL à partir de langage naturel."""
+    
+    def __init__(self, model=None):
+        """
+        Initialise le générateur SQL.
+        
+        Args:
+            model: Modèle LLM à utiliser (par défaut le modèle partagé choisi par LLM_BACKEND)
+        """
+        self.model = model if model is not None else get_llm_model()[0]
+    
+    def get_database_schema_detailed(self, question: Optional[str] = None,
+                                     conversation_history: list = None) -> str:
+        """
+        Schéma lu dans le catalogue PostgreSQL (voir schema_catalog.py) + exemples SQL.
+        Avec une question, seuls le sous-schéma concerné et les exemples les plus
+        proches sont gardés (voir schema_linking.py et example_store.py).
+        """
+        if question is None:
+            return schema_catalog.render() + "\n\n" + render_examples(SQL_EXAMPLES)
+        
+        with tracer.span("schema_linking") as span:
+            linked = schema_linker.link(question, conversation_history)
+            # Exemples appris des requêtes réussies d'abord, complétés par les exemples statiques
+            learned = example_store.nearest(question, EXAMPLES_K)
+            examples = learned + select_examples(question, SQL_EXAMPLES, linked['tables'], EXAMPLES_K - len(learned))
+            span.set(tables=len(linked['tables'] or []), pruned=linked['tables'] is not None,
+                     examples=len(examples), learned_examples=len(learned))
+        
+        schema = schema_catalog.render(linked['tables'])
+        if linked['values']:
+            schema += "\n\nValeurs citées dans la question: " + ", ".join(linked['values'])
+        return schema + "\n\n" + render_examples(examples)
     
     def generate_sql_query(self, question: str, conversation_history: list = None) -> Dict[str, Any]:
         """
@@ -139,7 +123,7 @@ ORDER BY cout_total DESC;
         Returns:
             Dict contenant 'sql', 'explanation', et 'success'
         """
-        schema = self.get_database_schema_detailed()
+        schema = self.get_database_schema_detailed(question, conversation_history)
         
         # Construire le contexte de conversation DÉTAILLÉ
         history_context = ""
@@ -233,8 +217,10 @@ Format de réponse:
 """
         
         try:
-            response = self.model.generate_content(prompt)
-            response_text = response.text
+            with tracer.span("llm_call", prompt="sql"):
+                record_prompt("sql", prompt)
+                response = self.model.generate_content(prompt)
+                response_text = response.text
             
             # Extraction du SQL
             sql_match = re.search(r'\[SQL_START\](.*?)\[SQL_END\]', response_text, re.DOTALL)
@@ -0,0 +1,70 @@
+# test_data_retriever.py - Contexte des descriptions quand le SQL échoue
+"""
+Lancement: cd backend/chatbot && python -m pytest test_data_retriever.py
+
+La session SQLAlchemy est remplacée par un double qui reproduit une
+transaction PostgreSQL en échec: toute requête est refusée tant que
+rollback() n'a pas été appelé.
+"""
+
+import os
+from unittest import mock
+
+# Aucun appel LLM dans ce test: backend rejoué, sans clé API (voir llm_backend.py)
+os.environ.setdefault("LLM_BACKEND", "replay")
+
+import data_retriever  # noqa: E402
+from data_retriever import DataRetriever  # noqa: E402
+
+
+class AbortedTransactionSession:
+    """Session dont la transaction passe en échec à la première erreur SQL."""
+
+    def __init__(self):
+        self.aborted = False
+        self.bind = None
+
+    def fail(self):
+        self.aborted = True
+        raise RuntimeError('relation "evenement" does not exist')
+
+    def check(self):
+        if self.aborted:
+            raise RuntimeError("InFailedSqlTransaction: current transaction is aborted")
+
+    def rollback(self):
+        self.aborted = False
+
+    def close(self):
+        self.aborted = False
+
+
+def test_descriptions_merged_when_last_sql_attempt_fails():
+    session = AbortedTransactionSession()
+    documents = [{'source': 'event', 'id': 7, 'description': "Chute dans l'escalier"}]
+
+    def search_descriptions(db, query):
+        db.check()
+        return documents
+
+    retriever = DataRetriever()
+    retriever.db = session
+    retriever.sql_gen = mock.Mock()
+    retriever.sql_gen.generate_sql_query.return_value = {
+        'success': True, 'sql': "SELECT * FROM evenement", 'explanation': "requête invalide"
+    }
+    retriever.sql_gen.validate_sql_safety.return_value = True
+    retriever.sql_gen.format_sql_pretty.side_effect = lambda sql: sql
+
+    with mock.patch.object(data_retriever, "replica_monitor"), \
+            mock.patch.object(data_retriever, "match_intent", return_value=None), \
+            mock.patch.object(data_retriever.prepared_statements, "execute",
+                              side_effect=lambda db, sql, params=None: db.fail()), \
+            mock.patch.object(data_retriever.description_retriever, "search", side_effect=search_descriptions), \
+            mock.patch.object(data_retriever, "format_documents", return_value="## Descriptions pertinentes"):
+        result = retriever.search_relevant_data("Quels accidents dans l'escalier ?")
+
+    assert result['success'] is False
+    assert result['attempts'] == 5
+    assert result['document_count'] == 1
+    assert "## Descriptions pertinentes" in result['context']
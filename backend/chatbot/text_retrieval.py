@@ -0,0 +1,202 @@
+# text_retrieval.py - Recherche plein texte et sémantique dans les descriptions
+"""
+Index de recherche sur event.description et corrective_measure.description
+pour le RAG (questions du type « événements similaires à un déversement chimique »).
+
+- Plein texte PostgreSQL: index GIN sur to_tsvector('french', description),
+  requête en OU des lexèmes de la question, classement par ts_rank.
+- Sémantique (optionnel, CHAT_EMBEDDINGS=local|gemini): index d'embeddings
+  incrémental persisté en mmap (voir embedding_index.py), similarité cosinus.
+
+Les deux classements sont fusionnés par Reciprocal Rank Fusion (RRF).
+"""
+
+import os
+import re
+from typing import List, Dict, Any, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from database import engine, SessionLocal
+from embedding_index import EmbeddingIndex, ENCODER
+from tracing import tracer, metrics
+
+# Nombre de descriptions ajoutées au contexte
+RETRIEVAL_TOP_K = int(os.environ.get("CHAT_RETRIEVAL_TOP_K", "8"))
+RRF_K = 60
+
+# Source → (table SQL, clé primaire, libellé affiché, requête de détail)
+SOURCES = {
+    "event": ("event", "event_id", "Événement", """
+        SELECT e.event_id AS id, e.description, e.type, e.classification,
+               e.start_datetime, ou.name AS unit
+        FROM event e
+        LEFT JOIN organizational_unit ou ON ou.unit_id = e.organizational_unit_id
+        WHERE e.event_id = ANY(:ids)
+    """),
+    "measure": ("corrective_measure", "measure_id", "Mesure corrective", """
+        SELECT cm.measure_id AS id, cm.description, cm.name, cm.cost,
+               cm.implementation_date, ou.name AS unit
+        FROM corrective_measure cm
+        LEFT JOIN organizational_unit ou ON ou.unit_id = cm.organizational_unit_id
+        WHERE cm.measure_id = ANY(:ids)
+    """),
+}
+
+# Même expression dans l'index et dans la requête (sinon l'index GIN n'est pas utilisé)
+TSVECTOR = "to_tsvector('french'::regconfig, coalesce(description, ''))"
+
+FTS_INDEXES_DDL = f"""
+CREATE INDEX IF NOT EXISTS idx_event_description_fts ON event USING gin ({TSVECTOR});
+CREATE INDEX IF NOT EXISTS idx_measure_description_fts ON corrective_measure USING gin ({TSVECTOR});
+"""
+
+# Mots de la question sans valeur pour la recherche (en plus des stopwords 'french')
+QUERY_STOPWORDS = {
+    "événement", "événements", "evenement", "evenements", "mesure", "mesures",
+    "corrective", "correctives", "similaire", "similaires", "semblable", "semblables",
+    "ressemble", "ressemblent", "ressemblant", "comme", "liste", "lister", "montre",
+    "montre-moi", "trouve", "trouver", "quels", "quelles", "description", "descriptions",
+    "parle", "parlent", "mentionne", "mentionnent", "concernant", "type", "genre",
+}
+
+# Questions qui portent sur le contenu des descriptions
+SEMANTIC_PATTERN = re.compile(
+    r"similaire|semblable|ressembl|comme (un|une|le|la|les|des)|du même genre|du même type|"
+    r"parl(e|ent) de|mentionn|concernant|à propos d|impliquant|lié(e|s)? à|décri|description",
+    re.IGNORECASE
+)
+
+
+def is_semantic_question(question: str) -> bool:
+    """La question porte-t-elle sur le contenu des descriptions (recherche par le sens) ?"""
+    return bool(SEMANTIC_PATTERN.search(question))
+
+
+def search_terms(question: str) -> str:
+    """Mots utiles de la question (les stopwords français sont retirés par PostgreSQL)."""
+    words = re.findall(r"[\w'-]+", question.lower())
+    return " ".join(w for w in words if w not in QUERY_STOPWORDS and len(w) > 2)
+
+
+def install_fts_indexes(engine):
+    """Crée les index GIN plein texte (idempotent)."""
+    with engine.begin() as conn:
+        conn.execute(text(FTS_INDEXES_DDL))
+
+
+def search_fulltext(db: Session, source: str, question: str, limit: int) -> List[Tuple[int, float]]:
+    """
+    (id, score) des descriptions de `source` correspondant à la question.
+    Les lexèmes sont combinés en OU: ts_rank favorise les documents qui en contiennent le plus.
+    """
+    terms = search_terms(question)
+    if not terms:
+        return []
+    table, pk, _, _ = SOURCES[source]
+    rows = db.execute(text(f"""
+        WITH q AS (
+            SELECT NULLIF(replace(plainto_tsquery('french', :terms)::text, '&', '|'), '')::tsquery AS query
+        )
+        SELECT {pk}, ts_rank({TSVECTOR}, q.query) AS score
+        FROM {table}, q
+        WHERE {TSVECTOR} @@ q.query
+        ORDER BY score DESC
+        LIMIT :limit
+    """), {"terms": terms, "limit": limit}).fetchall()
+    return [(row[0], float(row[1])) for row in rows]
+
+
+class DescriptionRetriever:
+    """Recherche plein texte + sémantique dans les descriptions, résultats fusionnés."""
+
+    def __init__(self, session_factory):
+        self.embeddings = EmbeddingIndex(session_factory) if ENCODER != "off" else None
+        self._started = False
+
+    def start(self):
+        """
+        Crée les index plein texte et lance le chargement de l'index sémantique
+        (au démarrage de chat_api, sinon au premier appel).
+        """
+        if self._started:
+            return
+        self._started = True
+        try:
+            install_fts_indexes(engine)
+            print("✅ Index plein texte des descriptions prêts")
+        except Exception as e:
+            print(f"⚠️ Impossible de créer les index plein texte: {str(e)}")
+        if self.embeddings is not None:
+            self.embeddings.start()
+
+    def search(self, db: Session, question: str, top_k: int = RETRIEVAL_TOP_K) -> List[Dict[str, Any]]:
+        """
+        Descriptions les plus pertinentes pour la question.
+
+        Returns:
+            liste de dicts {'source', 'id', 'label', 'score', 'matched_by', + colonnes de détail}
+        """
+        self.start()
+        with tracer.span("description_search") as span:
+            fused: Dict[Tuple[str, int], float] = {}
+            matched_by: Dict[Tuple[str, int], set] = {}
+
+            def add(ranking, method):
+                for rank, (source, doc_id) in enumerate(ranking):
+                    key = (source, doc_id)
+                    fused[key] = fused.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+                    matched_by.setdefault(key, set()).add(method)
+
+            for source in SOURCES:
+                add([(source, doc_id) for doc_id, _ in search_fulltext(db, source, question, top_k)], "fts")
+
+            if self.embeddings is not None:
+                try:
+                    add([(source, doc_id) for source, doc_id, _ in self.embeddings.search(question, top_k)], "vector")
+                except Exception as e:
+                    span.set(vector_error=str(e))
+
+            ranked = sorted(fused.items(), key=lambda item: -item[1])[:top_k]
+            documents = self._load(db, [key for key, _ in ranked])
+            results = []
+            for key, score in ranked:
+                if key in documents:
+                    results.append({**documents[key], 'score': round(score, 4),
+                                    'matched_by': "+".join(sorted(matched_by[key]))})
+            span.set(results=len(results), vector=self.embeddings is not None and self.embeddings.ready)
+            metrics.observe('chat_rows_returned', len(results), source="descriptions")
+            return results
+
+    @staticmethod
+    def _load(db: Session, keys: List[Tuple[str, int]]) -> Dict[Tuple[str, int], Dict[str, Any]]:
+        """Détails des documents retenus (une requête par source)."""
+        documents = {}
+        for source, (_, _, label, detail_sql) in SOURCES.items():
+            ids = [doc_id for s, doc_id in keys if s == source]
+            if not ids:
+                continue
+            for row in db.execute(text(detail_sql), {"ids": ids}).mappings():
+                documents[(source, row['id'])] = {'source': source, 'label': label, **row}
+        return documents
+
+
+def format_documents(documents: List[Dict[str, Any]]) -> str:
+    """
+    Section de contexte pour le LLM. Pas de lignes « - clé: valeur » pour ne pas
+    être confondues avec les résultats SQL (parse_context_to_dataframe).
+    """
+    lines = [f"## Descriptions pertinentes ({len(documents)} document(s), recherche plein texte/sémantique):\n"]
+    for doc in documents:
+        details = ", ".join(
+            f"{key}: {doc[key]}" for key in ('name', 'type', 'classification', 'unit', 'start_datetime',
+                                             'implementation_date', 'cost')
+            if doc.get(key) is not None
+        )
+        lines.append(f"[{doc['label']} {doc['id']}] ({details}) {doc.get('description') or ''}")
+    return "\n".join(lines)
+
+
+# Instance partagée (l'index sémantique est commun à tous les DataRetriever)
+description_retriever = DescriptionRetriever(SessionLocal)
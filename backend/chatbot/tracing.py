@@ -0,0 +1,273 @@
+"""
+Traces et métriques légères (maison) pour chaque tour de chat.
+
+- Spans imbriqués: `with tracer.span("sql_generation", attempt=1) as span:`
+  Le span racine d'un tour ("chat_turn") est exporté avec tout son arbre dans
+  un fichier JSONL si CHAT_TRACE_FILE est défini.
+- Métriques (compteurs + histogrammes) en mémoire, exportées au format texte
+  Prometheus (endpoint /metrics de chat_api.py).
+
+Agrégation d'un fichier de traces:
+    python tracing.py chat_traces.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+# Fichier JSONL des traces (vide = pas d'export fichier)
+TRACE_FILE = os.environ.get("CHAT_TRACE_FILE", "")
+# Nombre de traces récentes gardées en mémoire
+RECENT_TRACES = int(os.environ.get("CHAT_RECENT_TRACES", "50"))
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+COUNT_BUCKETS = (1, 2, 3, 4, 5)
+
+# Description et buckets de chaque métrique
+METRICS = {
+    'chat_turns_total': ("counter", "Tours de chat traités", None),
+    'chat_general_questions_total': ("counter", "Questions générales (sans requête SQL)", None),
+    'chat_stage_duration_seconds': ("histogram", "Durée de chaque étape (span)", DURATION_BUCKETS),
+    'chat_stage_errors_total': ("counter", "Étapes terminées en erreur", None),
+    'chat_sql_attempts': ("histogram", "Tentatives de génération SQL par question", COUNT_BUCKETS),
+    'chat_sql_retries_total': ("counter", "Nouvelles tentatives SQL après une erreur", None),
+    'chat_intent_hits_total': ("counter", "Questions servies par une requête prédéfinie (label intent)", None),
+    'chat_rows_returned': ("histogram", "Lignes retournées par la requête SQL", SIZE_BUCKETS),
+    'chat_prompt_chars': ("histogram", "Taille des prompts envoyés au LLM (caractères)", SIZE_BUCKETS),
+    'chat_prompt_tokens_total': ("counter", "Tokens de prompt envoyés au LLM (estimation)", None),
+    'chat_chart_attempts': ("histogram", "Tentatives d'exécution du code Plotly", COUNT_BUCKETS),
+    'chat_cache_requests_total': ("counter", "Accès aux caches (result=hit|miss)", None),
+}
+
+
+# === MÉTRIQUES ===
+class Metrics:
+    """Registre de compteurs et d'histogrammes, thread-safe."""
+
+    def __init__(self):
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        with self._lock:
+            self._counters[self._key(name, labels)] += value
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = METRICS.get(name, (None, None, SIZE_BUCKETS))[2] or SIZE_BUCKETS
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = {'buckets': buckets, 'counts': [0] * len(buckets), 'count': 0, 'sum': 0.0}
+                self._histograms[key] = histogram
+            histogram['count'] += 1
+            histogram['sum'] += value
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Valeurs courantes (pour debug / tests de charge)."""
+        with self._lock:
+            return {
+                'counters': {f"{n}{dict(l)}": v for (n, l), v in self._counters.items()},
+                'histograms': {f"{n}{dict(l)}": {'count': h['count'], 'sum': h['sum']}
+                               for (n, l), h in self._histograms.items()}
+            }
+
+    def render_prometheus(self) -> str:
+        """Exporte les métriques au format texte Prometheus."""
+        def fmt_labels(labels, extra=None):
+            items = list(labels) + (extra or [])
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+        lines = []
+        with self._lock:
+            names = sorted({n for n, _ in self._counters} | {n for n, _ in self._histograms})
+            for name in names:
+                kind, help_text, _ = METRICS.get(name, ("untyped", name, None))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (n, labels), value in sorted(self._counters.items()):
+                    if n == name:
+                        lines.append(f"{name}{fmt_labels(labels)} {value:g}")
+                for (n, labels), h in sorted(self._histograms.items()):
+                    if n != name:
+                        continue
+                    for bound, count in zip(h['buckets'], h['counts']):
+                        lines.append(f"{name}_bucket{fmt_labels(labels, [('le', f'{bound:g}')])} {count}")
+                    lines.append(f"{name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {h['count']}")
+                    lines.append(f"{name}_sum{fmt_labels(labels)} {h['sum']:g}")
+                    lines.append(f"{name}_count{fmt_labels(labels)} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def record_prompt(kind: str, prompt: str):
+    """Enregistre la taille d'un prompt (caractères + tokens estimés ≈ 4 car./token)."""
+    metrics.observe('chat_prompt_chars', len(prompt), prompt=kind)
+    metrics.inc('chat_prompt_tokens_total', max(1, len(prompt) // 4), prompt=kind)
+    span = tracer.current()
+    if span is not None:
+        span.set(prompt_chars=len(prompt))
+
+
+def record_cache(cache: str, hit: bool):
+    """Compte un accès à un cache."""
+    metrics.inc('chat_cache_requests_total', cache=cache, result="hit" if hit else "miss")
+
+
+# === TRACES ===
+_current_span = contextvars.ContextVar("chat_current_span", default=None)
+
+
+class Span:
+    """Étape chronométrée d'un tour de chat."""
+
+    def __init__(self, tracer: "Tracer", name: str, parent: Optional["Span"] = None, **attributes):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attributes = dict(attributes)
+        self.children: List["Span"] = []
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        """Termine le span: durée, métrique par étape, rattachement au parent ou export."""
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        metrics.observe('chat_stage_duration_seconds', self.duration, stage=self.name)
+        if 'error' in self.attributes:
+            metrics.inc('chat_stage_errors_total', stage=self.name)
+
+        if self.parent is not None:
+            self.parent.children.append(self)
+        else:
+            self.tracer.export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'span_id': self.span_id,
+            'start': datetime.fromtimestamp(self.started_at).isoformat(),
+            'duration_ms': round((self.duration or 0) * 1000, 2),
+            'attributes': self.attributes,
+            'children': [child.to_dict() for child in self.children]
+        }
+
+
+class Tracer:
+    """Crée les spans et exporte les traces terminées (JSONL + mémoire)."""
+
+    def __init__(self, trace_file: str = TRACE_FILE, keep: int = RECENT_TRACES):
+        self.trace_file = trace_file
+        self.recent = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+        """Crée un span sans l'activer (à terminer avec span.end())."""
+        return Span(self, name, parent if parent is not None else self.current(), **attributes)
+
+    @contextmanager
+    def scope(self, span: Span, end: bool = True):
+        """
+        Rend `span` parent des spans créés dans le bloc. Les erreurs sont notées
+        dans le span puis relancées; le span est terminé à la sortie si `end`.
+        """
+        previous = _current_span.get()
+        _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.set(error=f"{type(e).__name__}: {str(e)}")
+            raise
+        finally:
+            _current_span.set(previous)
+            if end:
+                span.end()
+
+    def activate(self, span: Span):
+        """Active un span existant sans le terminer (reprise après un yield, autre thread...)."""
+        return self.scope(span, end=False)
+
+    def span(self, name: str, parent: Optional[Span] = None, **attributes):
+        """Chronomètre un bloc: `with tracer.span("db_execute") as span:`."""
+        return self.scope(self.start_span(name, parent, **attributes))
+
+    def export(self, span: Span):
+        """Exporte une trace complète (span racine)."""
+        record = {'trace_id': span.trace_id, **span.to_dict()}
+        with self._lock:
+            self.recent.append(record)
+            if self.trace_file:
+                with open(self.trace_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+tracer = Tracer()
+
+
+# === AGRÉGATION D'UN FICHIER DE TRACES ===
+def _walk(span: Dict[str, Any]):
+    yield span
+    for child in span.get('children', []):
+        yield from _walk(child)
+
+
+def aggregate(path: str) -> Dict[str, Dict[str, float]]:
+    """Durées par étape (count, p50, p95, max en ms) à partir d'un fichier JSONL."""
+    durations = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                for span in _walk(json.loads(line)):
+                    durations[span['name']].append(span['duration_ms'])
+
+    stats = {}
+    for name, values in durations.items():
+        values.sort()
+        stats[name] = {
+            'count': len(values),
+            'p50': values[int(0.50 * (len(values) - 1))],
+            'p95': values[int(0.95 * (len(values) - 1))],
+            'max': values[-1]
+        }
+    return stats
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python tracing.py <chat_traces.jsonl>")
+        sys.exit(1)
+    print(f"{'Étape':<22} {'N':>6} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+    for name, s in sorted(aggregate(sys.argv[1]).items(), key=lambda item: -item[1]['p95']):
+        print(f"{name:<22} {s['count']:>6} {s['p50']:>10.1f} {s['p95']:>10.1f} {s['max']:>10.1f}")
@@ -0,0 +1,6 @@
+#!/bin/sh
+set -e
+
+# Autorise les connexions de réplication (service db_replica, profil "replica").
+# Exécuté seulement à l'initialisation du volume: sur une base existante, ajouter la ligne à la main.
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
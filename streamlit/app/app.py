@@ -7,10 +7,12 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 from chatbot_integration import render_chatbot
+from data_store import DashboardDataStore
 import google.generativeai as genai
 from PIL import Image
 import io
 import os
+import unicodedata
 from dotenv import load_dotenv
 
 # Charger les variables d'environnement
@@ -482,9 +484,15 @@ st.markdown("""
 # URL de base de l'API
 BASE_URL = "http://api:8000"
 
+def api_headers():
+    """En-tête indiquant la page du dashboard à l'origine de l'appel (métriques de l'API)"""
+    current_page = globals().get("page", "Démarrage")
+    ascii_page = unicodedata.normalize("NFKD", current_page).encode("ascii", "ignore").decode().strip()
+    return {"X-Dashboard-Page": ascii_page or "inconnue"}
+
 # Vérification de la connexion API
 try:
-    res = requests.get(f"{BASE_URL}/", timeout=5)
+    res = requests.get(f"{BASE_URL}/", headers=api_headers(), timeout=5)
     if res.status_code != 200:
         st.error("Impossible de se connecter à l'API. Vérifiez que le backend est en cours d'exécution.")
         st.stop()
@@ -518,64 +526,118 @@ st.sidebar.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-# Fonctions helper pour récupérer les noms depuis l'API
-@st.cache_data(ttl=300)  # Cache pendant 5 minutes
-def get_units_mapping():
-    """Récupère toutes les unités et retourne un dict {unit_id: name}"""
-    try:
-        response = requests.get(f"{BASE_URL}/units/", params={"limit": 1000}, timeout=5)
-        if response.status_code == 200:
-            units = response.json()
-            return {unit['unit_id']: unit.get('name', f"Unit {unit['unit_id']}") for unit in units}
-    except:
-        pass
-    return {}
+def get_kpi_summary():
+    """Totaux des cartes KPI: vues pré-agrégées de l'API, sinon calcul sur les DataFrames."""
+    summary = get_data_store().kpi("summary")
+    if summary is not None:
+        return summary
+    
+    summary = {
+        'total_events': len(df_events),
+        'total_measures': len(df_measures),
+        'total_cost': df_measures['cost'].sum() if not df_measures.empty and 'cost' in df_measures.columns else 0,
+        'units_with_events': df_events['unit_name'].nunique() if 'unit_name' in df_events.columns else 0,
+        'total_units': len(df_units),
+        'monthly_average': None,
+        'monthly_max': None
+    }
+    if not df_events.empty and 'start_datetime' in df_events.columns:
+        dates = df_events['start_datetime'].dropna()
+        if len(dates) > 0:
+            monthly = dates.dt.to_period('M').value_counts()
+            summary['monthly_average'] = monthly.mean()
+            summary['monthly_max'] = monthly.max()
+    return summary
 
-@st.cache_data(ttl=300)
-def get_persons_mapping():
-    """Récupère toutes les personnes et retourne un dict {person_id: name}"""
-    try:
-        response = requests.get(f"{BASE_URL}/persons/", params={"limit": 1000}, timeout=5)
-        if response.status_code == 200:
-            persons = response.json()
-            return {
-                person['person_id']: f"{person.get('name', '')} {person.get('family_name', '')}".strip() or f"Person {person['person_id']}"
-                for person in persons
-            }
-    except:
-        pass
-    return {}
+def get_kpi_counts(path, fallback, columns, limit=None):
+    """
+    Répartition (label, nombre) depuis les vues KPI de l'API, sinon `fallback()`
+    (value_counts sur les DataFrames). Retourne un DataFrame aux colonnes `columns`.
+    """
+    counts = get_data_store().kpi(path)
+    if counts is not None:
+        df_counts = pd.DataFrame(counts, columns=['label', 'count'])
+    else:
+        df_counts = fallback().reset_index()
+    if limit is not None:
+        df_counts = df_counts.head(limit)
+    df_counts.columns = columns
+    return df_counts
 
-# Fonction pour charger TOUTES les données d'un endpoint
-@st.cache_data(ttl=60)  # Cache pendant 1 minute
-def get_all_data(endpoint_url):
-    """Récupère toutes les données d'un endpoint en gérant la pagination"""
-    all_items = []
-    skip = 0
-    limit = 1000
-    
-    while True:
-        try:
-            response = requests.get(endpoint_url, params={"skip": skip, "limit": limit}, timeout=10)
-            if response.status_code == 200:
-                items = response.json()
-                if not items:
-                    break
-                all_items.extend(items)
-                if len(items) < limit:
-                    break
-                skip += limit
-            else:
-                break
-        except:
-            break
-    
-    return all_items
+def lookup_selectbox(label, table, key, current_id=None):
+    """
+    Sélecteur d'enregistrement avec recherche côté API (/lookups, classement par
+    trigrammes): seuls les meilleurs résultats et la valeur courante sont chargés,
+    la liste déroulante filtre ensuite ces résultats pendant la frappe.
+    Retourne l'ID choisi, ou None si l'API est indisponible ou sans résultat.
+    """
+    search = st.text_input(f"🔍 Rechercher - {label}", key=f"{key}_search",
+                           placeholder="Nom, matricule, identifiant, description ou ID...")
+    options = get_data_store().lookup(table, q=search, ids=[current_id] if current_id else None)
+    if not options:
+        if options is not None:
+            st.info(f"Aucun résultat pour « {search} »" if search else "Aucun enregistrement trouvé dans cette table")
+        return None
+    
+    options_dict = {opt['id']: f"#{opt['id']} - {opt['label']}" for opt in options}
+    option_ids = list(options_dict.keys())
+    return st.selectbox(
+        label,
+        option_ids,
+        format_func=lambda x: options_dict[x],
+        index=option_ids.index(current_id) if current_id in options_dict else 0,
+        key=key
+    )
+
+def fetch_record(table, record_id):
+    """Récupère un enregistrement par son ID (None si introuvable)."""
+    response = requests.get(f"{BASE_URL}/{table}/{record_id}", headers=api_headers(), timeout=5)
+    return response.json() if response.status_code == 200 else None
 
-# Charger les mappings
-units_map = get_units_mapping()
-persons_map = get_persons_mapping()
+def foreign_key_table(field_name):
+    """Table référencée par une clé étrangère (None si inconnue)."""
+    if 'unit' in field_name:
+        return "units"
+    if 'person' in field_name or 'owner' in field_name or 'declared_by' in field_name:
+        return "persons"
+    if 'risk' in field_name:
+        return "risks"
+    return None
 
+def build_event_cards(df_page):
+    """Champs d'affichage et HTML des cartes d'événements en une passe vectorisée (sans iterrows)."""
+    if df_page.empty:
+        return []
+    
+    classification = df_page['classification'].fillna('').astype(str).str.lower()
+    danger = classification.str.contains('danger|critical|grave')
+    warning = ~danger & classification.str.contains('warn|moyen')
+    
+    cards = pd.DataFrame({'event_id': df_page['event_id']})
+    cards['badge_class'] = np.select([danger, warning], ['badge-danger', 'badge-warning'], 'badge-success')
+    cards['badge_text'] = np.select([danger, warning], ['CRITIQUE', 'ATTENTION'], 'NORMAL')
+    cards['type'] = df_page['type'].fillna('N/A').astype(str)
+    cards['title'] = pd.Series(np.where(danger | warning, '[!] ', '[✓] '), index=cards.index) + cards['type']
+    
+    dates = pd.to_datetime(df_page['start_datetime'], errors='coerce')
+    cards['date'] = dates.dt.strftime('%d/%m/%Y %H:%M').fillna('N/A')
+    cards['date_short'] = dates.dt.strftime('%d/%m').fillna('N/A')
+    cards['unit'] = df_page['unit_name'].fillna('Non spécifié').astype(str)
+    cards['classification'] = df_page['classification'].fillna('N/A').astype(str)
+    cards['description'] = df_page['description'].fillna('Aucune description').astype(str)
+    description_short = cards['description'].str.slice(0, 80)
+    cards['description_short'] = description_short.where(cards['description'].str.len() <= 80, description_short + '...')
+    
+    cards['html'] = (
+        "<div style='background: rgba(30, 41, 59, 0.6); border-radius: 12px; padding: 1rem; margin-bottom: 0.5rem; border: 1px solid rgba(100, 116, 139, 0.3);'>"
+        + "<span class='event-badge " + cards['badge_class'] + "' style='display: inline-block; margin-bottom: 0.5rem;'>" + cards['badge_text'] + "</span>"
+        + "<h4 style='color: #f1f5f9; margin: 0.5rem 0;'>" + cards['title'] + "</h4>"
+        + "<p style='color: #94a3b8; font-size: 0.9rem; margin: 0.3rem 0;'>" + cards['date_short'] + "</p>"
+        + "<p style='color: #94a3b8; font-size: 0.85rem; margin: 0.3rem 0;'>" + cards['unit'].str.slice(0, 30) + "</p>"
+        + "<p style='color: #64748b; font-size: 0.85rem; margin-top: 0.5rem;'>" + cards['description_short'] + "</p>"
+        + "</div>"
+    )
+    return cards.to_dict('records')
 
 # Initialize session state for pagination
 if 'skip' not in st.session_state:
@@ -597,54 +659,23 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-# Charger toutes les données nécessaires
-@st.cache_data(ttl=120)
-def load_all_dashboard_data():
-    """Charge toutes les données pour le dashboard"""
-    data = {}
-    
-    # Charger events
-    events_url = f"{BASE_URL}/events/"
-    data['events'] = get_all_data(events_url)
-    
-    # Charger measures
-    measures_url = f"{BASE_URL}/measures/"
-    data['measures'] = get_all_data(measures_url)
-    
-    # Charger risks
-    risks_url = f"{BASE_URL}/risks/"
-    data['risks'] = get_all_data(risks_url)
-    
-    # Charger units
-    units_url = f"{BASE_URL}/units/"
-    data['units'] = get_all_data(units_url)
-    
-    # Charger persons
-    persons_url = f"{BASE_URL}/persons/"
-    data['persons'] = get_all_data(persons_url)
-    
-    return data
+# Magasin de données partagé par toutes les sessions (un par processus)
+@st.cache_resource
+def get_data_store():
+    """DataFrames typés et enrichis, rafraîchis en arrière-plan (voir data_store.py)"""
+    return DashboardDataStore(BASE_URL)
+
+# Le magasin est partagé: la page courante est transmise à chaque exécution du script
+get_data_store().use_headers(api_headers())
 
 with st.spinner("🔄 Chargement du dashboard..."):
-    dashboard_data = load_all_dashboard_data()
-    
-    # Préparer les DataFrames
-    df_events = pd.DataFrame(dashboard_data['events']) if dashboard_data['events'] else pd.DataFrame()
-    df_measures = pd.DataFrame(dashboard_data['measures']) if dashboard_data['measures'] else pd.DataFrame()
-    df_risks = pd.DataFrame(dashboard_data['risks']) if dashboard_data['risks'] else pd.DataFrame()
-    df_units = pd.DataFrame(dashboard_data['units']) if dashboard_data['units'] else pd.DataFrame()
-    df_persons = pd.DataFrame(dashboard_data['persons']) if dashboard_data['persons'] else pd.DataFrame()
-    
-    # Ajouter les noms lisibles
-    if not df_events.empty and 'organizational_unit_id' in df_events.columns:
-        df_events['unit_name'] = df_events['organizational_unit_id'].map(
-            lambda x: units_map.get(x, f"Unit {x}") if pd.notna(x) else "Non spécifié"
-        )
-    
-    if not df_measures.empty and 'organizational_unit_id' in df_measures.columns:
-        df_measures['unit_name'] = df_measures['organizational_unit_id'].map(
-            lambda x: units_map.get(x, f"Unit {x}") if pd.notna(x) else "Non spécifié"
-        )
+    # Références vers les DataFrames partagés: ne pas les modifier en place (.copy() d'abord)
+    dashboard_frames = get_data_store().frames()
+    df_events = dashboard_frames['events']
+    df_measures = dashboard_frames['measures']
+    df_risks = dashboard_frames['risks']
+    df_units = dashboard_frames['units']
+    df_persons = dashboard_frames['persons']
 
 # === CONTENU EN FONCTION DE LA PAGE SÉLECTIONNÉE ===
 
@@ -655,13 +686,14 @@ elif page == "📊 Statistiques":
     st.markdown("## 📊 Indicateurs Clés de Performance")
     
     # === KPIs ===
+    kpi_summary = get_kpi_summary()
     kpi_cols = st.columns(3)
 
     with kpi_cols[0]:
         st.markdown(f"""
         <div class="kpi-card animate-fade-in">
             <div class="kpi-label">Total Événements</div>
-            <div class="kpi-value">{len(df_events):,}</div>
+            <div class="kpi-value">{kpi_summary['total_events']:,}</div>
             <div class="kpi-change positive">Tous les événements enregistrés</div>
         </div>
         """, unsafe_allow_html=True)
@@ -670,13 +702,13 @@ elif page == "📊 Statistiques":
         st.markdown(f"""
         <div class="kpi-card animate-fade-in">
             <div class="kpi-label">Mesures Correctives</div>
-            <div class="kpi-value">{len(df_measures):,}</div>
+            <div class="kpi-value">{kpi_summary['total_measures']:,}</div>
             <div class="kpi-change positive">Actions mises en place</div>
         </div>
         """, unsafe_allow_html=True)
 
     with kpi_cols[2]:
-        total_cost = df_measures['cost'].sum() if not df_measures.empty and 'cost' in df_measures.columns else 0
+        total_cost = kpi_summary['total_cost']
         st.markdown(f"""
         <div class="kpi-card animate-fade-in">
             <div class="kpi-label">Coût Total</div>
@@ -692,20 +724,13 @@ elif page == "📊 Statistiques":
     
     with col1:
         st.subheader("Événements par période")
-        if not df_events.empty and 'start_datetime' in df_events.columns:
-            df_temp = df_events.copy()
-            df_temp['start_datetime'] = pd.to_datetime(df_temp['start_datetime'], errors='coerce')
-            df_temp = df_temp[df_temp['start_datetime'].notna()]
-            if len(df_temp) > 0:
-                df_temp['month'] = df_temp['start_datetime'].dt.to_period('M').astype(str)
-                monthly = df_temp.groupby('month').size()
-                st.metric("Moyenne mensuelle", f"{monthly.mean():.0f}", f"Max: {monthly.max()}")
+        if kpi_summary['monthly_max']:
+            st.metric("Moyenne mensuelle", f"{kpi_summary['monthly_average']:.0f}", f"Max: {kpi_summary['monthly_max']}")
     
     with col2:
         st.subheader("Unités concernées")
-        if not df_events.empty and 'unit_name' in df_events.columns:
-            unique_units = df_events['unit_name'].nunique()
-            st.metric("Nombre d'unités", f"{unique_units}", f"Sur {len(df_units)} total")
+        if kpi_summary['total_events'] > 0:
+            st.metric("Nombre d'unités", f"{kpi_summary['units_with_events']}", f"Sur {kpi_summary['total_units']} total")
 
 elif page == "🏠 Vue d'ensemble":
     st.markdown("## Vue d'ensemble des événements")
@@ -715,8 +740,8 @@ elif page == "🏠 Vue d'ensemble":
         
         with col1:
             st.subheader("Distribution par unité")
-            unit_counts = df_events['unit_name'].value_counts().head(10).reset_index()
-            unit_counts.columns = ['Unité', 'Nombre']
+            unit_counts = get_kpi_counts("events/unit?limit=10", lambda: df_events['unit_name'].value_counts(),
+                                         ['Unité', 'Nombre'], limit=10)
             
             fig1 = px.bar(unit_counts, x='Unité', y='Nombre',
                          color='Nombre',
@@ -734,8 +759,8 @@ elif page == "🏠 Vue d'ensemble":
         with col2:
             st.subheader("Types d'événements")
             if 'type' in df_events.columns:
-                type_counts = df_events['type'].value_counts().head(8).reset_index()
-                type_counts.columns = ['Type', 'Nombre']
+                type_counts = get_kpi_counts("events/type?limit=8", lambda: df_events['type'].value_counts(),
+                                             ['Type', 'Nombre'], limit=8)
                 
                 fig2 = px.pie(type_counts, values='Nombre', names='Type',
                              hole=0.4,
@@ -789,8 +814,8 @@ elif page == "🏠 Vue d'ensemble":
                 st.subheader("Distribution des niveaux de gravité")
                 
                 # Compter les occurrences de chaque niveau de gravité
-                gravity_counts = df_risks['gravity'].value_counts().sort_index().reset_index()
-                gravity_counts.columns = ['Niveau de gravité', 'Nombre de risques']
+                gravity_counts = get_kpi_counts("risks/gravity", lambda: df_risks['gravity'].value_counts().sort_index(),
+                                                ['Niveau de gravité', 'Nombre de risques'])
                 
                 # Créer un graphique en barres avec dégradé de couleur
                 fig4 = px.bar(gravity_counts, 
@@ -841,97 +866,58 @@ elif page == "📅 Événements récents":
         if 'event_page' not in st.session_state:
             st.session_state.event_page = 0
     
-    if not df_events.empty and 'start_datetime' in df_events.columns:
-        df_recent = df_events.copy()
-        df_recent['start_datetime'] = pd.to_datetime(df_recent['start_datetime'], errors='coerce')
-        df_recent = df_recent.sort_values('start_datetime', ascending=False)
-        
-        # Filtrer par type si sélectionné
-        if selected_type != 'Tous':
-            df_recent = df_recent[df_recent['type'] == selected_type]
-        
+    # Page demandée à l'API (triée, filtrée, enrichie) au lieu de trier toute la table
+    event_type_param = None if selected_type == 'Tous' else selected_type
+    try:
+        event_page = get_data_store().event_page(st.session_state.event_page, events_per_page, event_type_param)
+    except Exception as e:
+        st.error(f"Impossible de charger les événements: {str(e)}")
+        event_page = {'total': 0, 'page': 0, 'items': pd.DataFrame()}
+    
+    if event_page['total'] > 0:
         # Pagination
-        total_events = len(df_recent)
+        total_events = event_page['total']
         total_pages = (total_events + events_per_page - 1) // events_per_page
         
-        # S'assurer que la page actuelle est valide
-        if st.session_state.event_page >= total_pages:
-            st.session_state.event_page = max(0, total_pages - 1)
+        # Page éventuellement ramenée à la dernière page par l'API
+        st.session_state.event_page = event_page['page']
         
         start_idx = st.session_state.event_page * events_per_page
         end_idx = min(start_idx + events_per_page, total_events)
-        df_page = df_recent.iloc[start_idx:end_idx]
+        event_cards = build_event_cards(event_page['items'])
+        
+        # Précharger la page suivante pendant l'affichage de celle-ci
+        if st.session_state.event_page < total_pages - 1:
+            get_data_store().prefetch_event_page(st.session_state.event_page + 1, events_per_page, event_type_param)
         
         st.markdown(f"<p style='color: #94a3b8; margin-bottom: 1rem;'>Affichage de {start_idx + 1}-{end_idx} sur {total_events} événements</p>", unsafe_allow_html=True)
         
         # Afficher les événements en grille de 3 colonnes
-        for i in range(0, len(df_page), 3):
+        for i in range(0, len(event_cards), 3):
             cols = st.columns(3)
-            for j, (idx, event) in enumerate(df_page.iloc[i:i+3].iterrows()):
+            for j, card in enumerate(event_cards[i:i+3]):
                 with cols[j]:
-                    # Déterminer la classe de card
-                    classification = str(event.get('classification', '')).lower()
-                    if 'danger' in classification or 'critical' in classification or 'grave' in classification:
-                        card_class = 'event-card-danger'
-                        badge_class = 'badge-danger'
-                        badge_text = 'CRITIQUE'
-                        icon = '[!]'
-                    elif 'warn' in classification or 'moyen' in classification:
-                        card_class = 'event-card-warning'
-                        badge_class = 'badge-warning'
-                        badge_text = 'ATTENTION'
-                        icon = '[!]'
-                    else:
-                        card_class = 'event-card-success'
-                        badge_class = 'badge-success'
-                        badge_text = 'NORMAL'
-                        icon = '[✓]'
-                    
-                    event_type = event.get('type', 'N/A')
-                    event_date = event.get('start_datetime')
-                    if pd.notna(event_date):
-                        event_date_parsed = pd.to_datetime(event_date)
-                        event_date = event_date_parsed.strftime('%d/%m/%Y %H:%M')
-                        event_date_short = event_date_parsed.strftime('%d/%m')
-                    else:
-                        event_date = 'N/A'
-                        event_date_short = 'N/A'
-                    event_unit = event.get('unit_name', 'Non spécifié')
-                    event_desc = str(event.get('description', 'Aucune description'))
-                    event_desc_short = event_desc[:80] + '...' if len(event_desc) > 80 else event_desc
-                    
-                    # Preview courte pour la carte
-                    preview_title = f"{icon} {event_type}"
-                    
-                    # Créer une carte cliquable avec un bouton
-                    st.markdown(f"""
-                    <div style='background: rgba(30, 41, 59, 0.6); border-radius: 12px; padding: 1rem; margin-bottom: 0.5rem; border: 1px solid rgba(100, 116, 139, 0.3);'>
-                        <span class='event-badge {badge_class}' style='display: inline-block; margin-bottom: 0.5rem;'>{badge_text}</span>
-                        <h4 style='color: #f1f5f9; margin: 0.5rem 0;'>{preview_title}</h4>
-                        <p style='color: #94a3b8; font-size: 0.9rem; margin: 0.3rem 0;'>{event_date_short}</p>
-                        <p style='color: #94a3b8; font-size: 0.85rem; margin: 0.3rem 0;'>{event_unit[:30]}</p>
-                        <p style='color: #64748b; font-size: 0.85rem; margin-top: 0.5rem;'>{event_desc_short}</p>
-                    </div>
-                    """, unsafe_allow_html=True)
+                    # Carte (HTML préparé en une passe dans build_event_cards)
+                    st.markdown(card['html'], unsafe_allow_html=True)
                     
                     # Bouton pour ouvrir le dialogue
-                    if st.button("Voir les détails", key=f"event_btn_{idx}", use_container_width=True):
+                    if st.button("Voir les détails", key=f"event_btn_{card['event_id']}", use_container_width=True):
                         
-                        @st.dialog(f"{icon} {event_type}", width="large")
+                        @st.dialog(card['title'], width="large")
                         def show_event_details():
-                            st.markdown(f"<span class='event-badge {badge_class}' style='display: inline-block; margin-bottom: 1rem;'>{badge_text}</span>", unsafe_allow_html=True)
+                            st.markdown(f"<span class='event-badge {card['badge_class']}' style='display: inline-block; margin-bottom: 1rem;'>{card['badge_text']}</span>", unsafe_allow_html=True)
                             
                             st.markdown("### Informations générales")
                             col1, col2 = st.columns(2)
                             with col1:
-                                st.markdown(f"**Date:** {event_date}")
-                                st.markdown(f"**Type:** {event_type}")
+                                st.markdown(f"**Date:** {card['date']}")
+                                st.markdown(f"**Type:** {card['type']}")
                             with col2:
-                                st.markdown(f"**Unité:** {event_unit}")
-                                st.markdown(f"**Classification:** {event.get('classification', 'N/A')}")
+                                st.markdown(f"**Unité:** {card['unit']}")
+                                st.markdown(f"**Classification:** {card['classification']}")
                             
                             st.markdown("### Description")
-                            st.markdown(f"<p style='color: #cbd5e1; line-height: 1.6;'>{event_desc}</p>", unsafe_allow_html=True)
+                            st.markdown(f"<p style='color: #cbd5e1; line-height: 1.6;'>{card['description']}</p>", unsafe_allow_html=True)
                         
                         show_event_details()
         
@@ -998,49 +984,63 @@ elif page == "🔍 Analyses détaillées":
         if not df_events.empty and 'start_datetime' in df_events.columns:
             st.markdown("#### Évolution temporelle des événements")
             
-            df_temp = df_events.copy()
-            df_temp['start_datetime'] = pd.to_datetime(df_temp['start_datetime'], errors='coerce')
-            df_temp = df_temp[df_temp['start_datetime'].notna()]
+            # Intervalle et filtres: la série est agrégée par l'API (date_trunc côté PostgreSQL)
+            bucket_labels = {'day': "Jour", 'week': "Semaine", 'month': "Mois", 'quarter': "Trimestre"}
+            col_bucket, col_unit, col_type = st.columns(3)
+            with col_bucket:
+                trend_bucket = st.selectbox("Intervalle", list(bucket_labels.keys()), index=2,
+                                            format_func=lambda b: bucket_labels[b], key="trend_bucket")
+            with col_unit:
+                unit_options = {None: "Toutes"}
+                if not df_units.empty:
+                    unit_options.update(df_units.set_index('unit_id')['name'].sort_values().to_dict())
+                trend_unit = st.selectbox("Unité", list(unit_options.keys()),
+                                          format_func=lambda u: unit_options[u], key="trend_unit")
+            with col_type:
+                trend_type = st.selectbox("Type", ['Tous'] + sorted(df_events['type'].dropna().unique().tolist()),
+                                          key="trend_type")
+            trend_filters = {'unit_id': trend_unit, 'type': None if trend_type == 'Tous' else trend_type}
             
-            if len(df_temp) > 0:
-                # Grouper par mois
-                df_temp['month'] = df_temp['start_datetime'].dt.to_period('M').astype(str)
-                monthly_counts = df_temp.groupby('month').size().reset_index(name='Nombre')
-                
-                fig = px.line(monthly_counts, x='month', y='Nombre',
+            trend_counts = get_data_store().event_series(trend_bucket, **trend_filters)
+            weekday_counts = get_data_store().event_series('weekday', **trend_filters)
+            
+            if trend_counts is None or weekday_counts is None:
+                # API indisponible: calcul local sur les événements chargés
+                df_temp = df_events[df_events['start_datetime'].notna()]
+                if trend_filters['unit_id'] is not None:
+                    df_temp = df_temp[df_temp['organizational_unit_id'] == trend_filters['unit_id']]
+                if trend_filters['type'] is not None:
+                    df_temp = df_temp[df_temp['type'] == trend_filters['type']]
+                period_codes = {'day': 'D', 'week': 'W', 'month': 'M', 'quarter': 'Q'}
+                trend_counts = (df_temp['start_datetime'].dt.to_period(period_codes[trend_bucket])
+                                .dt.start_time.dt.date.astype(str).value_counts().sort_index()
+                                .rename_axis('period').reset_index(name='count'))
+                weekday_counts = (df_temp['start_datetime'].dt.dayofweek.add(1).value_counts().sort_index()
+                                  .rename_axis('period').reset_index(name='count'))
+            
+            if len(trend_counts) > 0:
+                fig = px.line(trend_counts, x='period', y='count',
                              markers=True,
                              line_shape='spline')
                 fig.update_traces(line=dict(color='#8b5cf6', width=3),
                                 marker=dict(size=10, color='#6366f1'))
                 fig.update_layout(
-                    title="Évolution mensuelle des événements",
+                    title=f"Évolution des événements par {bucket_labels[trend_bucket].lower()}",
                     plot_bgcolor='rgba(0,0,0,0)',
                     paper_bgcolor='rgba(0,0,0,0)',
                     font=dict(color='white'),
-                    xaxis_title="Mois",
+                    xaxis_title=bucket_labels[trend_bucket],
                     yaxis_title="Nombre d'événements",
                     hovermode='x unified'
                 )
                 st.plotly_chart(fig, use_container_width=True)
                 
-                # Heatmap par jour de la semaine et semaine
-                df_temp['day_of_week'] = df_temp['start_datetime'].dt.day_name()
-                df_temp['week'] = df_temp['start_datetime'].dt.isocalendar().week
-                
                 st.markdown("**Répartition par jour de la semaine**")
                 
-                # Définir l'ordre des jours de la semaine
-                day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+                # Jours ISO (1 = lundi) → noms en français, dans l'ordre de la semaine
                 day_names_fr = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
-                
-                # Créer un mapping pour les noms en français
-                day_mapping = dict(zip(day_order, day_names_fr))
-                
-                # Compter et ordonner
-                day_counts = df_temp['day_of_week'].value_counts()
-                ordered_days = [day for day in day_order if day in day_counts.index]
-                ordered_counts = [day_counts[day] for day in ordered_days]
-                ordered_labels = [day_mapping[day] for day in ordered_days]
+                ordered_labels = [day_names_fr[int(day) - 1] for day in weekday_counts['period']]
+                ordered_counts = weekday_counts['count'].tolist()
                 
                 fig2 = px.bar(x=ordered_labels, y=ordered_counts,
                              color=ordered_counts,
@@ -1054,6 +1054,8 @@ elif page == "🔍 Analyses détaillées":
                     showlegend=False
                 )
                 st.plotly_chart(fig2, use_container_width=True)
+            else:
+                st.info("Aucun événement pour ces filtres")
     
     with analysis_tab3:
         if not df_events.empty:
@@ -1114,57 +1116,24 @@ elif page == "🎨 Créateur de graphiques":
         help="Choisissez la table dont vous souhaitez utiliser les données"
     )
     
-    # Charger les données de la table sélectionnée
-    source_url = f"{BASE_URL}{ENDPOINTS[source_endpoint]}"
-    source_data = get_all_data(source_url)
+    # Métadonnées des colonnes (nature, valeurs distinctes) calculées et mises en cache par l'API
+    column_meta = get_data_store().chart_columns(source_endpoint)
+    if not column_meta or column_meta['row_count'] == 0:
+        st.warning(f"Aucune donnée disponible pour la table '{source_endpoint}'")
+        st.stop()
     
-    if source_data:
-        df_custom = pd.DataFrame(source_data)
-        
-        # Ajouter les noms lisibles pour les IDs dans df_custom
-        if 'organizational_unit_id' in df_custom.columns:
-            df_custom['unit_name'] = df_custom['organizational_unit_id'].map(
-                lambda x: units_map.get(x, f"Unit {x}") if pd.notna(x) else None
-            )
-        
-        if 'declared_by_id' in df_custom.columns:
-            df_custom['declared_by_name'] = df_custom['declared_by_id'].map(
-                lambda x: persons_map.get(x, f"Person {x}") if pd.notna(x) else None
-            )
-        
-        if 'owner_id' in df_custom.columns:
-            df_custom['owner_name'] = df_custom['owner_id'].map(
-                lambda x: persons_map.get(x, f"Person {x}") if pd.notna(x) else None
-            )
-        
-        # Identifier et convertir les colonnes de dates
-        date_columns = []
-        for col in df_custom.columns:
-            if col in ['start_datetime', 'end_datetime', 'creation_date', 'update_date', 'date', 'datetime', 'implementation_date']:
-                # Convertir en datetime et garder le type datetime
-                df_custom[col] = pd.to_datetime(df_custom[col], errors='coerce')
-                date_columns.append(col)
-        
-        # Extraire le jour de la semaine depuis start_datetime et end_datetime
-        if 'start_datetime' in df_custom.columns:
-            df_custom['start_weekday'] = df_custom['start_datetime'].dt.day_name()
-        
-        if 'end_datetime' in df_custom.columns:
-            df_custom['end_weekday'] = df_custom['end_datetime'].dt.day_name()
-        
-        st.info(f"Utilisation de {len(df_custom):,} éléments de la table '{source_endpoint}'")
+    distinct_counts = {c['name']: c['distinct'] for c in column_meta['columns']}
+    st.info(f"Utilisation de {column_meta['row_count']:,} éléments de la table '{source_endpoint}'")
     
     # Obtenir les colonnes disponibles
-    available_columns = list(df_custom.columns)
-    numeric_columns = list(df_custom.select_dtypes(include=[np.number]).columns)
-    categorical_columns = list(df_custom.select_dtypes(include=['object', 'category', 'bool']).columns)
+    available_columns = [c['name'] for c in column_meta['columns']]
+    numeric_columns = [c['name'] for c in column_meta['columns'] if c['kind'] == 'numeric']
+    categorical_columns = [c['name'] for c in column_meta['columns'] if c['kind'] in ['category', 'text']]
+    date_columns = [c['name'] for c in column_meta['columns'] if c['kind'] == 'date']
     
     # Filtrer les colonnes avec trop de valeurs uniques (probablement des IDs)
-    good_categorical_columns = []
-    for col in categorical_columns:
-        unique_count = df_custom[col].nunique()
-        if unique_count <= 50:  # Limite raisonnable pour des catégories
-            good_categorical_columns.append(col)
+    good_categorical_columns = [col for col in categorical_columns
+                                if distinct_counts[col] is not None and distinct_counts[col] <= 50]
     
     col_config1, col_config2 = st.columns(2)
     
@@ -1290,7 +1259,7 @@ elif page == "🎨 Créateur de graphiques":
                 
                 # Vérifier le nombre de catégories
                 if names_column:
-                    n_categories = df_custom[names_column].nunique()
+                    n_categories = distinct_counts[names_column]
                     if n_categories > 15:
                         st.warning(f"⚠️ {n_categories} catégories détectées. Plus de 15 catégories rendent le graphique difficile à lire.")
                     elif n_categories < 2:
@@ -1347,9 +1316,9 @@ elif page == "🎨 Créateur de graphiques":
         if not names_column:
             can_generate = False
             validation_message = "⚠️ Veuillez sélectionner une colonne de catégories"
-        elif names_column and df_custom[names_column].nunique() > 30:
+        elif names_column and distinct_counts[names_column] > 30:
             can_generate = False
-            validation_message = f"❌ Trop de catégories ({df_custom[names_column].nunique()}). Maximum recommandé: 30"
+            validation_message = f"❌ Trop de catégories ({distinct_counts[names_column]}). Maximum recommandé: 30"
     
     elif chart_type == "Histogram":
         if not y_axis or y_axis not in numeric_columns:
@@ -1368,107 +1337,73 @@ elif page == "🎨 Créateur de graphiques":
     button_disabled = not can_generate
     if st.button("Générer le graphique", type="primary", use_container_width=True, disabled=button_disabled):
         try:
-            df_plot = df_custom.copy()
-            
             # Validation supplémentaire: vérifier les données
-            if len(df_plot) < 2:
+            if column_meta['row_count'] < 2:
                 st.error("❌ Pas assez de données (minimum 2 lignes)")
                 st.stop()
             
-            # Détecter si x_axis est une colonne de date et la trier
+            # L'agrégation est faite par l'API (SQL paramétré): on n'envoie qu'une spécification
+            sql_aggregations = {"Somme": "sum", "Moyenne": "avg", "Nombre de": "count", "Min": "min", "Max": "max"}
+            
+            def chart_spec(dimensions, measure=None, **options):
+                """Spécification de requête: dimensions (+ mesure (colonne, agrégation SQL, alias))."""
+                spec = {'source': source_endpoint, 'dimensions': list(dict.fromkeys(d for d in dimensions if d))}
+                if measure:
+                    column, sql_aggregation, alias = measure
+                    spec['measures'] = [{'column': None if sql_aggregation == 'count' else column,
+                                         'aggregation': sql_aggregation, 'alias': alias}]
+                spec.update(options)
+                return spec
+            
+            def selected_measure(column):
+                """Mesure correspondant à l'agrégation choisie dans l'interface."""
+                return (column, sql_aggregations[aggregation], column)
+            
+            def fetch_chart_data(spec):
+                df_result, truncated = get_data_store().chart_query(spec, dates=date_columns)
+                if truncated:
+                    st.info(f"ℹ️ Résultat limité à {len(df_result):,} lignes")
+                return df_result
+            
+            # Détecter si x_axis est une colonne de date (tri chronologique côté base)
             is_x_date = False
             if x_axis and x_axis in date_columns:
                 is_x_date = True
-                df_plot = df_plot.sort_values(by=x_axis)
                 st.info(f"📅 Colonne de date détectée: tri chronologique appliqué sur {x_axis}")
             
             # Créer le graphique selon le type
-            if chart_type == "Bar Chart":
-                # Nettoyer les données
-                df_plot = df_plot.dropna(subset=[x_axis, y_axis])
-                
-                if len(df_plot) == 0:
-                    st.error("❌ Aucune donnée valide après nettoyage")
-                    st.stop()
+            if chart_type in ["Bar Chart", "Line Chart"]:
+                aggregated = aggregation != "Aucune" and x_axis and y_axis
+                filters = []
                 
                 # Limiter le nombre de catégories pour éviter les graphiques surchargés
                 # Mais seulement si ce n'est pas une date
-                if not is_x_date and df_plot[x_axis].nunique() > 50:
-                    st.warning(f"⚠️ Trop de catégories ({df_plot[x_axis].nunique()}). Affichage des 30 premières.")
-                    top_categories = df_plot[x_axis].value_counts().head(30).index
-                    df_plot = df_plot[df_plot[x_axis].isin(top_categories)]
+                if chart_type == "Bar Chart" and not is_x_date and (distinct_counts.get(x_axis) or 0) > 50:
+                    st.warning(f"⚠️ Trop de catégories ({distinct_counts[x_axis]}). Affichage des 30 premières.")
+                    top_categories = fetch_chart_data(chart_spec(
+                        [x_axis], (None, 'count', 'count'), not_null=[x_axis, y_axis],
+                        order_by='count', descending=True, limit=30
+                    ))
+                    filters.append({'column': x_axis, 'op': 'in', 'value': top_categories[x_axis].tolist()})
                 
-                if aggregation != "Aucune" and x_axis and y_axis:
-                    # Déterminer les colonnes pour le groupby
-                    group_cols = [x_axis]
-                    if color_column:
-                        group_cols.append(color_column)
-                    
-                    if aggregation == "Somme":
-                        df_plot = df_plot.groupby(group_cols)[y_axis].sum().reset_index()
-                    elif aggregation == "Moyenne":
-                        df_plot = df_plot.groupby(group_cols)[y_axis].mean().reset_index()
-                    elif aggregation == "Nombre de":
-                        df_plot = df_plot.groupby(group_cols).size().reset_index(name=y_axis)
-                    elif aggregation == "Min":
-                        df_plot = df_plot.groupby(group_cols)[y_axis].min().reset_index()
-                    elif aggregation == "Max":
-                        df_plot = df_plot.groupby(group_cols)[y_axis].max().reset_index()
-                    
-                    # Re-trier par date après l'agrégation si nécessaire
-                    if is_x_date:
-                        df_plot = df_plot.sort_values(by=x_axis)
-                
-                # Déterminer le label de l'axe Y
-                y_label = f"{aggregation} {y_axis}" if aggregation != "Aucune" else y_axis
-                
-                fig = px.bar(df_plot, x=x_axis, y=y_axis, color=color_column, 
-                            title=chart_title, height=chart_height,
-                            labels={y_axis: y_label})
-                
-                # Si c'est une date, formater l'axe X
-                if is_x_date:
-                    fig.update_xaxes(tickformat="%Y-%m-%d", tickangle=-45)
-                
-                # Personnaliser le hover template
-                if aggregation != "Aucune":
-                    hover_template = f'<b>{x_axis}</b>: %{{x}}<br>{y_label}: %{{y}}'
-                    if color_column:
-                        hover_template += f'<br><b>{color_column}</b>: %{{fullData.name}}'
-                    hover_template += '<extra></extra>'
-                    fig.update_traces(hovertemplate=hover_template)
-                st.plotly_chart(fig, use_container_width=True)
-            
-            elif chart_type == "Line Chart":
-                df_plot = df_plot.dropna(subset=[x_axis, y_axis])
+                df_plot = fetch_chart_data(chart_spec(
+                    [x_axis, color_column] if aggregated else [x_axis, y_axis, color_column],
+                    selected_measure(y_axis) if aggregated else None,
+                    filters=filters, not_null=[x_axis, y_axis],
+                    order_by=x_axis if (aggregated or is_x_date) else None
+                ))
                 
                 if len(df_plot) == 0:
                     st.error("❌ Aucune donnée valide après nettoyage")
                     st.stop()
                 
-                if aggregation != "Aucune" and x_axis and y_axis:
-                    # Déterminer les colonnes pour le groupby
-                    group_cols = [x_axis]
-                    if color_column:
-                        group_cols.append(color_column)
-                    
-                    if aggregation == "Somme":
-                        df_plot = df_plot.groupby(group_cols)[y_axis].sum().reset_index()
-                    elif aggregation == "Moyenne":
-                        df_plot = df_plot.groupby(group_cols)[y_axis].mean().reset_index()
-                    elif aggregation == "Nombre de":
-                        df_plot = df_plot.groupby(group_cols).size().reset_index(name=y_axis)
-                    
-                    # Re-trier par date après l'agrégation si nécessaire
-                    if is_x_date:
-                        df_plot = df_plot.sort_values(by=x_axis)
-                
                 # Déterminer le label de l'axe Y
                 y_label = f"{aggregation} {y_axis}" if aggregation != "Aucune" else y_axis
                 
-                fig = px.line(df_plot, x=x_axis, y=y_axis, color=color_column,
-                                title=chart_title, height=chart_height,
-                                labels={y_axis: y_label})
+                plot_function = px.bar if chart_type == "Bar Chart" else px.line
+                fig = plot_function(df_plot, x=x_axis, y=y_axis, color=color_column,
+                                    title=chart_title, height=chart_height,
+                                    labels={y_axis: y_label})
                 
                 # Si c'est une date, formater l'axe X
                 if is_x_date:
@@ -1484,113 +1419,66 @@ elif page == "🎨 Créateur de graphiques":
                 st.plotly_chart(fig, use_container_width=True)
             
             elif chart_type == "Scatter Plot":
-                df_plot = df_plot.dropna(subset=[x_axis, y_axis])
+                # Limiter le nombre de points pour les performances (tirage aléatoire côté base)
+                df_plot, truncated = get_data_store().chart_query(chart_spec(
+                    [x_axis, y_axis, color_column, size_column],
+                    not_null=[x_axis, y_axis], sample=True, limit=5000
+                ), dates=date_columns)
+                if truncated:
+                    st.info(f"ℹ️ Échantillonnage de 5000 points sur {column_meta['row_count']} pour les performances")
                 
                 if len(df_plot) < 2:
                     st.error("❌ Au moins 2 points sont nécessaires pour un scatter plot")
                     st.stop()
                 
-                # Limiter le nombre de points pour les performances
-                if len(df_plot) > 5000:
-                    st.info(f"ℹ️ Échantillonnage de 5000 points sur {len(df_plot)} pour les performances")
-                    df_plot = df_plot.sample(n=5000, random_state=42)
-                
                 fig = px.scatter(df_plot, x=x_axis, y=y_axis, color=color_column,
                                 size=size_column, title=chart_title, height=chart_height)
                 st.plotly_chart(fig, use_container_width=True)
             
             elif chart_type == "Pie Chart":
-                # Appliquer l'agrégation si nécessaire
-                if aggregation != "Aucune" and names_column:
-                    if values_column:
-                        # Si une colonne de valeurs est spécifiée
-                        df_plot = df_plot.dropna(subset=[names_column, values_column])
-                        
-                        if aggregation == "Somme":
-                            df_plot = df_plot.groupby(names_column)[values_column].sum().reset_index()
-                        elif aggregation == "Moyenne":
-                            df_plot = df_plot.groupby(names_column)[values_column].mean().reset_index()
-                        elif aggregation == "Nombre de":
-                            df_plot = df_plot.groupby(names_column).size().reset_index(name=values_column)
-                        elif aggregation == "Min":
-                            df_plot = df_plot.groupby(names_column)[values_column].min().reset_index()
-                        elif aggregation == "Max":
-                            df_plot = df_plot.groupby(names_column)[values_column].max().reset_index()
-                        
-                        # Limiter à 15 catégories max
-                        if len(df_plot) > 15:
-                            st.info("ℹ️ Affichage des 15 catégories principales")
-                            df_plot = df_plot.nlargest(15, values_column)
-                        
-                        fig = px.pie(df_plot, names=names_column, values=values_column,
-                                    title=chart_title, height=chart_height)
-                    else:
-                        # Sans colonne de valeurs, toujours compter
-                        df_counts = df_plot[names_column].value_counts().reset_index()
-                        df_counts.columns = [names_column, 'count']
-                        if len(df_counts) > 15:
-                            st.info("ℹ️ Affichage des 15 catégories principales")
-                            df_counts = df_counts.head(15)
-                        fig = px.pie(df_counts, names=names_column, values='count',
-                                    title=chart_title, height=chart_height)
+                # Sans agrégation, les valeurs sont additionnées par catégorie (comme le fait px.pie)
+                if values_column:
+                    measure = ((values_column, 'sum', values_column) if aggregation == "Aucune"
+                               else selected_measure(values_column))
+                    spec = chart_spec([names_column], measure, not_null=[names_column, values_column],
+                                      order_by=values_column, descending=True, limit=15)
+                    pie_values = values_column
                 else:
-                    # Logique originale sans agrégation
-                    if values_column:
-                        df_plot = df_plot.dropna(subset=[names_column, values_column])
-                        # Limiter à 15 catégories max
-                        if df_plot[names_column].nunique() > 15:
-                            st.info("ℹ️ Affichage des 15 catégories principales")
-                            top_cats = df_plot.groupby(names_column)[values_column].sum().nlargest(15).index
-                            df_plot = df_plot[df_plot[names_column].isin(top_cats)]
-                        fig = px.pie(df_plot, names=names_column, values=values_column,
-                                    title=chart_title, height=chart_height)
-                    else:
-                        # Compter les occurrences
-                        df_counts = df_plot[names_column].value_counts().reset_index()
-                        df_counts.columns = [names_column, 'count']
-                        # Limiter à 15 catégories
-                        if len(df_counts) > 15:
-                            st.info("ℹ️ Affichage des 15 catégories principales")
-                            df_counts = df_counts.head(15)
-                        fig = px.pie(df_counts, names=names_column, values='count',
-                                    title=chart_title, height=chart_height)
+                    # Sans colonne de valeurs, toujours compter
+                    spec = chart_spec([names_column], (None, 'count', 'count'), not_null=[names_column],
+                                      order_by='count', descending=True, limit=15)
+                    pie_values = 'count'
+                
+                df_plot, truncated = get_data_store().chart_query(spec)
+                # Limiter à 15 catégories max
+                if truncated:
+                    st.info("ℹ️ Affichage des 15 catégories principales")
+                fig = px.pie(df_plot, names=names_column, values=pie_values,
+                            title=chart_title, height=chart_height)
                 st.plotly_chart(fig, use_container_width=True)
             
             elif chart_type == "Histogram":
-                df_plot = df_plot.dropna(subset=[y_axis])
-                
-                if len(df_plot) == 0:
-                    st.error("❌ Aucune donnée valide après nettoyage")
-                    st.stop()
-                
                 # Si agrégation et couleur sont spécifiées
                 if aggregation != "Aucune" and color_column:
-                    group_cols = [color_column]
-                    
-                    if aggregation == "Somme":
-                        df_agg = df_plot.groupby(group_cols)[y_axis].sum().reset_index()
-                    elif aggregation == "Moyenne":
-                        df_agg = df_plot.groupby(group_cols)[y_axis].mean().reset_index()
-                    elif aggregation == "Nombre de":
-                        df_agg = df_plot.groupby(group_cols).size().reset_index(name=y_axis)
-                    elif aggregation == "Min":
-                        df_agg = df_plot.groupby(group_cols)[y_axis].min().reset_index()
-                    elif aggregation == "Max":
-                        df_agg = df_plot.groupby(group_cols)[y_axis].max().reset_index()
-                    else:
-                        df_agg = df_plot
+                    df_plot = fetch_chart_data(chart_spec([color_column], selected_measure(y_axis),
+                                                          not_null=[y_axis], order_by=color_column))
                     
                     # Créer un bar chart au lieu d'un histogramme pour les données agrégées
                     y_label = f"{aggregation} {y_axis}"
-                    fig = px.bar(df_agg, x=color_column, y=y_axis, color=color_column,
+                    fig = px.bar(df_plot, x=color_column, y=y_axis, color=color_column,
                                 title=chart_title, height=chart_height,
                                 labels={y_axis: y_label})
                     st.info("ℹ️ Avec agrégation, affichage d'un graphique à barres plutôt qu'un histogramme")
                 else:
                     # Histogramme normal sans agrégation
+                    df_plot = fetch_chart_data(chart_spec([y_axis, color_column], not_null=[y_axis]))
                     fig = px.histogram(df_plot, x=y_axis, color=color_column,
                                         title=chart_title, height=chart_height, nbins=30)
                 
+                if len(df_plot) == 0:
+                    st.error("❌ Aucune donnée valide après nettoyage")
+                    st.stop()
+                
                 st.plotly_chart(fig, use_container_width=True)
             
             # Afficher des statistiques sur le graphique généré
@@ -1610,8 +1498,6 @@ elif page == "🎨 Créateur de graphiques":
             # Afficher plus de détails en mode debug
             with st.expander("Détails de l'erreur (debug)"):
                 st.code(str(e))
-    else:
-        st.warning(f"Aucune donnée disponible pour la table '{source_endpoint}'")
     
     st.markdown("<br><br>", unsafe_allow_html=True)
 
@@ -1688,7 +1574,7 @@ elif page == "✏️ Gestion des données":
     
     try:
         with st.spinner("🔍 Détection des champs..."):
-            response = requests.get(f"{BASE_URL}/{selected_table}/", params={"limit": 1}, timeout=5)
+            response = requests.get(f"{BASE_URL}/{selected_table}/", params={"limit": 1}, headers=api_headers(), timeout=5)
             if response.status_code == 200:
                 records = response.json()
                 if records and len(records) > 0:
@@ -1724,37 +1610,13 @@ elif page == "✏️ Gestion des données":
     if action_type == "DELETE":
         st.markdown(f"### 🗑️ Supprimer un enregistrement de {table_options[selected_table]}")
         
-        # Récupérer tous les enregistrements
         try:
-            response = requests.get(f"{BASE_URL}/{selected_table}/", params={"limit": 1000}, timeout=5)
-            if response.status_code == 200:
-                records = response.json()
-                if records:
-                    # Créer un mapping ID -> description lisible
-                    record_options = {}
-                    for record in records:
-                        record_id = record[id_field]
-                        # Créer une description selon la table
-                        if selected_table == "events":
-                            desc = f"#{record_id} - {record.get('type', 'N/A')} ({record.get('classification', 'N/A')})"
-                        elif selected_table == "persons":
-                            desc = f"#{record_id} - {record.get('name', '')} {record.get('family_name', '')}"
-                        elif selected_table == "units":
-                            desc = f"#{record_id} - {record.get('name', 'N/A')}"
-                        elif selected_table == "measures":
-                            desc = f"#{record_id} - {record.get('name', 'N/A')}"
-                        elif selected_table == "risks":
-                            desc = f"#{record_id} - {record.get('name', 'N/A')}"
-                        record_options[record_id] = desc
-                    
-                    selected_id = st.selectbox(
-                        "Sélectionnez l'enregistrement à supprimer",
-                        list(record_options.keys()),
-                        format_func=lambda x: record_options[x]
-                    )
-                    
+            # Recherche côté API: seuls les résultats et l'enregistrement choisi sont chargés
+            selected_id = lookup_selectbox("Sélectionnez l'enregistrement à supprimer", selected_table, key="delete_record")
+            if selected_id is not None:
+                selected_record = fetch_record(selected_table, selected_id)
+                if selected_record:
                     # Afficher les détails de l'enregistrement
-                    selected_record = next(r for r in records if r[id_field] == selected_id)
                     with st.expander("📋 Détails de l'enregistrement"):
                         st.json(selected_record)
                     
@@ -1762,12 +1624,13 @@ elif page == "✏️ Gestion des données":
                     
                     if st.button("🗑️ Confirmer la suppression", type="primary", use_container_width=True):
                         try:
-                            delete_response = requests.delete(f"{BASE_URL}/{selected_table}/{selected_id}", timeout=5)
+                            delete_response = requests.delete(f"{BASE_URL}/{selected_table}/{selected_id}", headers=api_headers(), timeout=5)
                             if delete_response.status_code in [200, 204]:
                                 st.success(f"✅ Enregistrement #{selected_id} supprimé avec succès !")
                                 st.balloons()
                                 # Invalider le cache
                                 st.cache_data.clear()
+                                get_data_store().invalidate(delete_response.headers.get("X-Write-LSN"))
                                 st.rerun()
                             else:
                                 st.error(f"❌ Erreur lors de la suppression: HTTP {delete_response.status_code}")
@@ -1776,9 +1639,7 @@ elif page == "✏️ Gestion des données":
                         except Exception as e:
                             st.error(f"❌ Erreur: {str(e)}")
                 else:
-                    st.info("Aucun enregistrement trouvé dans cette table")
-            else:
-                st.error(f"❌ Erreur lors de la récupération des données: {response.status_code}")
+                    st.error(f"❌ Enregistrement #{selected_id} introuvable")
         except Exception as e:
             st.error(f"❌ Erreur: {str(e)}")
     
@@ -1786,57 +1647,18 @@ elif page == "✏️ Gestion des données":
     elif action_type == "UPDATE":
         st.markdown(f"### ✏️ Modifier un enregistrement de {table_options[selected_table]}")
         
-        # Charger les options pour les sélecteurs
-        @st.cache_data(ttl=60)
-        def get_selector_options(table_name):
-            """Récupère les données d'une table pour les sélecteurs"""
-            try:
-                resp = requests.get(f"{BASE_URL}/{table_name}/", params={"limit": 1000}, timeout=5)
-                if resp.status_code == 200:
-                    return resp.json()
-            except:
-                pass
-            return []
-        
-        # Récupérer tous les enregistrements
         try:
-            response = requests.get(f"{BASE_URL}/{selected_table}/", params={"limit": 1000}, timeout=5)
-            if response.status_code == 200:
-                records = response.json()
-                if records:
-                    # Créer un mapping ID -> description lisible
-                    record_options = {}
-                    for record in records:
-                        record_id = record[id_field]
-                        if selected_table == "events":
-                            desc = f"#{record_id} - {record.get('type', 'N/A')}"
-                        elif selected_table == "persons":
-                            desc = f"#{record_id} - {record.get('name', '')} {record.get('family_name', '')}"
-                        elif selected_table == "units":
-                            desc = f"#{record_id} - {record.get('name', 'N/A')}"
-                        elif selected_table == "measures":
-                            desc = f"#{record_id} - {record.get('name', 'N/A')}"
-                        elif selected_table == "risks":
-                            desc = f"#{record_id} - {record.get('name', 'N/A')}"
-                        record_options[record_id] = desc
-                    
-                    selected_id = st.selectbox(
-                        "Sélectionnez l'enregistrement à modifier",
-                        list(record_options.keys()),
-                        format_func=lambda x: record_options[x]
-                    )
-                    
-                    # Récupérer l'enregistrement complet
-                    selected_record = next(r for r in records if r[id_field] == selected_id)
-                    
-                    # Charger les catégories existantes pour type et classification
+            # Recherche côté API: seuls les résultats et l'enregistrement choisi sont chargés
+            selected_id = lookup_selectbox("Sélectionnez l'enregistrement à modifier", selected_table, key="update_record")
+            if selected_id is not None:
+                selected_record = fetch_record(selected_table, selected_id)
+                if selected_record:
+                    # Catégories existantes pour type et classification (SELECT DISTINCT côté API)
                     event_types = []
                     event_classifications = []
                     if selected_table == "events":
-                        all_events = get_selector_options("events")
-                        if all_events:
-                            event_types = sorted(list(set([e.get('type') for e in all_events if e.get('type')])))
-                            event_classifications = sorted(list(set([e.get('classification') for e in all_events if e.get('classification')])))
+                        event_types = get_data_store().lookup_values("events", "type")
+                        event_classifications = get_data_store().lookup_values("events", "classification")
                     
                     st.markdown("#### Modifier les champs")
                     
@@ -1853,54 +1675,25 @@ elif page == "✏️ Gestion des données":
                         # Sélecteurs pour les clés étrangères (*_id)
                         if field_info["type"] == "number" and field_name.endswith('_id'):
                             # Déterminer la table liée
-                            if 'unit' in field_name:
-                                ref_table = "units"
-                                ref_id = "unit_id"
-                                ref_label = lambda x: f"#{x['unit_id']} - {x.get('name', 'N/A')}"
-                            elif 'person' in field_name or 'owner' in field_name or 'declared_by' in field_name:
-                                ref_table = "persons"
-                                ref_id = "person_id"
-                                ref_label = lambda x: f"#{x['person_id']} - {x.get('name', '')} {x.get('family_name', '')}".strip()
-                            elif 'risk' in field_name:
-                                ref_table = "risks"
-                                ref_id = "risk_id"
-                                ref_label = lambda x: f"#{x['risk_id']} - {x.get('name', 'N/A')}"
-                            else:
-                                # Fallback: input numérique normal
-                                form_data[field_name] = st.number_input(
-                                    field_info["label"],
-                                    value=int(current_value) if current_value is not None else 0,
-                                    min_value=0,
-                                    step=1,
-                                    key=f"update_{field_name}"
-                                )
-                                continue
+                            ref_table = foreign_key_table(field_name)
+                            selected_id_val = None
+                            if ref_table:
+                                # Recherche + valeur actuelle toujours proposée
+                                selected_id_val = lookup_selectbox(field_info["label"], ref_table,
+                                                                   key=f"update_{field_name}", current_id=current_value)
+                                if selected_id_val is None:
+                                    st.warning(f"⚠️ Aucune donnée disponible pour {ref_table}")
                             
-                            # Charger les options
-                            options = get_selector_options(ref_table)
-                            if options:
-                                options_dict = {opt[ref_id]: ref_label(opt) for opt in options}
-                                # Trouver l'index de la valeur actuelle
-                                current_index = 0
-                                if current_value and current_value in options_dict:
-                                    current_index = list(options_dict.keys()).index(current_value)
-                                
-                                selected_id_val = st.selectbox(
-                                    field_info["label"],
-                                    list(options_dict.keys()),
-                                    format_func=lambda x: options_dict[x],
-                                    index=current_index,
-                                    key=f"update_{field_name}"
-                                )
+                            if selected_id_val is not None:
                                 form_data[field_name] = selected_id_val
                             else:
-                                st.warning(f"⚠️ Aucune donnée disponible pour {ref_table}")
+                                # Fallback: input numérique normal
                                 form_data[field_name] = st.number_input(
                                     field_info["label"],
                                     value=int(current_value) if current_value is not None else 0,
                                     min_value=0,
                                     step=1,
-                                    key=f"update_{field_name}"
+                                    key=f"update_{field_name}_number"
                                 )
                         
                         # Sélecteurs pour type et classification dans events
@@ -2048,21 +1841,21 @@ elif page == "✏️ Gestion des données":
                                 update_response = requests.put(
                                     f"{BASE_URL}/{selected_table}/{selected_id}",
                                     json=form_data,
+                                    headers=api_headers(),
                                     timeout=5
                                 )
                                 if update_response.status_code == 200:
                                     st.success(f"✅ Enregistrement #{selected_id} modifié avec succès !")
                                     st.balloons()
                                     st.cache_data.clear()
+                                    get_data_store().invalidate(update_response.headers.get("X-Write-LSN"))
                                     st.rerun()
                                 else:
                                     st.error(f"❌ Erreur: {update_response.status_code} - {update_response.text}")
                             except Exception as e:
                                 st.error(f"❌ Erreur: {str(e)}")
                 else:
-                    st.info("Aucun enregistrement trouvé dans cette table")
-            else:
-                st.error(f"❌ Erreur lors de la récupération des données: {response.status_code}")
+                    st.error(f"❌ Enregistrement #{selected_id} introuvable")
         except Exception as e:
             st.error(f"❌ Erreur: {str(e)}")
     
@@ -2070,26 +1863,12 @@ elif page == "✏️ Gestion des données":
     elif action_type == "CREATE":
         st.markdown(f"### ➕ Créer un nouvel enregistrement dans {table_options[selected_table]}")
         
-        # Charger les options pour les sélecteurs
-        @st.cache_data(ttl=60)
-        def get_selector_options(table_name):
-            """Récupère les données d'une table pour les sélecteurs"""
-            try:
-                resp = requests.get(f"{BASE_URL}/{table_name}/", params={"limit": 1000}, timeout=5)
-                if resp.status_code == 200:
-                    return resp.json()
-            except:
-                pass
-            return []
-        
-        # Charger les catégories existantes pour type et classification
+        # Catégories existantes pour type et classification (SELECT DISTINCT côté API)
         event_types = []
         event_classifications = []
         if selected_table == "events":
-            all_events = get_selector_options("events")
-            if all_events:
-                event_types = sorted(list(set([e.get('type') for e in all_events if e.get('type')])))
-                event_classifications = sorted(list(set([e.get('classification') for e in all_events if e.get('classification')])))
+            event_types = get_data_store().lookup_values("events", "type")
+            event_classifications = get_data_store().lookup_values("events", "classification")
         
         form_data = {}
         
@@ -2100,48 +1879,27 @@ elif page == "✏️ Gestion des données":
             # Sélecteurs pour les clés étrangères (*_id)
             if field_info["type"] == "number" and field_name.endswith('_id'):
                 # Déterminer la table liée
-                if 'unit' in field_name:
-                    ref_table = "units"
-                    ref_id = "unit_id"
-                    ref_label = lambda x: f"#{x['unit_id']} - {x.get('name', 'N/A')}"
-                elif 'person' in field_name or 'owner' in field_name or 'declared_by' in field_name:
-                    ref_table = "persons"
-                    ref_id = "person_id"
-                    ref_label = lambda x: f"#{x['person_id']} - {x.get('name', '')} {x.get('family_name', '')}".strip()
-                elif 'risk' in field_name:
-                    ref_table = "risks"
-                    ref_id = "risk_id"
-                    ref_label = lambda x: f"#{x['risk_id']} - {x.get('name', 'N/A')}"
-                else:
-                    # Fallback: input numérique normal
-                    form_data[field_name] = st.number_input(
+                ref_table = foreign_key_table(field_name)
+                selected_id = None
+                if ref_table:
+                    selected_id = lookup_selectbox(
                         f"{field_info['label']}" + (" *" if field_info.get("required") else ""),
-                        value=0,
-                        min_value=0,
-                        step=1,
+                        ref_table,
                         key=f"create_{field_name}"
                     )
-                    continue
+                    if selected_id is None:
+                        st.warning(f"⚠️ Aucune donnée disponible pour {ref_table}")
                 
-                # Charger les options
-                options = get_selector_options(ref_table)
-                if options:
-                    options_dict = {opt[ref_id]: ref_label(opt) for opt in options}
-                    selected_id = st.selectbox(
-                        f"{field_info['label']}" + (" *" if field_info.get("required") else ""),
-                        list(options_dict.keys()),
-                        format_func=lambda x: options_dict[x],
-                        key=f"create_{field_name}"
-                    )
+                if selected_id is not None:
                     form_data[field_name] = selected_id
                 else:
-                    st.warning(f"⚠️ Aucune donnée disponible pour {ref_table}")
+                    # Fallback: input numérique normal
                     form_data[field_name] = st.number_input(
                         f"{field_info['label']}" + (" *" if field_info.get("required") else ""),
                         value=0,
                         min_value=0,
                         step=1,
-                        key=f"create_{field_name}"
+                        key=f"create_{field_name}_number"
                     )
             
             # Sélecteurs pour type et classification dans events
@@ -2312,6 +2070,7 @@ elif page == "✏️ Gestion des données":
                     create_response = requests.post(
                         f"{BASE_URL}/{selected_table}/",
                         json=form_data,
+                        headers=api_headers(),
                         timeout=5
                     )
                     if create_response.status_code == 201:
@@ -2335,6 +2094,7 @@ elif page == "✏️ Gestion des données":
                         
                         # Invalider le cache
                         st.cache_data.clear()
+                        get_data_store().invalidate(create_response.headers.get("X-Write-LSN"))
                     else:
                         st.error(f"❌ Erreur: {create_response.status_code} - {create_response.text}")
                 except Exception as e:
@@ -0,0 +1,519 @@
+"""
+Magasin de données partagé du dashboard.
+
+Une seule instance par processus Streamlit (créée via st.cache_resource) et
+partagée en lecture seule par toutes les sessions: les DataFrames sont
+typés (dates parsées, catégories pour type / classification / unité) et déjà
+enrichis avec les noms des unités et des personnes. Un rerun de page ne fait
+que récupérer des références, sans pickle ni reconstruction.
+
+Rafraîchissement incrémental:
+- si l'API expose le flux des modifications (/changes/{table}), le store ne
+  récupère toutes les DASHBOARD_SYNC_SECONDS que les lignes modifiées depuis
+  la dernière séquence vue, plus les IDs supprimés; un rechargement complet
+  de réconciliation a lieu toutes les DASHBOARD_FULL_RELOAD_SECONDS;
+- sinon chaque table est rechargée après DASHBOARD_REFRESH_SECONDS.
+Une table n'est reconstruite (ainsi que celles qui en dépendent) que si son
+contenu a changé.
+
+Les tables échues sont chargées en parallèle (une tâche par table) sur une
+session HTTP keep-alive partagée (pool de connexions, réponses gzip): un
+chargement à froid dure le temps de la table la plus lente.
+
+La page "Événements récents" ne charge pas la table: elle demande à l'API
+une page déjà triée / filtrée / enrichie (/events/page). Les pages sont
+gardées DASHBOARD_EVENT_PAGE_SECONDS et la suivante est préchargée en
+arrière-plan pendant l'affichage.
+
+Les cartes KPI, graphiques de répartition et courbes de tendance lisent les
+agrégats calculés par l'API (/kpi/*, /timeseries/events), gardés
+DASHBOARD_KPI_SECONDS. Le créateur de graphiques envoie une spécification de
+requête à l'API (/charts/query) et ne reçoit que les données agrégées. Les
+sélecteurs des formulaires utilisent /lookups (recherche + IDs précis).
+
+IMPORTANT: les DataFrames sont partagés entre sessions, les pages doivent
+faire un .copy() avant toute modification.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+# Durée de validité d'une table avant rechargement depuis l'API
+REFRESH_SECONDS = int(os.environ.get("DASHBOARD_REFRESH_SECONDS", "120"))
+# Avec le flux des modifications: synchronisation fréquente + réconciliation complète rare
+SYNC_SECONDS = int(os.environ.get("DASHBOARD_SYNC_SECONDS", "5"))
+FULL_RELOAD_SECONDS = int(os.environ.get("DASHBOARD_FULL_RELOAD_SECONDS", "3600"))
+PAGE_SIZE = 1000
+# Connexions HTTP gardées ouvertes vers l'API (une par table chargée en parallèle)
+HTTP_POOL_SIZE = int(os.environ.get("DASHBOARD_HTTP_POOL_SIZE", "8"))
+
+# En-têtes de la session Streamlit à l'origine des appels (page du dashboard, voir use_headers):
+# le magasin est partagé, l'en-tête est donc propre au contexte appelant et non au magasin
+_request_headers: contextvars.ContextVar = contextvars.ContextVar("dashboard_request_headers", default={})
+
+# Pages d'événements (/events/page): durée de validité et nombre de pages gardées
+EVENT_PAGE_SECONDS = int(os.environ.get("DASHBOARD_EVENT_PAGE_SECONDS", "30"))
+EVENT_PAGE_CACHE_SIZE = 64
+# Indicateurs pré-agrégés (/kpi/*): durée de validité
+KPI_SECONDS = int(os.environ.get("DASHBOARD_KPI_SECONDS", "15"))
+
+# Configuration des tables: endpoint, clé, colonnes dates et catégorielles
+TABLES = {
+    'units': {'endpoint': "/units/", 'key': 'unit_id', 'dates': [], 'categories': ['location']},
+    'persons': {'endpoint': "/persons/", 'key': 'person_id', 'dates': [], 'categories': ['role']},
+    'risks': {'endpoint': "/risks/", 'key': 'risk_id', 'dates': [], 'categories': ['gravity', 'probability']},
+    'events': {'endpoint': "/events/", 'key': 'event_id',
+               'dates': ['start_datetime', 'end_datetime'], 'categories': ['type', 'classification']},
+    'measures': {'endpoint': "/measures/", 'key': 'measure_id', 'dates': ['implementation_date'], 'categories': []},
+}
+
+# Tables enrichies avec les noms d'autres tables (à reconstruire si celles-ci changent)
+DEPENDENCIES = {
+    'events': ['units', 'persons'],
+    'measures': ['units', 'persons'],
+}
+
+
+def create_api_session(pool_size: int = HTTP_POOL_SIZE) -> requests.Session:
+    """Session HTTP keep-alive avec pool de connexions (réutilisable entre threads)."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip"})
+    return session
+
+
+def lookup_names(ids: pd.Series, names: pd.Series, prefix: str, missing: Optional[str]) -> pd.Series:
+    """
+    Remplace des IDs par des noms (vectorisé, sans lambda par ligne).
+
+    Args:
+        ids: Série d'IDs (peut contenir des NaN)
+        names: Série de noms indexée par ID
+        prefix: Libellé par défaut pour un ID inconnu ("Unit" → "Unit 12")
+        missing: Valeur pour un ID manquant
+    """
+    result = ids.map(names).astype(object)
+    unknown = result.isna() & ids.notna()
+    if unknown.any():
+        result[unknown] = prefix + " " + ids[unknown].astype("Int64").astype(str)
+    if missing is not None:
+        result = result.fillna(missing)
+    return result
+
+
+def enrich_names(df: pd.DataFrame, units: pd.Series, persons: pd.Series) -> pd.DataFrame:
+    """
+    Ajoute unit_name / declared_by_name / owner_name à partir des colonnes d'IDs
+    présentes (jointure vectorisée sur des Séries indexées par ID).
+
+    Le DataFrame est modifié: passer une copie pour un frame partagé.
+    """
+    if 'organizational_unit_id' in df.columns:
+        df['unit_name'] = lookup_names(df['organizational_unit_id'], units, "Unit", "Non spécifié").astype('category')
+    if 'declared_by_id' in df.columns:
+        df['declared_by_name'] = lookup_names(df['declared_by_id'], persons, "Person", None)
+    if 'owner_id' in df.columns:
+        df['owner_name'] = lookup_names(df['owner_id'], persons, "Person", None)
+    return df
+
+
+class DashboardDataStore:
+    """DataFrames typés et enrichis, partagés par toutes les sessions du processus."""
+
+    def __init__(self, base_url: str, refresh_seconds: int = REFRESH_SECONDS):
+        self.base_url = base_url
+        self.refresh_seconds = refresh_seconds
+        self.session = create_api_session()
+        self.version = 0
+        self._raw: Dict[str, pd.DataFrame] = {}
+        self._fingerprints: Dict[str, str] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._full_at: Dict[str, float] = {}
+        # Dernière séquence du journal vue par table (flux des modifications)
+        self._seq: Dict[str, int] = {}
+        self._feed_supported = True
+        self._frames: Dict[str, pd.DataFrame] = {}
+        self._lock = threading.Lock()
+        # (page, taille, type) → (date, Future): une page préchargée est partagée par toutes les sessions
+        self._event_pages: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._pages_lock = threading.Lock()
+        self._prefetcher = ThreadPoolExecutor(max_workers=2)
+        # (chemin, paramètres) → (date, réponse JSON) des agrégats /kpi/... et /timeseries/...
+        self._kpis: Dict[tuple, tuple] = {}
+        # Position WAL de la dernière écriture du dashboard (lectures: réplica seulement s'il l'a rejouée)
+        self.min_lsn: Optional[str] = None
+
+    @staticmethod
+    def use_headers(headers: Dict[str, str]):
+        """En-têtes ajoutés aux appels faits depuis le contexte courant (à chaque exécution du script)."""
+        _request_headers.set(dict(headers))
+
+    @staticmethod
+    def _submit(executor: ThreadPoolExecutor, fn, *args) -> Future:
+        """Soumet une tâche en lui transmettant les en-têtes du contexte appelant."""
+        return executor.submit(contextvars.copy_context().run, fn, *args)
+
+    def _headers(self) -> Dict[str, str]:
+        headers = _request_headers.get()
+        if self.min_lsn:
+            headers = {**headers, "X-Min-LSN": self.min_lsn}
+        return headers
+
+    # --- Chargement ---
+    def fetch_table(self, table: str) -> List[dict]:
+        """Récupère toutes les lignes d'une table via l'API (pagination skip/limit)."""
+        url = f"{self.base_url}{TABLES[table]['endpoint']}"
+        items = []
+        skip = 0
+        while True:
+            response = self.session.get(url, params={"skip": skip, "limit": PAGE_SIZE},
+                                        headers=self._headers(), timeout=10)
+            response.raise_for_status()
+            page = response.json()
+            items.extend(page)
+            if len(page) < PAGE_SIZE:
+                return items
+            skip += PAGE_SIZE
+
+    def fetch_sequence(self) -> Optional[int]:
+        """Séquence courante du journal des modifications (None si l'API ne l'expose pas)."""
+        if not self._feed_supported:
+            return None
+        response = self.session.get(f"{self.base_url}/changes/", headers=self._headers(), timeout=5)
+        if response.status_code == 404:
+            self._feed_supported = False
+            return None
+        response.raise_for_status()
+        return response.json()['last_seq']
+
+    def fetch_changes(self, table: str, since: int) -> dict:
+        """Lignes modifiées et IDs supprimés depuis la séquence `since`."""
+        response = self.session.get(f"{self.base_url}/changes/{table}", params={"since": since},
+                                    headers=self._headers(), timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+    def fetch_event_page(self, page: int, size: int, event_type: Optional[str]) -> dict:
+        """Page d'événements triée / filtrée / enrichie par l'API (dates parsées)."""
+        params = {"page": page, "size": size}
+        if event_type:
+            params["type"] = event_type
+        response = self.session.get(f"{self.base_url}/events/page", params=params,
+                                    headers=self._headers(), timeout=10)
+        response.raise_for_status()
+        result = response.json()
+        items = pd.DataFrame(result['items'])
+        for col in TABLES['events']['dates']:
+            if col in items.columns:
+                items[col] = pd.to_datetime(items[col], errors='coerce')
+        result['items'] = items
+        return result
+
+    def _event_page_future(self, page: int, size: int, event_type: Optional[str], background: bool):
+        """Future de la page en cache (encore valide) ou nouvelle requête."""
+        key = (page, size, event_type)
+        with self._pages_lock:
+            entry = self._event_pages.get(key)
+            if entry is not None:
+                created_at, future = entry
+                failed = future.done() and future.exception() is not None
+                if time.time() - created_at < EVENT_PAGE_SECONDS and not failed:
+                    self._event_pages.move_to_end(key)
+                    return future
+            if background:
+                future = self._submit(self._prefetcher, self.fetch_event_page, page, size, event_type)
+            else:
+                future = Future()
+            self._event_pages[key] = (time.time(), future)
+            while len(self._event_pages) > EVENT_PAGE_CACHE_SIZE:
+                self._event_pages.popitem(last=False)
+
+        # Requête directe hors verrou: les autres sessions attendent le même Future
+        if not background:
+            try:
+                future.set_result(self.fetch_event_page(page, size, event_type))
+            except Exception as e:
+                future.set_exception(e)
+        return future
+
+    @staticmethod
+    def _categorize(table: str, df: pd.DataFrame) -> pd.DataFrame:
+        """Colonnes catégorielles (catégories recalculées sur les données courantes)."""
+        for col in TABLES[table]['categories']:
+            if col in df.columns:
+                df[col] = df[col].astype(object).astype('category')
+        return df
+
+    @staticmethod
+    def _typed(table: str, rows: List[dict]) -> pd.DataFrame:
+        """Construit un DataFrame typé (dates parsées, colonnes catégorielles)."""
+        if not rows:
+            return pd.DataFrame()
+        df = pd.DataFrame(rows)
+        config = TABLES[table]
+        for col in config['dates']:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col], errors='coerce')
+        return DashboardDataStore._categorize(table, df)
+
+    def _apply_changes(self, table: str, feed: dict) -> pd.DataFrame:
+        """Applique upserts et suppressions du flux à la table brute."""
+        key = TABLES[table]['key']
+        df = self._raw.get(table, pd.DataFrame())
+        upserts = self._typed(table, feed['upserts'])
+
+        removed = set(feed['deletes'])
+        if not upserts.empty:
+            removed |= set(upserts[key])
+        if not df.empty:
+            df = df[~df[key].isin(removed)]
+
+        if upserts.empty:
+            return df.reset_index(drop=True)
+        combined = pd.concat([df, upserts], ignore_index=True) if not df.empty else upserts
+        return self._categorize(table, combined).sort_values(key, ignore_index=True)
+
+    def _sync_table(self, table: str, force: bool) -> bool:
+        """
+        Met à jour une table: incrémental via le flux si possible, sinon complet.
+
+        Returns:
+            True si la table a changé
+        """
+        now = time.time()
+        self._loaded_at[table] = now
+
+        incremental = (not force and self._feed_supported and table in self._seq
+                       and now - self._full_at.get(table, 0) < FULL_RELOAD_SECONDS)
+        if incremental:
+            feed = self.fetch_changes(table, self._seq[table])
+            if not feed['reset']:
+                self._seq[table] = feed['last_seq']
+                if not feed['upserts'] and not feed['deletes']:
+                    return False
+                self._raw[table] = self._apply_changes(table, feed)
+                self._fingerprints.pop(table, None)
+                return True
+
+        # Chargement complet: séquence lue AVANT les lignes (aucune modification perdue)
+        seq = self.fetch_sequence()
+        rows = self.fetch_table(table)
+        self._full_at[table] = now
+        if seq is not None:
+            self._seq[table] = seq
+
+        fingerprint = hashlib.md5(json.dumps(rows, sort_keys=True, default=str).encode()).hexdigest()
+        if fingerprint == self._fingerprints.get(table):
+            return False
+        self._fingerprints[table] = fingerprint
+        self._raw[table] = self._typed(table, rows)
+        return True
+
+    def _is_due(self, table: str, now: float, force: bool) -> bool:
+        """La table doit-elle être synchronisée ?"""
+        if force:
+            return True
+        interval = SYNC_SECONDS if self._feed_supported and table in self._seq else self.refresh_seconds
+        return now - self._loaded_at.get(table, 0) > interval
+
+    def _names(self, table: str) -> pd.Series:
+        """Noms lisibles indexés par ID (unités et personnes)."""
+        df = self._raw.get(table)
+        if df is None or df.empty:
+            return pd.Series(dtype=object)
+        if table == 'units':
+            return df.set_index('unit_id')['name']
+        full_names = (df['name'].fillna('') + " " + df['family_name'].fillna('')).str.strip()
+        full_names = full_names.mask(full_names == "", "Person " + df['person_id'].astype(str))
+        return pd.Series(full_names.values, index=df['person_id'])
+
+    def _build(self, table: str) -> pd.DataFrame:
+        """Frame final: typé + noms des unités / personnes."""
+        df = self._raw[table]
+        if df.empty or table not in DEPENDENCIES:
+            return df
+
+        return enrich_names(df.copy(), self._names('units'), self._names('persons'))
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Synchronise les tables échues et ne reconstruit que celles qui ont changé.
+        Si un autre thread rafraîchit déjà, retourne immédiatement (données courantes).
+
+        Returns:
+            True si au moins une table a changé
+        """
+        if not any(self._is_due(t, time.time(), force) for t in TABLES):
+            return False
+
+        # Premier chargement: on attend; sinon on ne bloque pas les autres sessions
+        if not self._lock.acquire(blocking=not self._frames):
+            return False
+        try:
+            # Un autre thread a pu terminer le chargement pendant l'attente
+            now = time.time()
+            due = [t for t in TABLES if self._is_due(t, now, force)]
+            # Les tables échues sont chargées en parallèle (chacune touche ses propres clés)
+            with ThreadPoolExecutor(max_workers=max(1, len(due))) as pool:
+                results = {table: self._submit(pool, self._sync_table, table, force) for table in due}
+
+            changed = set()
+            for table, future in results.items():
+                try:
+                    if future.result():
+                        changed.add(table)
+                except Exception as e:
+                    # API indisponible: on garde les données actuelles et on réessaiera plus tard
+                    print(f"⚠️ Chargement de {table} impossible: {str(e)}")
+                    if table not in self._raw:
+                        self._raw[table] = pd.DataFrame()
+                        changed.add(table)
+
+            if not changed:
+                return False
+
+            to_build = set(changed)
+            for table, deps in DEPENDENCIES.items():
+                if changed & set(deps):
+                    to_build.add(table)
+
+            frames = dict(self._frames)
+            for table in TABLES:
+                if table in to_build:
+                    frames[table] = self._build(table)
+            # Remplacement atomique: les sessions en cours gardent l'ancienne version
+            self._frames = frames
+            self.version += 1
+            return True
+        finally:
+            self._lock.release()
+
+    def invalidate(self, write_lsn: Optional[str] = None):
+        """
+        Synchronise toutes les tables au prochain accès (après une écriture via l'API).
+        `write_lsn` (en-tête X-Write-LSN de la réponse) garantit de relire cette écriture.
+        """
+        if write_lsn:
+            self.min_lsn = write_lsn
+        self._loaded_at = {}
+        with self._pages_lock:
+            self._event_pages.clear()
+        self._kpis = {}
+
+    # --- Lecture ---
+    def frames(self) -> Dict[str, pd.DataFrame]:
+        """Retourne les DataFrames courants (à ne pas modifier en place)."""
+        self.refresh()
+        return dict(self._frames)
+
+    def event_page(self, page: int, size: int, event_type: Optional[str] = None) -> dict:
+        """
+        Page d'événements (plus récents d'abord): depuis le cache, en attendant un
+        préchargement en cours, ou depuis l'API.
+
+        Returns:
+            dict avec 'total', 'page' (éventuellement ramenée à la dernière page),
+            'size' et 'items' (DataFrame, à ne pas modifier en place)
+        """
+        return self._event_page_future(page, size, event_type, background=False).result()
+
+    def prefetch_event_page(self, page: int, size: int, event_type: Optional[str] = None):
+        """Précharge une page en arrière-plan (sans effet si elle est déjà en cache)."""
+        self._event_page_future(page, size, event_type, background=True)
+
+    def _cached_json(self, path: str, params: Optional[dict] = None):
+        """GET d'un agrégat de l'API gardé KPI_SECONDS (None si indisponible)."""
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        key = (path, tuple(sorted(params.items())))
+        cached = self._kpis.get(key)
+        if cached is not None and time.time() - cached[0] < KPI_SECONDS:
+            return cached[1]
+        try:
+            response = self.session.get(f"{self.base_url}{path}", params=params,
+                                        headers=self._headers(), timeout=5)
+            response.raise_for_status()
+            value = response.json()
+        except Exception as e:
+            print(f"⚠️ Agrégat {path} indisponible: {str(e)}")
+            return None
+        self._kpis[key] = (time.time(), value)
+        return value
+
+    def kpi(self, path: str, **params):
+        """
+        Indicateur pré-agrégé de l'API (ex. "summary", "events/unit").
+
+        Returns:
+            Réponse JSON, ou None si l'API ne l'expose pas ou est indisponible
+        """
+        return self._cached_json(f"/kpi/{path}", params)
+
+    def event_series(self, bucket: str, **filters) -> Optional[pd.DataFrame]:
+        """
+        Nombre d'événements par intervalle (day, week, month, quarter, weekday),
+        calculé par l'API. Filtres: unit_id, type, classification, start, end.
+
+        Returns:
+            DataFrame (period, count), ou None si l'API est indisponible
+        """
+        series = self._cached_json("/timeseries/events", {"bucket": bucket, **filters})
+        if series is None:
+            return None
+        return pd.DataFrame(series['points'], columns=['period', 'count'])
+
+    def chart_columns(self, source: str) -> Optional[dict]:
+        """Colonnes d'une table pour le créateur de graphiques (nature, valeurs distinctes)."""
+        return self._cached_json(f"/charts/{source}/columns")
+
+    def chart_query(self, spec: dict, dates: Optional[List[str]] = None):
+        """
+        Données d'un graphique agrégées par l'API (spécification: voir chart_queries.py).
+
+        Returns:
+            (DataFrame, True si le résultat a été tronqué par la limite)
+        """
+        response = self.session.post(f"{self.base_url}/charts/query", json=spec,
+                                     headers=self._headers(), timeout=30)
+        if response.status_code == 400:
+            raise ValueError(response.json().get('detail', response.text))
+        response.raise_for_status()
+        result = response.json()
+        df = pd.DataFrame(result['rows'], columns=result['columns'])
+        for col in dates or []:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col], errors='coerce')
+        return df, result['truncated']
+
+    def lookup(self, table: str, q: Optional[str] = None, ids: Optional[List[int]] = None,
+               limit: int = 50) -> Optional[List[dict]]:
+        """
+        Paires id → libellé pour un sélecteur (recherche `q`, IDs `ids` toujours inclus).
+
+        Returns:
+            [{id, label}], ou None si l'API est indisponible
+        """
+        ids_param = ",".join(str(int(i)) for i in ids if i is not None) if ids else None
+        return self._cached_json(f"/lookups/{table}", {"q": q or None, "ids": ids_param or None, "limit": limit})
+
+    def lookup_values(self, table: str, column: str) -> List[str]:
+        """Valeurs distinctes d'une colonne catégorielle (liste vide si indisponible)."""
+        return self._cached_json(f"/lookups/{table}/{column}/values") or []
+
+    def units_map(self) -> Dict[int, str]:
+        return self._names('units').to_dict()
+
+    def persons_map(self) -> Dict[int, str]:
+        return self._names('persons').to_dict()